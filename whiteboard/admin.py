@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import CustomUser, Division, Hospital
+from .models import ApiToken, CustomUser, Division, Hospital
 
 class CustomUserAdmin(BaseUserAdmin):
     list_display = ('email', 'role', 'is_active', 'is_staff')
@@ -29,6 +29,20 @@ class DivisionAdmin(admin.ModelAdmin):
 class HospitalAdmin(admin.ModelAdmin):
     list_display = ('name', 'division')
     list_filter = ('division',)
+    list_select_related = ('division',)
     search_fields = ('name',)
 
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ('name', 'user', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    list_select_related = ('user',)
+    search_fields = ('name', 'user__email')
+    fields = ('name', 'user', 'is_active', 'created_at')
+    readonly_fields = ('user', 'created_at')
+
+    def has_add_permission(self, request):
+        # The token is only shown when it is made, so tokens come from `manage.py create_api_token`
+        return False
+
 admin.site.register(CustomUser, CustomUserAdmin)
\ No newline at end of file
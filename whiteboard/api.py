@@ -0,0 +1,218 @@
+"""Read-only JSON API for wall displays, the scheduling system and other machine clients.
+
+Clients send `Authorization: Bearer <token>` with a token from
+`manage.py create_api_token`; there is no session or hospital selection
+flow. Board responses carry an ETag and, when every room has a version, a
+Last-Modified, so polling clients can send If-None-Match/If-Modified-Since
+and get an empty 304 while the board is unchanged. Clients that keep their
+own copy can instead ask for the rooms changed since the last sequence
+they saw.
+"""
+import hashlib
+import json
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+
+from .hierarchy import get_hierarchy
+from .instrumentation import phase
+from .models import ApiToken
+from .rooms import changed_since, hospital_rooms, sequenced_hospital_rooms
+from .staff import resolve_staff
+
+logger = logging.getLogger(__name__)
+
+# Fields a board room can have in API responses, in the order they are returned
+BOARD_FIELDS = ['room', 'provider', 'surgeon', 'staff_id', 'staff_name', 'staff_role', 'version', 'sequence']
+# Fields looked up in the staff table rather than read from the room
+STAFF_FIELDS = {'staff_name', 'staff_role'}
+
+
+def api_error(status, message):
+    return JsonResponse({'error': message}, status=status)
+
+
+def token_for_key(key):
+    """The active ApiToken with this key (of an active user), or None."""
+    if not key:
+        return None
+    try:
+        return ApiToken.objects.select_related('user').get(
+            key_hash=ApiToken.hash_key(key), is_active=True, user__is_active=True,
+        )
+    except ApiToken.DoesNotExist:
+        return None
+
+
+def authenticate_token(request):
+    """The active ApiToken in the request's Authorization header, or None."""
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() not in ('bearer', 'token'):
+        return None
+    return token_for_key(key.strip())
+
+
+def api_token_required(view):
+    """Let a request through only with a valid bearer token; `request.user` becomes the token's user."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = authenticate_token(request)
+        if token is None:
+            response = api_error(401, "A valid API token is required.")
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        request.api_token = token
+        request.user = token.user
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def parse_fields(value):
+    """The BOARD_FIELDS a `fields=` parameter asks for (all of them when it is empty)."""
+    if not value:
+        return list(BOARD_FIELDS)
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(BOARD_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Choose from {', '.join(BOARD_FIELDS)}.")
+    # 'room' identifies each entry, so it always comes back
+    return [field for field in BOARD_FIELDS if field in requested or field == 'room']
+
+
+def room_attributes(fields, *extra):
+    """The room attributes to read from DynamoDB for `fields`, plus `extra` ones the view needs itself."""
+    attributes = {field for field in fields if field not in STAFF_FIELDS}.union(extra)
+    if STAFF_FIELDS.intersection(fields):
+        attributes.add('staff_id')
+    return [attribute for attribute in BOARD_FIELDS if attribute in attributes]
+
+
+def board_request(request, hospital_id):
+    """(hospital, fields, error response) for a board request; the error is None when it's fine."""
+    hospital = get_hierarchy(request.user).hospital(hospital_id)
+    if hospital is None:
+        return None, None, api_error(404, "No such hospital, or the token can't see it.")
+    try:
+        return hospital, parse_fields(request.GET.get('fields')), None
+    except ValueError as e:
+        return None, None, api_error(400, str(e))
+
+
+def api_rooms(items, fields):
+    """API entries for room items, in room order, with staff looked up only if `fields` needs them."""
+    staff_dict = resolve_staff(item.get('staff_id') for item in items) if STAFF_FIELDS.intersection(fields) else {}
+    return [api_room(item, fields, staff_dict) for item in sorted(items, key=lambda item: item['room'])]
+
+
+def api_room(item, fields, staff_dict):
+    staff = staff_dict.get(item.get('staff_id'), {})
+    values = {
+        'room': item['room'],
+        'provider': item.get('provider', ''),
+        'surgeon': item.get('surgeon', ''),
+        'staff_id': item.get('staff_id', ''),
+        'staff_name': staff.get('name', ''),
+        'staff_role': staff.get('role', ''),
+        # Rooms saved before versions and sequences existed have none
+        'version': int(item['version']) if item.get('version') is not None else None,
+        'sequence': int(item['sequence']) if item.get('sequence') is not None else None,
+    }
+    return {field: values[field] for field in fields}
+
+
+@require_GET
+@api_token_required
+def hospital_board(request, hospital_id):
+    """One hospital's board as JSON: `{"hospital": {...}, "rooms": [...]}`.
+
+    `fields=room,staff_name` trims each room to those fields, and only the
+    attributes they need are read from DynamoDB. Last-Modified comes from the
+    newest room version, so it has one-second resolution; clients that poll
+    faster than that should use the ETag.
+    """
+    hospital, fields, error = board_request(request, hospital_id)
+    if error is not None:
+        return error
+
+    try:
+        # The version also drives Last-Modified
+        items = hospital_rooms(hospital.id, room_attributes(fields, 'version'))
+        rooms = api_rooms(items, fields)
+    except Exception as e:
+        logger.error("Error fetching board for the API: %s", e, extra={'hospital_id': hospital.id})
+        return api_error(503, "The board could not be read. Try again shortly.")
+
+    with phase('render'):
+        content = json.dumps(
+            {'hospital': {'id': hospital.id, 'name': hospital.name}, 'rooms': rooms},
+            separators=(',', ':'),
+        )
+    etag = f'"{hashlib.sha1(content.encode("utf-8")).hexdigest()}"'
+    versions = [item.get('version') for item in items]
+    # Versions are microseconds since the epoch
+    last_modified = int(max(versions)) // 1_000_000 if versions and None not in versions else None
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is None:
+        response = HttpResponse(content, content_type='application/json')
+    else:
+        response = not_modified
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    logger.info("Served board over the API", extra={
+        'hospital_id': hospital.id, 'token': request.api_token.name, 'rooms': len(rooms),
+        'status': response.status_code,
+    })
+    return response
+
+
+@require_GET
+@api_token_required
+def hospital_board_changes(request, hospital_id):
+    """The rooms of a hospital's board changed after `since=<sequence>`.
+
+    Answers `{"hospital": {...}, "sequence": N, "snapshot": false, "rooms": [...]}`
+    with just the changed rooms; the client then asks again with since=N.
+    When the client is too far behind (DELTA_SYNC_MAX_GAP) or a delta can't
+    be worked out, `snapshot` is true and `rooms` is the whole board, which
+    replaces the client's copy. `fields=` works as for the board.
+    """
+    try:
+        since = int(request.GET['since'])
+        if since < 0:
+            raise ValueError
+    except (KeyError, ValueError):
+        return api_error(400, "Pass since=<sequence>, 0 or more; use 0 for the whole board.")
+    hospital, fields, error = board_request(request, hospital_id)
+    if error is not None:
+        return error
+
+    try:
+        sequence, items = sequenced_hospital_rooms(hospital.id, room_attributes(fields, 'sequence'))
+        changed = changed_since(items, sequence, since, settings.DELTA_SYNC_MAX_GAP)
+        rooms = api_rooms(items if changed is None else changed, fields)
+    except Exception as e:
+        logger.error("Error fetching board changes for the API: %s", e, extra={'hospital_id': hospital.id})
+        return api_error(503, "The board could not be read. Try again shortly.")
+
+    response = JsonResponse({
+        'hospital': {'id': hospital.id, 'name': hospital.name},
+        'sequence': sequence,
+        'snapshot': changed is None,
+        'rooms': rooms,
+    })
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    logger.info("Served board changes over the API", extra={
+        'hospital_id': hospital.id, 'token': request.api_token.name, 'since': since, 'sequence': sequence,
+        'snapshot': changed is None, 'rooms': len(rooms),
+    })
+    return response
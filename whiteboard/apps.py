@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class WhiteboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'whiteboard'
+
+    def ready(self):
+        # Connects the signals that keep cached division/hospital trees current,
+        # and registers the checks on the settings they rely on
+        from . import checks, hierarchy  # noqa: F401
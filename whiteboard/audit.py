@@ -0,0 +1,219 @@
+"""Write-behind queue for RoomAssignments audit records.
+
+Saving a room only waits for the Whiteboard write. The assignment record is
+queued here and a worker thread writes queued records in BatchWriteItem calls.
+Records that can't be queued or written, and whatever is still queued at
+shutdown, are appended to a local spill file that is replayed when the next
+writer starts, along with any replay a crashed process left unfinished.
+Records that made it into DynamoDB are then folded into the daily
+utilization rollups.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .dynamo import BATCH_WRITE_LIMIT, batch_write
+from .rollups import apply_assignments
+
+logger = logging.getLogger(__name__)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists, it just isn't ours
+        return True
+    return True
+
+
+class AssignmentWriter:
+
+    def __init__(self, spill_path, max_queue=1000, flush_interval=1.0):
+        self.spill_path = Path(spill_path)
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread, which first replays anything spilled by an earlier process."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='assignment-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def submit(self, item):
+        """Queue one RoomAssignments item without waiting on DynamoDB."""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.warning("Assignment queue full, spilling record to disk")
+            self.spill([item])
+
+    def spill(self, items):
+        """Append items to the spill file, one JSON object per line."""
+        if not items:
+            return
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        lines = ''.join(json.dumps(item, default=str) + '\n' for item in items)
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as spill_file:
+                spill_file.write(lines)
+                spill_file.flush()
+                os.fsync(spill_file.fileno())
+
+    def _replay_path(self):
+        # The pid says whose replay it is; the suffix keeps one process's replays apart
+        return self.spill_path.with_name(f"{self.spill_path.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.replay")
+
+    def _abandoned_replays(self):
+        """Replay files whose process died before finishing them."""
+        prefix = f"{self.spill_path.name}."
+        for path in self.spill_path.parent.glob(f"{prefix}*.replay"):
+            pid = path.name[len(prefix):-len('.replay')].split('-', 1)[0]
+            if pid.isdigit() and int(pid) != os.getpid() and not _process_alive(int(pid)):
+                yield path
+
+    def _claim_spills(self):
+        """Rename the spill file and abandoned replays to replay files of this process.
+
+        Renaming means only one worker process picks up a given file.
+        """
+        claimed = []
+        for path in [self.spill_path, *self._abandoned_replays()]:
+            replaying = self._replay_path()
+            try:
+                with self._spill_lock:
+                    os.replace(path, replaying)
+            except FileNotFoundError:
+                # Nothing spilled, or another process claimed it first
+                continue
+            claimed.append(replaying)
+        return claimed
+
+    def replay(self):
+        """Write records left in spill files by an earlier process or a full queue.
+
+        Each replay file is cut down to the records not yet written after every
+        batch and removed only once all of them are in DynamoDB or back in the
+        spill file, so a process that dies mid-replay leaves the rest to the
+        next start.
+        """
+        batch_size = BATCH_WRITE_LIMIT * settings.DYNAMODB_BATCH_WORKERS
+        for replaying in self._claim_spills():
+            with open(replaying, encoding='utf-8') as spill_file:
+                items = [json.loads(line) for line in spill_file if line.strip()]
+            logger.info("Replaying %d spilled assignment records", len(items))
+            for start in range(batch_size, len(items) + batch_size, batch_size):
+                self._write(items[start - batch_size:start])
+                remaining = items[start:]
+                if remaining:
+                    partial = replaying.with_name(replaying.name + '.tmp')
+                    with open(partial, 'w', encoding='utf-8') as spill_file:
+                        spill_file.write(''.join(json.dumps(item, default=str) + '\n' for item in remaining))
+                    os.replace(partial, replaying)
+            replaying.unlink()
+
+    def _write(self, items):
+        try:
+            unprocessed = batch_write(
+                (settings.ROOM_ASSIGNMENTS_TABLE, {'PutRequest': {'Item': item}}) for item in items
+            )
+            failed = [request['PutRequest']['Item'] for _, request in unprocessed]
+        except Exception as e:
+            logger.error("Error writing %d assignment records: %s", len(items), e)
+            failed = items
+        self.spill(failed)
+        # Spilled records get rolled up when a replay writes them, so only count what landed
+        failed_ids = {item.get('assignment_id') for item in failed}
+        written = [item for item in items if item.get('assignment_id') not in failed_ids]
+        if written:
+            try:
+                apply_assignments(written)
+            except Exception:
+                # They are stored; backfill_rollups can count them later, so don't spill them again
+                logger.exception("Error rolling up %d assignment records", len(written))
+
+    def _run(self):
+        try:
+            self.replay()
+        except Exception as e:
+            # Whatever wasn't written is still on disk for the next start
+            logger.error("Error replaying spilled assignment records: %s", e)
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Give a burst of saves a moment to land in the same batch
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < BATCH_WRITE_LIMIT * settings.DYNAMODB_BATCH_WORKERS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                # Keep the thread alive, or every later record would sit in the queue until it spilled
+                logger.exception("Error writing %d assignment records, spilling them", len(batch))
+                try:
+                    self.spill(batch)
+                except Exception:
+                    logger.exception("Could not spill %d assignment records, they are lost", len(batch))
+
+    def shutdown(self):
+        """Stop the worker and spill whatever is still queued so the next start can replay it."""
+        self._stopping.set()
+        if self._thread is not None:
+            # Long enough for an in-flight batch to finish its retries
+            self._thread.join(timeout=10)
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self.spill(leftover)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_assignment_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AssignmentWriter(
+                    settings.ASSIGNMENT_SPILL_PATH,
+                    max_queue=settings.ASSIGNMENT_QUEUE_SIZE,
+                    flush_interval=settings.ASSIGNMENT_FLUSH_INTERVAL,
+                )
+    return _writer
+
+
+def record_assignment(item):
+    """Queue a RoomAssignments item for the background writer."""
+    get_assignment_writer().submit(item)
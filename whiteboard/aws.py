@@ -0,0 +1,109 @@
+import threading
+from contextlib import contextmanager
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+from .instrumentation import register_aws_timing
+
+# boto3 clients are thread-safe, so one per service is shared by the whole process.
+# Resources are not, so each thread keeps its own for as long as the thread lives.
+_clients = {}
+_clients_lock = threading.Lock()
+_local = threading.local()
+_session = None
+# Endpoints set by using_endpoint(), ahead of AWS_ENDPOINT_URLS
+_endpoint_overrides = {}
+
+
+def client_config():
+    """botocore Config built from the AWS_* connection settings."""
+    return Config(
+        region_name=settings.AWS_REGION,
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=settings.AWS_TCP_KEEPALIVE,
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_READ_TIMEOUT,
+        retries={'mode': settings.AWS_RETRY_MODE, 'max_attempts': settings.AWS_MAX_ATTEMPTS},
+    )
+
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session(
+            region_name=settings.AWS_REGION,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        )
+        # Clients inherit the session's handlers, so every AWS call shows up in Server-Timing
+        register_aws_timing(_session.events)
+    return _session
+
+
+def _endpoint_url(service_name):
+    if service_name in _endpoint_overrides:
+        return _endpoint_overrides[service_name] or None
+    return settings.AWS_ENDPOINT_URLS.get(service_name) or None
+
+
+@contextmanager
+def using_endpoint(service_name, endpoint_url):
+    """Send `service_name` calls to `endpoint_url` (blank for AWS itself) inside the block.
+
+    Clients are rebuilt on the way in and out; threads started inside the
+    block build their resources against the endpoint too.
+    """
+    previous = _endpoint_overrides.copy()
+    _endpoint_overrides[service_name] = endpoint_url
+    reset()
+    try:
+        yield
+    finally:
+        _endpoint_overrides.clear()
+        _endpoint_overrides.update(previous)
+        reset()
+
+
+def get_client(service_name):
+    """Return the process-wide client for `service_name`, creating it on first use."""
+    client = _clients.get(service_name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(service_name)
+            if client is None:
+                # Sessions aren't thread-safe either, so clients are only built under the lock
+                client = get_session().client(
+                    service_name,
+                    config=client_config(),
+                    endpoint_url=_endpoint_url(service_name),
+                )
+                _clients[service_name] = client
+    return client
+
+
+def get_resource(service_name):
+    """Return this thread's resource for `service_name`, reusing its connection pool."""
+    resources = getattr(_local, 'resources', None)
+    if resources is None:
+        resources = _local.resources = {}
+    resource = resources.get(service_name)
+    if resource is None:
+        with _clients_lock:
+            resource = get_session().resource(
+                service_name,
+                config=client_config(),
+                endpoint_url=_endpoint_url(service_name),
+            )
+        resources[service_name] = resource
+    return resource
+
+
+def reset():
+    """Forget the cached clients and this thread's resources, e.g. after changing endpoints."""
+    global _session
+    with _clients_lock:
+        _clients.clear()
+        _session = None
+    _local.__dict__.clear()
@@ -0,0 +1,21 @@
+"""System checks for settings that only work in some deployments."""
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_hierarchy_cache(app_configs, **kwargs):
+    """Division/hospital trees must not outlive an access change by long in workers the signals can't reach."""
+    if not settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+        return []
+    if settings.HIERARCHY_CACHE_TTL <= settings.HIERARCHY_LOCAL_CACHE_MAX_TTL:
+        return []
+    return [Error(
+        f"HIERARCHY_CACHE_TTL is {settings.HIERARCHY_CACHE_TTL}s but the default cache is per-process.",
+        hint=(
+            "Removing a user's division only clears the tree in the worker that saved it, so every other "
+            "worker keeps granting access until the TTL runs out. Set CACHE_URL to a shared cache, or "
+            f"HIERARCHY_CACHE_TTL to {settings.HIERARCHY_LOCAL_CACHE_MAX_TTL} or less."
+        ),
+        id='whiteboard.E001',
+    )]
@@ -0,0 +1,218 @@
+"""Cognito sign-in helpers: local ID token verification and refresh-token session extension.
+
+ID tokens are RS256 JWTs signed with the user pool's keys. The pool's JWKS is
+fetched once per process and cached; a token signed with a key we haven't
+seen (Cognito rotated its keys) triggers one refetch, at most every
+COGNITO_JWKS_MIN_REFRESH_INTERVAL seconds. That makes reading a user's email,
+role and divisions a local check instead of a get_user round trip.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import threading
+import time
+
+import jwt
+import requests
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import logout
+from django.utils.decorators import sync_and_async_middleware
+
+from .aws import get_client
+from .instrumentation import phase
+
+logger = logging.getLogger(__name__)
+
+# Session keys kept for users who signed in through Cognito
+REFRESH_TOKEN_SESSION_KEY = 'cognito_refresh_token'
+USERNAME_SESSION_KEY = 'cognito_username'
+EXPIRES_AT_SESSION_KEY = 'cognito_expires_at'
+
+
+class TokenError(Exception):
+    """An ID token was malformed, expired, or not signed by the user pool."""
+
+
+def compute_secret_hash(client_id, client_secret, username):
+    """Cognito SECRET_HASH for app clients that have a client secret."""
+    message = username + client_id
+    hmac_obj = hmac.new(client_secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha256)
+    return base64.b64encode(hmac_obj.digest()).decode('utf-8')
+
+
+def fetch_jwks(url):
+    with phase('auth'):
+        response = requests.get(url, timeout=settings.AWS_CONNECT_TIMEOUT + settings.AWS_READ_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+class JWKSCache:
+    """Signing keys by kid, refetched every `ttl` seconds or when an unknown kid shows up.
+
+    `fetch` returns a JWKS document ({'keys': [...]}), so tests can hand in
+    locally generated keys instead of fetching the pool's.
+    """
+
+    def __init__(self, fetch, ttl=3600, min_refresh_interval=60):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, fetched_at):
+        with self._lock:
+            # Another thread may have refreshed while this one waited
+            if self._fetched_at != fetched_at:
+                return
+            keys = {}
+            for jwk in self.fetch().get('keys', []):
+                try:
+                    keys[jwk['kid']] = jwt.PyJWK(jwk).key
+                except (KeyError, jwt.PyJWKError) as e:
+                    logger.warning("Skipping unusable JWKS key: %s", e)
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    def get_key(self, kid):
+        fetched_at = self._fetched_at
+        age = None if fetched_at is None else time.monotonic() - fetched_at
+        if age is None or age > self.ttl or (kid not in self._keys and age > self.min_refresh_interval):
+            self._refresh(fetched_at)
+        try:
+            return self._keys[kid]
+        except KeyError:
+            raise TokenError(f"Unknown signing key {kid!r}")
+
+
+class IdTokenVerifier:
+    """Checks a Cognito ID token's signature, expiry, issuer, audience and token_use."""
+
+    def __init__(self, jwks, issuer, client_id, leeway=0):
+        self.jwks = jwks
+        self.issuer = issuer
+        self.client_id = client_id
+        self.leeway = leeway
+
+    def verify(self, token):
+        """Return the token's claims, or raise TokenError."""
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+            claims = jwt.decode(
+                token,
+                self.jwks.get_key(kid),
+                algorithms=['RS256'],
+                audience=self.client_id,
+                issuer=self.issuer,
+                leeway=self.leeway,
+                options={'require': ['exp', 'iat', 'aud', 'iss', 'sub']},
+            )
+        except jwt.PyJWTError as e:
+            raise TokenError(str(e)) from e
+        if claims.get('token_use') != 'id':
+            raise TokenError("Not an ID token")
+        return claims
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    """The process-wide verifier for the configured user pool and app client."""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                jwks = JWKSCache(
+                    lambda: fetch_jwks(settings.AWS_COGNITO_JWKS_URL),
+                    ttl=settings.COGNITO_JWKS_TTL,
+                    min_refresh_interval=settings.COGNITO_JWKS_MIN_REFRESH_INTERVAL,
+                )
+                _verifier = IdTokenVerifier(
+                    jwks,
+                    settings.AWS_COGNITO_ISSUER,
+                    settings.AWS_COGNITO_APP_CLIENT_ID,
+                    leeway=settings.COGNITO_TOKEN_LEEWAY,
+                )
+    return _verifier
+
+
+def set_verifier(verifier):
+    """Swap the process-wide verifier, e.g. for one backed by locally generated keys."""
+    global _verifier
+    _verifier = verifier
+
+
+def store_tokens(session, authentication_result, claims):
+    """Remember what's needed to refresh the user's tokens once the ID token expires."""
+    # Cognito only sends a new refresh token when rotation is on; otherwise keep the old one
+    if 'RefreshToken' in authentication_result:
+        session[REFRESH_TOKEN_SESSION_KEY] = authentication_result['RefreshToken']
+    session[USERNAME_SESSION_KEY] = claims.get('cognito:username', claims['sub'])
+    session[EXPIRES_AT_SESSION_KEY] = claims['exp']
+
+
+def refresh_session(request):
+    """Trade the session's refresh token for new tokens. Returns False if Cognito refused it."""
+    client = get_client('cognito-idp')
+    username = request.session[USERNAME_SESSION_KEY]
+    try:
+        response = client.initiate_auth(
+            ClientId=settings.AWS_COGNITO_APP_CLIENT_ID,
+            AuthFlow='REFRESH_TOKEN_AUTH',
+            AuthParameters={
+                'REFRESH_TOKEN': request.session[REFRESH_TOKEN_SESSION_KEY],
+                'SECRET_HASH': compute_secret_hash(
+                    settings.AWS_COGNITO_APP_CLIENT_ID, settings.AWS_COGNITO_APP_CLIENT_SECRET, username
+                ),
+            },
+        )
+        result = response['AuthenticationResult']
+        claims = get_verifier().verify(result['IdToken'])
+    except client.exceptions.NotAuthorizedException:
+        # Expired or revoked refresh token: the user has to sign in again
+        return False
+    except TokenError as e:
+        logger.warning("Refreshed ID token failed verification: %s", e)
+        return False
+    store_tokens(request.session, result, claims)
+    return True
+
+
+def _needs_refresh(expires_at):
+    return expires_at is not None and expires_at - time.time() <= settings.COGNITO_REFRESH_MARGIN
+
+
+def extend_session(request):
+    """Refresh the tokens of a session whose ID token is about to expire; sign out if Cognito refuses."""
+    try:
+        refreshed = refresh_session(request)
+    except Exception as e:
+        # Cognito being unreachable shouldn't sign anyone out; try again next request
+        logger.error("Error refreshing Cognito session: %s", e)
+        return
+    if not refreshed:
+        logger.info("Cognito refused the refresh token, signing out")
+        logout(request)
+
+
+@sync_and_async_middleware
+def cognito_session_middleware(get_response):
+    """Keep Cognito-backed sessions alive with the refresh token instead of a new password sign-in."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            # Only hop to a thread when there is actually something to refresh
+            if _needs_refresh(await request.session.aget(EXPIRES_AT_SESSION_KEY)):
+                await sync_to_async(extend_session)(request)
+            return await get_response(request)
+    else:
+        def middleware(request):
+            if _needs_refresh(request.session.get(EXPIRES_AT_SESSION_KEY)):
+                extend_session(request)
+            return get_response(request)
+    return middleware
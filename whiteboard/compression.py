@@ -0,0 +1,17 @@
+"""Response compression that leaves async streams alone.
+
+Django's GZipMiddleware compresses each chunk of an async stream as its own
+gzip member, with up to 100 bytes of random padding apiece. For the /events/
+SSE stream that is overhead on every keepalive, and clients that stop
+reading after the first member lose the rest; the history export is an
+async stream too. Those responses go out uncompressed; everything else is
+compressed as before.
+"""
+from django.middleware.gzip import GZipMiddleware
+
+
+class SyncGZipMiddleware(GZipMiddleware):
+    def process_response(self, request, response):
+        if response.streaming and response.is_async:
+            return response
+        return super().process_response(request, response)
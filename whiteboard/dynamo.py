@@ -0,0 +1,259 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+from django.conf import settings
+
+from .aws import get_resource
+
+logger = logging.getLogger(__name__)
+
+
+class ConditionFailed(Exception):
+    """A TransactWriteItems call was cancelled because a condition check failed.
+
+    `indexes` are the positions of the actions whose conditions failed.
+    """
+
+    def __init__(self, indexes):
+        super().__init__(f"Condition check failed for transaction actions {indexes}")
+        self.indexes = indexes
+
+
+class TransactionConflict(Exception):
+    """A TransactWriteItems call was cancelled because another request was writing the same items."""
+
+
+# DynamoDB limits on keys per BatchGetItem call and requests per BatchWriteItem call
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+
+_request_executor = None
+_request_executor_lock = threading.Lock()
+# Set on the request pool's own threads
+_pool_thread = threading.local()
+
+
+def _mark_pool_thread():
+    _pool_thread.active = True
+
+
+def request_executor():
+    """Bounded, process-wide pool for running one request's independent DynamoDB calls."""
+    global _request_executor
+    if _request_executor is None:
+        with _request_executor_lock:
+            if _request_executor is None:
+                _request_executor = ThreadPoolExecutor(
+                    max_workers=settings.DYNAMODB_REQUEST_WORKERS,
+                    thread_name_prefix='dynamodb',
+                    initializer=_mark_pool_thread,
+                )
+    return _request_executor
+
+
+def run_concurrently(*calls):
+    """Run independent zero-argument callables at the same time and return their results in order.
+
+    The first call runs on the calling thread, the rest on the request pool, so a
+    view waits about as long as its slowest call. Exceptions are re-raised here.
+    Called from a task already running on the pool, the calls run one after
+    another on that thread instead: a task waiting on tasks queued behind it in
+    a full pool would never finish.
+    """
+    if getattr(_pool_thread, 'active', False):
+        return [call() for call in calls]
+    # Each call gets its own copy of the caller's context (request timings and the like)
+    futures = [request_executor().submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    results = [calls[0]()]
+    results.extend(future.result() for future in futures)
+    return results
+
+
+def whiteboard_table():
+    return get_resource('dynamodb').Table(settings.WHITEBOARD_TABLE)
+
+
+def rooms_table():
+    return get_resource('dynamodb').Table(settings.ROOMS_TABLE)
+
+
+def staff_table():
+    return get_resource('dynamodb').Table(settings.STAFF_TABLE)
+
+
+def assignments_table():
+    return get_resource('dynamodb').Table(settings.ROOM_ASSIGNMENTS_TABLE)
+
+
+def rollups_table():
+    return get_resource('dynamodb').Table(settings.ASSIGNMENT_ROLLUPS_TABLE)
+
+
+def sequences_table():
+    return get_resource('dynamodb').Table(settings.BOARD_SEQUENCES_TABLE)
+
+
+# Whiteboard attributes the board actually renders. Older items spell provider and
+# surgeon a few different ways, so every variant is projected.
+WHITEBOARD_BOARD_ATTRIBUTES = [
+    'Room', 'hospital_id',
+    'Provider', 'provider', 'provider_name',
+    'Surgeon', 'surgeon', 'surgeon_name',
+    'Staff', 'version', 'sequence',
+]
+
+
+def projection(attributes):
+    """Build ProjectionExpression/ExpressionAttributeNames kwargs for a list of attributes."""
+    names = {f'#p{i}': attribute for i, attribute in enumerate(attributes)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names,
+    }
+
+
+def paginate_pages(operation, **kwargs):
+    """Yield each page of items from a query/scan, following LastEvaluatedKey."""
+    while True:
+        response = operation(**kwargs)
+        yield response.get('Items', [])
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+def paginate(operation, **kwargs):
+    """Yield every item from a query/scan, following LastEvaluatedKey across pages."""
+    for page in paginate_pages(operation, **kwargs):
+        yield from page
+
+
+def query_hospital_rooms(hospital_id, attributes=WHITEBOARD_BOARD_ATTRIBUTES):
+    """Read one hospital's rooms through the hospital_id index, projected to `attributes`."""
+    return list(paginate(
+        whiteboard_table().query,
+        IndexName=settings.WHITEBOARD_HOSPITAL_INDEX,
+        KeyConditionExpression=Key('hospital_id').eq(str(hospital_id)),
+        **projection(attributes),
+    ))
+
+
+def scan_all_rooms(attributes=WHITEBOARD_BOARD_ATTRIBUTES):
+    """Read every room in the table. Only for callers that are not scoped to a hospital."""
+    return list(paginate(whiteboard_table().scan, **projection(attributes)))
+
+
+def assignment_history_pages(hospital_id, start_date, end_date):
+    """Page through a hospital's RoomAssignments between two YYYY-MM-DD dates (inclusive).
+
+    Pages are fetched lazily, so callers can stream any date range in constant memory.
+    """
+    return paginate_pages(
+        assignments_table().query,
+        IndexName=settings.ROOM_ASSIGNMENTS_HISTORY_INDEX,
+        KeyConditionExpression=Key('hospital_id').eq(str(hospital_id)) & Key('date').between(start_date, end_date),
+    )
+
+
+def _batch_get_chunk(table, keys, extra):
+    """BatchGetItem one chunk of keys, retrying UnprocessedKeys with exponential backoff."""
+    # The resource's client is thread-safe and still speaks plain Python types
+    client = table.meta.client
+    request = {table.name: {'Keys': keys, **extra}}
+    items = []
+    for attempt in range(settings.DYNAMODB_BATCH_MAX_RETRIES + 1):
+        response = client.batch_get_item(RequestItems=request)
+        items.extend(response.get('Responses', {}).get(table.name, []))
+        request = response.get('UnprocessedKeys') or {}
+        if not request:
+            return items
+        time.sleep(min(0.05 * (2 ** attempt), 1.0))
+    unprocessed = len(request.get(table.name, {}).get('Keys', []))
+    logger.warning("Gave up on %d unprocessed keys from %s", unprocessed, table.name)
+    return items
+
+
+def batch_get_items(table, keys, attributes=None):
+    """Fetch `keys` from `table` with chunked BatchGetItem calls run in parallel."""
+    keys = list(keys)
+    if not keys:
+        return []
+    extra = projection(attributes) if attributes else {}
+    chunks = [keys[i:i + BATCH_GET_LIMIT] for i in range(0, len(keys), BATCH_GET_LIMIT)]
+    if len(chunks) == 1:
+        return _batch_get_chunk(table, chunks[0], extra)
+    with ThreadPoolExecutor(max_workers=min(len(chunks), settings.DYNAMODB_BATCH_WORKERS)) as pool:
+        # Each chunk runs in its own copy of the caller's context so its time lands in the request's timings
+        contexts = [contextvars.copy_context() for _ in chunks]
+        results = pool.map(
+            lambda context, chunk: context.run(_batch_get_chunk, table, chunk, extra),
+            contexts, chunks,
+        )
+        return [item for chunk_items in results for item in chunk_items]
+
+
+def _batch_write_chunk(client, requests):
+    """BatchWriteItem one chunk of (table_name, request) pairs, retrying UnprocessedItems.
+
+    Returns the (table_name, request) pairs DynamoDB still had not processed after the last retry.
+    """
+    request_items = {}
+    for table_name, request in requests:
+        request_items.setdefault(table_name, []).append(request)
+    for attempt in range(settings.DYNAMODB_BATCH_MAX_RETRIES + 1):
+        response = client.batch_write_item(RequestItems=request_items)
+        request_items = response.get('UnprocessedItems') or {}
+        if not request_items:
+            return []
+        time.sleep(min(0.05 * (2 ** attempt), 1.0))
+    unprocessed = [(table_name, request) for table_name, pending in request_items.items() for request in pending]
+    logger.warning("Gave up on %d unprocessed writes", len(unprocessed))
+    return unprocessed
+
+
+def batch_write(requests):
+    """Write (table_name, {'PutRequest'|'DeleteRequest': ...}) pairs with chunked BatchWriteItem calls.
+
+    Requests for several tables can share a chunk. Chunks run in parallel and
+    the requests that could not be written are returned.
+    """
+    requests = list(requests)
+    if not requests:
+        return []
+    client = get_resource('dynamodb').meta.client
+    chunks = [requests[i:i + BATCH_WRITE_LIMIT] for i in range(0, len(requests), BATCH_WRITE_LIMIT)]
+    if len(chunks) == 1:
+        return _batch_write_chunk(client, chunks[0])
+    with ThreadPoolExecutor(max_workers=min(len(chunks), settings.DYNAMODB_BATCH_WORKERS)) as pool:
+        contexts = [contextvars.copy_context() for _ in chunks]
+        results = pool.map(
+            lambda context, chunk: context.run(_batch_write_chunk, client, chunk),
+            contexts, chunks,
+        )
+        return [request for unprocessed in results for request in unprocessed]
+
+
+def transact_write(*actions):
+    """Apply every action ({'Put'|'Update'|'Delete'|'ConditionCheck': ...}) atomically.
+
+    Raises ConditionFailed when DynamoDB cancels the transaction over a failed
+    condition, and TransactionConflict when it cancels it because another write
+    to one of the items was in progress; that one is worth retrying.
+    """
+    client = get_resource('dynamodb').meta.client
+    try:
+        client.transact_write_items(TransactItems=list(actions))
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get('CancellationReasons', [])
+        failed = [index for index, reason in enumerate(reasons) if reason.get('Code') == 'ConditionalCheckFailed']
+        if failed:
+            raise ConditionFailed(failed) from e
+        if any(reason.get('Code') == 'TransactionConflict' for reason in reasons):
+            raise TransactionConflict(str(e)) from e
+        raise
+
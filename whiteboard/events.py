@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroker:
+    """Fan room updates out to the boards connected to this worker.
+
+    Views publish from whatever thread they run in; each subscriber is an
+    asyncio.Queue owned by the event loop serving its SSE stream.
+    """
+
+    def __init__(self, queue_size=100, keepalive=15):
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, hospital_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(str(hospital_id), ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, message)
+
+    @staticmethod
+    def _deliver(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.warning("Dropping board event for a subscriber that is not keeping up")
+
+    async def subscribe(self, hospital_id):
+        """Yield messages for `hospital_id`, or None every `keepalive` seconds when idle."""
+        key = str(hospital_id)
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers[key].add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers[key].discard(subscriber)
+                if not self._subscribers[key]:
+                    del self._subscribers[key]
+
+
+class CacheBroker:
+    """Share room updates between workers through a Django cache such as redis or memcached.
+
+    Each hospital gets a sequence counter and a short-lived key per event;
+    subscribers poll the counter and read whatever they have not seen yet.
+    """
+
+    def __init__(self, alias='default', poll_interval=1.0, ttl=60, keepalive=15):
+        self.cache = caches[alias]
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self.keepalive = keepalive
+
+    def _sequence_key(self, hospital_id):
+        return f"board-events:{hospital_id}:seq"
+
+    def _event_key(self, hospital_id, sequence):
+        return f"board-events:{hospital_id}:{sequence}"
+
+    def publish(self, hospital_id, message):
+        key = self._sequence_key(hospital_id)
+        self.cache.add(key, 0, timeout=None)
+        sequence = self.cache.incr(key)
+        self.cache.set(self._event_key(hospital_id, sequence), message, timeout=self.ttl)
+
+    async def subscribe(self, hospital_id):
+        key = self._sequence_key(hospital_id)
+        seen = await self.cache.aget(key, 0)
+        idle = 0.0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            latest = await self.cache.aget(key, 0)
+            if latest <= seen:
+                idle += self.poll_interval
+                if idle >= self.keepalive:
+                    idle = 0.0
+                    yield None
+                continue
+            keys = [self._event_key(hospital_id, sequence) for sequence in range(seen + 1, latest + 1)]
+            events = await self.cache.aget_many(keys)
+            for event_key in keys:
+                if event_key in events:
+                    yield events[event_key]
+            seen = latest
+            idle = 0.0
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker configured by WHITEBOARD_EVENTS_BACKEND."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = import_string(settings.WHITEBOARD_EVENTS_BACKEND)
+                _broker = backend(**settings.WHITEBOARD_EVENTS_OPTIONS)
+    return _broker
@@ -0,0 +1,125 @@
+"""Cached, per-user view of the divisions a user is assigned to and their hospitals.
+
+The selection flow runs before every board load, so the tree is built with a
+single query and kept in the default cache. Saving or deleting a Division or
+Hospital bumps a shared version that retires every user's tree; changing a
+user's assigned_divisions drops just the trees of the users involved.
+Those signals only reach workers sharing the cache, which is why a
+per-process cache keeps trees briefly (see whiteboard/checks.py).
+"""
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomUser, Division, Hospital
+
+HIERARCHY_VERSION_KEY = 'hierarchy-version'
+
+HospitalNode = namedtuple('HospitalNode', ['id', 'name', 'division_id'])
+DivisionNode = namedtuple('DivisionNode', ['id', 'name', 'hospitals'])
+
+
+def _as_id(value):
+    """Ids from the session or a form may be str or int; anything else is no id."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Hierarchy:
+    """The divisions one user is assigned to, each with its hospitals, in id order."""
+
+    def __init__(self, divisions):
+        self.divisions = tuple(divisions)
+        self._divisions = {division.id: division for division in self.divisions}
+        self._hospitals = {hospital.id: hospital for division in self.divisions for hospital in division.hospitals}
+
+    def division(self, division_id):
+        """The assigned division with this id, or None."""
+        return self._divisions.get(_as_id(division_id))
+
+    def hospital(self, hospital_id, division_id=None):
+        """The hospital with this id if it is in an assigned division (and in `division_id`, if given)."""
+        hospital = self._hospitals.get(_as_id(hospital_id))
+        if hospital is None or (division_id is not None and hospital.division_id != _as_id(division_id)):
+            return None
+        return hospital
+
+    def hospitals(self, division_id):
+        division = self.division(division_id)
+        return division.hospitals if division else ()
+
+
+def build_hierarchy(user_id):
+    """Read a user's divisions and hospitals in one query (a LEFT JOIN, so empty divisions still show)."""
+    rows = (
+        Division.objects.filter(users__id=user_id)
+        .order_by('id', 'hospitals__id')
+        .values_list('id', 'name', 'hospitals__id', 'hospitals__name')
+    )
+    divisions = {}
+    for division_id, division_name, hospital_id, hospital_name in rows:
+        name, hospitals = divisions.setdefault(division_id, (division_name, []))
+        if hospital_id is not None:
+            hospitals.append(HospitalNode(hospital_id, hospital_name, division_id))
+    return Hierarchy(
+        DivisionNode(division_id, name, tuple(hospitals))
+        for division_id, (name, hospitals) in divisions.items()
+    )
+
+
+def _new_version():
+    # Time-based, so a version key that was evicted never restarts at a number old trees still use
+    return int(time.time() * 1000)
+
+
+def _cache_key(user_id):
+    return f"hierarchy:{cache.get_or_set(HIERARCHY_VERSION_KEY, _new_version, None)}:{user_id}"
+
+
+def get_hierarchy(user):
+    """The user's division/hospital tree, from the cache when possible."""
+    key = _cache_key(user.pk)
+    hierarchy = cache.get(key)
+    if hierarchy is None:
+        hierarchy = build_hierarchy(user.pk)
+        cache.set(key, hierarchy, settings.HIERARCHY_CACHE_TTL)
+    return hierarchy
+
+
+def invalidate_hierarchies():
+    """Retire every user's cached tree."""
+    try:
+        cache.incr(HIERARCHY_VERSION_KEY)
+    except ValueError:
+        cache.set(HIERARCHY_VERSION_KEY, _new_version(), None)
+
+
+def invalidate_user_hierarchies(user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver([post_save, post_delete], sender=Division)
+@receiver([post_save, post_delete], sender=Hospital)
+def _organization_changed(sender, **kwargs):
+    invalidate_hierarchies()
+
+
+@receiver(m2m_changed, sender=CustomUser.assigned_divisions.through)
+def _assigned_divisions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        # user.assigned_divisions.add/remove/set/clear
+        invalidate_user_hierarchies([instance.pk])
+    elif pk_set:
+        # division.users.add/remove with the users that changed
+        invalidate_user_hierarchies(pk_set)
+    else:
+        # division.users.clear() doesn't say which users it dropped
+        invalidate_hierarchies()
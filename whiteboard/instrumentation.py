@@ -0,0 +1,169 @@
+"""Request timing (emitted as a Server-Timing header) and structured, sampled logging."""
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+request_logger = logging.getLogger('whiteboard.requests')
+
+# AWS services reported under a friendlier Server-Timing phase name
+AWS_PHASES = {
+    'dynamodb': 'dynamodb',
+    'cognito-idp': 'auth',
+}
+
+_current = contextvars.ContextVar('whiteboard_request_timings', default=None)
+
+
+class RequestTimings:
+    """Seconds spent per phase during one request.
+
+    Phases that run on several threads at once (see dynamo.run_concurrently)
+    are summed, so a phase can add up to more than the request's wall time.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        entries.append(f"total;dur={self.total() * 1000:.1f}")
+        return ', '.join(entries)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent inside the block to the current request's `name` phase."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def _before_aws_call(context=None, **kwargs):
+    if context is not None:
+        context['whiteboard_started'] = time.perf_counter()
+
+
+def _after_aws_call(model=None, context=None, **kwargs):
+    timings = _current.get()
+    if timings is None or context is None or 'whiteboard_started' not in context:
+        return
+    service = model.service_model.service_name
+    timings.add(AWS_PHASES.get(service, service), time.perf_counter() - context['whiteboard_started'])
+
+
+def register_aws_timing(events):
+    """Time every AWS call made by clients created from a session with these events."""
+    events.register('before-call', _before_aws_call)
+    events.register('after-call', _after_aws_call)
+    events.register('after-call-error', _after_aws_call)
+
+
+def _finish(request, response, timings):
+    response['Server-Timing'] = timings.server_timing()
+    request_logger.info(
+        "%s %s %s", request.method, request.path, response.status_code,
+        extra={
+            'status': response.status_code,
+            'duration_ms': round(timings.total() * 1000, 1),
+            'phases_ms': {name: round(seconds * 1000, 1) for name, seconds in timings.phases.items()},
+            'calls': timings.counts,
+        },
+    )
+    return response
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    """Collect per-phase timings for each request and report them in Server-Timing."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, timings)
+    else:
+        def middleware(request):
+            timings = RequestTimings()
+            token = _current.set(timings)
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, timings)
+    return middleware
+
+
+class SamplingFilter(logging.Filter):
+    """Let through only a fraction of INFO and lower records, per logger.
+
+    `rates` maps logger names to the fraction kept; the longest matching
+    prefix wins and `default` covers everything else. WARNING and above are
+    always kept.
+    """
+
+    def __init__(self, rates=None, default=1.0):
+        super().__init__()
+        self.rates = rates or {}
+        self.default = default
+
+    def rate_for(self, name):
+        best = None
+        for prefix in self.rates:
+            if (name == prefix or name.startswith(prefix + '.')) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.rates[best] if best is not None else self.default
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per record: the message plus any fields passed with `extra=`."""
+
+    _standard = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update({key: value for key, value in vars(record).items() if key not in self._standard})
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
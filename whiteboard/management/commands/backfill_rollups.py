@@ -0,0 +1,49 @@
+from datetime import date
+
+from boto3.dynamodb.conditions import Attr
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.aws import get_client
+from whiteboard.dynamo import assignments_table, paginate_pages, projection
+from whiteboard.rollups import ROLLUP_SOURCE_ATTRIBUTES, rebuild_rollups, summarize
+from whiteboard.schema import create_tables
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily utilization rollups from RoomAssignments. Creates the rollup "
+        "table if it is missing. Days in the range are overwritten with the recomputed totals, "
+        "so saves made while it runs are lost from them: stop the app first, or end the range "
+        "before today."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD). Defaults to the earliest assignment.")
+        parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD). Defaults to the latest assignment.")
+
+    def handle(self, *args, **options):
+        if not options['end'] or options['end'] >= date.today().isoformat():
+            # Live saves add to today's rollup between the scan and the overwrite
+            self.stderr.write(self.style.WARNING(
+                "The range includes today. Assignments saved while this runs will be missing from "
+                "today's rollup; stop the app first, or pass --end with an earlier day."
+            ))
+        created = create_tables(get_client('dynamodb'))
+        for name in created:
+            self.stdout.write(f"Created table {name}.")
+
+        scan_kwargs = projection(ROLLUP_SOURCE_ATTRIBUTES)
+        if options['start'] or options['end']:
+            scan_kwargs['FilterExpression'] = Attr('date').between(options['start'] or '0000-00-00', options['end'] or '9999-99-99')
+
+        # Only the summaries are kept, so memory follows days x hospitals, not assignments
+        summaries = {}
+        scanned = 0
+        for page in paginate_pages(assignments_table().scan, **scan_kwargs):
+            summarize(page, summaries)
+            scanned += len(page)
+
+        unprocessed = rebuild_rollups(summaries)
+        if unprocessed:
+            raise CommandError(f"DynamoDB did not accept {len(unprocessed)} of {len(summaries)} rollups. Run the backfill again.")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(summaries)} daily rollups from {scanned} assignments."))
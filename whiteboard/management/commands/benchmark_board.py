@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from whiteboard import aws
+from whiteboard.audit import get_assignment_writer
+from whiteboard.dynamo import staff_table, whiteboard_table
+from whiteboard.models import CustomUser, Division, Hospital
+from whiteboard.schema import create_tables, delete_tables
+from whiteboard.staff import invalidate_staff_cache
+from whiteboard.views import board_loads
+
+
+class DynamoDBMeter:
+    """Counts DynamoDB calls and response bytes through botocore's event hooks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.bytes_read = 0
+
+    def after_call(self, http_response=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            if http_response is not None:
+                self.bytes_read += len(http_response.content or b'')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark home, edit_entry and add_entry against an in-memory DynamoDB stand-in "
+        "(moto) and write latency and DynamoDB cost per request as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', default='10,500,5000',
+                            help="Comma-separated board sizes (rooms per hospital) to run.")
+        parser.add_argument('--hospitals', type=int, default=3,
+                            help="Hospitals seeded per run; every hospital gets the same number of rooms.")
+        parser.add_argument('--staff', type=int, default=200, help="Staff members seeded per hospital.")
+        parser.add_argument('--requests', type=int, default=30, help="Requests timed per view and board size.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed for the generated data.")
+        parser.add_argument('--output', default='benchmark-results.json', help="Where to write the JSON results.")
+        parser.add_argument('--log-level', default='WARNING',
+                            help="Log level while the views run, so board dumps don't flood the console.")
+
+    def handle(self, *args, **options):
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise CommandError("The benchmark needs moto for its DynamoDB stand-in: pip install moto")
+
+        sizes = [int(size) for size in options['rooms'].split(',') if size.strip()]
+        meter = DynamoDBMeter()
+        root_logger = logging.getLogger()
+        previous_level = root_logger.level
+
+        setup_test_environment()
+        old_database = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # moto only intercepts the real AWS endpoints. Anything the background
+        # assignment writer can't flush goes to a scratch spill file, not the real one.
+        # Plain static storage renders pages without a collectstatic manifest.
+        overrides = override_settings(
+            AWS_ENDPOINT_URLS={},
+            ALLOWED_HOSTS=['testserver'],
+            ASSIGNMENT_SPILL_PATH=os.path.join(tempfile.mkdtemp(), 'assignment-spill.jsonl'),
+            STORAGES={
+                **settings.STORAGES,
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+        )
+        results = []
+        try:
+            with mock_aws(), overrides:
+                aws.reset()
+                aws.get_session().events.register('after-call.dynamodb', meter.after_call)
+                root_logger.setLevel(options['log_level'].upper())
+                try:
+                    for size in sizes:
+                        results.extend(self.run_size(size, meter, options))
+                finally:
+                    # Stop the writer while the stand-in is still up
+                    get_assignment_writer().shutdown()
+        finally:
+            root_logger.setLevel(previous_level)
+            aws.reset()
+            connection.creation.destroy_test_db(old_database, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'hospitals': options['hospitals'],
+            'staff_per_hospital': options['staff'],
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        self.stdout.write(f"{'rooms':>6} {'view':<18} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls':>6} {'KB read':>9}")
+        for result in results:
+            self.stdout.write(
+                f"{result['rooms']:>6} {result['view']:<18} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['dynamodb_calls_per_request']:>6.1f} "
+                f"{result['bytes_read_per_request'] / 1024:>9.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def seed(self, rooms, options):
+        """Fresh tables plus divisions, hospitals, staff and rooms for one board size."""
+        rng = random.Random(options['seed'])
+        client = aws.get_client('dynamodb')
+        delete_tables(client)
+        create_tables(client)
+        invalidate_staff_cache()
+
+        Hospital.objects.all().delete()
+        Division.objects.all().delete()
+        division = Division.objects.create(name='Benchmark Division')
+        hospitals = [Hospital.objects.create(name=f"Hospital {i + 1}", division=division)
+                     for i in range(options['hospitals'])]
+
+        staff_ids = {}
+        with staff_table().batch_writer() as batch:
+            for hospital in hospitals:
+                staff_ids[hospital.id] = []
+                for i in range(options['staff']):
+                    staff_id = f"{hospital.id}-{i}"
+                    role = rng.choice(['CRNA', 'AA', 'Student'])
+                    batch.put_item(Item={
+                        'staff_id': staff_id,
+                        'name': f"{role} {i}",
+                        'role': role,
+                        'sub_role': 'SRNA' if role == 'Student' else '',
+                        'location_id': str(hospital.id),
+                    })
+                    staff_ids[hospital.id].append(staff_id)
+
+        with whiteboard_table().batch_writer() as batch:
+            for hospital in hospitals:
+                for i in range(rooms):
+                    batch.put_item(Item={
+                        'Room': f"H{hospital.id} Room {i + 1}",
+                        'Provider': f"Dr. Provider {rng.randint(1, 99)}",
+                        'Surgeon': f"Dr. Surgeon {rng.randint(1, 99)}",
+                        'Staff': rng.choice(staff_ids[hospital.id]),
+                        'hospital_id': str(hospital.id),
+                    })
+
+        user, _ = CustomUser.objects.get_or_create(email='benchmark@example.com')
+        user.assigned_divisions.set([division])
+        return user, division, hospitals[0], staff_ids[hospitals[0].id]
+
+    def run_size(self, rooms, meter, options):
+        self.stdout.write(f"Seeding {options['hospitals']} hospitals x {rooms} rooms...")
+        user, division, hospital, staff_ids = self.seed(rooms, options)
+        rng = random.Random(options['seed'])
+
+        client = Client()
+        client.force_login(user)
+        session = client.session
+        session['selected_division_id'] = division.id
+        session['selected_hospital_id'] = hospital.id
+        session.save()
+
+        def room_name():
+            return f"H{hospital.id} Room {rng.randint(1, rooms)}"
+
+        added = iter(range(rooms + 1, rooms + 1 + options['requests'] * 2))
+        scenarios = [
+            ('home', lambda: client.get('/')),
+            ('edit_entry GET', lambda: client.get(f"/edit/{room_name()}/")),
+            ('edit_entry POST', lambda: client.post(f"/edit/{room_name()}/", {
+                'provider': 'Dr. Bench', 'surgeon': 'Dr. Mark', 'staff': rng.choice(staff_ids),
+            })),
+            ('add_entry POST', lambda: client.post('/add/', {
+                'room': f"H{hospital.id} Room {next(added)}", 'provider': 'Dr. Bench',
+                'surgeon': 'Dr. Mark', 'staff': rng.choice(staff_ids),
+            })),
+        ]
+
+        results = []
+        for view, make_request in scenarios:
+            # One untimed request warms caches and clients the way a running worker would be
+            make_request()
+            latencies, calls, bytes_read = [], 0, 0
+            for _ in range(options['requests']):
+                # Every request reads the board itself rather than reusing the last one's
+                board_loads.invalidate(str(hospital.id))
+                meter.reset()
+                started = time.perf_counter()
+                response = make_request()
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    raise CommandError(f"{view} returned {response.status_code}")
+                calls += meter.calls
+                bytes_read += meter.bytes_read
+            results.append({
+                'rooms': rooms,
+                'view': view,
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'mean_ms': statistics.fmean(latencies),
+                'dynamodb_calls_per_request': calls / options['requests'],
+                'bytes_read_per_request': bytes_read / options['requests'],
+            })
+        return results
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.models import ApiToken, CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Issue a bearer token for the read-only JSON API. The token can read the boards of the "
+        "hospitals in the user's assigned divisions. It is printed once and can't be shown again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="User the token acts as, e.g. a service account.")
+        parser.add_argument('name', help="What the token is for, e.g. 'OR 5 wall display'.")
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(email=options['email'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user with email {options['email']}.")
+        if not user.is_active:
+            raise CommandError(f"{user.email} is inactive; its tokens would be refused.")
+
+        token, key = ApiToken.issue(user, options['name'])
+        self.stderr.write(f"Created token {token.name!r} for {user.email}. Revoke it in the admin under API Tokens.")
+        # Only the key goes to stdout, so it can be piped into a secrets store
+        self.stdout.write(key)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.dynamo import assignments_table
+from whiteboard.schema import add_index, assignment_history_index
+
+
+class Command(BaseCommand):
+    help = "Create the (hospital_id, date) global secondary index assignment history reads through."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-capacity', type=int, default=5,
+                            help="Index read capacity, only used for provisioned tables.")
+        parser.add_argument('--write-capacity', type=int, default=5,
+                            help="Index write capacity, only used for provisioned tables.")
+
+    def handle(self, *args, **options):
+        table = assignments_table()
+        index = assignment_history_index()
+        try:
+            created = add_index(
+                table, index,
+                [
+                    {'AttributeName': 'hospital_id', 'AttributeType': 'S'},
+                    {'AttributeName': 'date', 'AttributeType': 'S'},
+                ],
+                options['read_capacity'], options['write_capacity'],
+            )
+        except table.meta.client.exceptions.ClientError as e:
+            raise CommandError(f"Could not create index {index['IndexName']}: {e}")
+
+        if not created:
+            self.stdout.write(f"Index {index['IndexName']} already exists on {table.name}.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Creating index {index['IndexName']} on {table.name}. "
+            "DynamoDB backfills it in the background; exports can use it once it is ACTIVE."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from whiteboard.aws import get_client
+from whiteboard.schema import create_tables
+
+
+class Command(BaseCommand):
+    help = "Create any of the app's DynamoDB tables that don't exist yet. Run it before deploying a release that adds a table."
+
+    def handle(self, *args, **options):
+        created = create_tables(get_client('dynamodb'))
+        for name in created:
+            self.stdout.write(f"Created table {name}.")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} table(s)."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.dynamo import whiteboard_table
+from whiteboard.schema import add_index, hospital_index
+
+
+class Command(BaseCommand):
+    help = "Create the hospital_id global secondary index the board reads through."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--read-capacity', type=int, default=5,
+                            help="Index read capacity, only used for provisioned tables.")
+        parser.add_argument('--write-capacity', type=int, default=5,
+                            help="Index write capacity, only used for provisioned tables.")
+
+    def handle(self, *args, **options):
+        table = whiteboard_table()
+        client = table.meta.client
+        description = client.describe_table(TableName=table.name)['Table']
+        key_attributes = tuple(element['AttributeName'] for element in description['KeySchema'])
+        index = hospital_index(key_attributes)
+
+        try:
+            created = add_index(
+                table, index,
+                [{'AttributeName': 'hospital_id', 'AttributeType': 'S'}],
+                options['read_capacity'], options['write_capacity'],
+            )
+        except client.exceptions.ClientError as e:
+            raise CommandError(f"Could not create index {index['IndexName']}: {e}")
+
+        if not created:
+            self.stdout.write(f"Index {index['IndexName']} already exists on {table.name}.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Creating index {index['IndexName']} on {table.name}. "
+            "DynamoDB backfills it in the background; the board can use it once it is ACTIVE."
+        ))
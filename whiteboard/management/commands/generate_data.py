@@ -0,0 +1,247 @@
+import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard import aws
+from whiteboard.models import CustomUser, Division, Hospital
+from whiteboard.rollups import rebuild_rollups, summarize
+from whiteboard.rooms import DUAL_STORAGE, LEGACY_STORAGE, ROOMS_STORAGE, room_item, stamped, to_legacy
+from whiteboard.schema import create_tables, delete_tables
+
+DIVISION_NAMES = ['Capital', 'Central', 'Coastal', 'Mountain', 'Northern', 'Southern', 'Valley', 'Western']
+HOSPITAL_NAMES = [
+    'Chippenham', 'Johnston-Willis', 'VCU Main', 'St. Mary\'s', 'Memorial Regional', 'Riverside',
+    'Parham Doctors', 'Henrico Doctors', 'Retreat', 'Southside', 'Stony Point', 'Westchester',
+]
+FIRST_NAMES = [
+    'Alex', 'Avery', 'Blake', 'Cameron', 'Casey', 'Dana', 'Drew', 'Elliot', 'Emerson', 'Finley',
+    'Harper', 'Jamie', 'Jordan', 'Kendall', 'Logan', 'Morgan', 'Parker', 'Quinn', 'Reese', 'Riley',
+    'Rowan', 'Sage', 'Skyler', 'Taylor',
+]
+LAST_NAMES = [
+    'Adams', 'Brown', 'Clark', 'Davis', 'Evans', 'Garcia', 'Hall', 'Johnson', 'Jones', 'Lee',
+    'Lewis', 'Miller', 'Moore', 'Nguyen', 'Patel', 'Robinson', 'Smith', 'Taylor', 'Thompson',
+    'Walker', 'White', 'Williams', 'Wilson', 'Young',
+]
+# (role, sub_role, share of a hospital's staff)
+STAFF_MIX = [('CRNA', '', 0.55), ('AA', '', 0.3), ('Student', 'SRNA', 0.15)]
+
+
+def shard_rng(seed, *parts):
+    """A generator seeded from the run seed and the shard, so output doesn't depend on thread timing."""
+    return random.Random(':'.join(str(part) for part in (seed,) + parts))
+
+
+def person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def write_items(table_name, items):
+    """Write items through this thread's batch_writer. Returns how many were written."""
+    table = aws.get_resource('dynamodb').Table(table_name)
+    count = 0
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+            count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill DynamoDB (and the division/hospital rows in the database) with reproducible synthetic "
+        "boards, staff and RoomAssignments history, for local stand-ins and capacity tests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--divisions', type=int, default=2)
+        parser.add_argument('--hospitals', type=int, default=3, help="Hospitals per division.")
+        parser.add_argument('--rooms', type=int, default=30, help="Rooms per hospital.")
+        parser.add_argument('--staff', type=int, default=60, help="Staff members per hospital.")
+        parser.add_argument('--months', type=int, default=6, help="Months of RoomAssignments history.")
+        parser.add_argument('--seed', type=int, default=1, help="Same seed, same data.")
+        parser.add_argument('--workers', type=int, default=8, help="Parallel batch writers.")
+        parser.add_argument('--endpoint-url', default=settings.AWS_ENDPOINT_URLS.get('dynamodb') or '',
+                            help="DynamoDB endpoint, e.g. http://localhost:8000 for DynamoDB Local.")
+        parser.add_argument('--allow-aws', action='store_true',
+                            help="Allow writing to real AWS when no endpoint is given.")
+        parser.add_argument('--reset', action='store_true',
+                            help="Drop and recreate the app's tables first. Only allowed with --endpoint-url.")
+        parser.add_argument('--user', help="Email of a user to assign to every generated division.")
+
+    def handle(self, *args, **options):
+        endpoint = options['endpoint_url']
+        if not endpoint and not options['allow_aws']:
+            raise CommandError("No --endpoint-url given; pass --allow-aws to write synthetic data to real AWS.")
+        if options['reset'] and not endpoint:
+            raise CommandError("--reset only works against a local --endpoint-url.")
+
+        with aws.using_endpoint('dynamodb', endpoint):
+            self.generate(options)
+
+    def generate(self, options):
+        client = aws.get_client('dynamodb')
+        if options['reset']:
+            delete_tables(client)
+        for name in create_tables(client):
+            self.stdout.write(f"Created table {name}.")
+
+        hospitals = self.create_hospitals(options)
+        seed = options['seed']
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='generate') as pool:
+            staff_by_hospital = {hospital.id: self.staff(seed, hospital, options['staff']) for hospital in hospitals}
+            staff_futures = [
+                pool.submit(write_items, settings.STAFF_TABLE, staff)
+                for staff in staff_by_hospital.values()
+            ]
+
+            room_futures = []
+            for hospital in hospitals:
+                rooms = list(self.rooms(seed, hospital, options['rooms'], staff_by_hospital[hospital.id]))
+                for table_name, shape in self.room_targets():
+                    room_futures.append(pool.submit(write_items, table_name, [shape(item) for item in rooms]))
+            # Rooms are numbered 1..n in each hospital's change sequence, so it starts at n
+            pool.submit(write_items, settings.BOARD_SEQUENCES_TABLE, [
+                {'hospital_id': str(hospital.id), 'sequence': options['rooms']} for hospital in hospitals
+            ]).result()
+
+            # One shard per hospital and month keeps every writer busy and memory flat
+            today = date.today()
+            start = today - timedelta(days=30 * options['months'])
+            history_futures = [
+                pool.submit(self.write_history, seed, hospital, staff_by_hospital[hospital.id],
+                            options['rooms'], month_start, min(month_start + timedelta(days=30), today))
+                for hospital in hospitals
+                for month_start in (start + timedelta(days=30 * month) for month in range(options['months']))
+            ]
+
+            staff_count = sum(future.result() for future in staff_futures)
+            room_count = sum(future.result() for future in room_futures)
+            summaries = {}
+            assignment_count = 0
+            for future in history_futures:
+                count, shard_summaries = future.result()
+                assignment_count += count
+                summaries.update(shard_summaries)
+
+        unprocessed = rebuild_rollups(summaries)
+        if unprocessed:
+            self.stderr.write(self.style.WARNING(
+                f"{len(unprocessed)} rollups weren't written; run `manage.py backfill_rollups` to rebuild them."
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(hospitals)} hospitals, {staff_count} staff, {room_count} room items and "
+            f"{assignment_count} assignments ({len(summaries)} daily rollups)."
+        ))
+
+    def create_hospitals(self, options):
+        """Division and Hospital rows, reused on later runs with the same names."""
+        rng = shard_rng(options['seed'], 'organization')
+        divisions = []
+        for i in range(options['divisions']):
+            name = f"{DIVISION_NAMES[i % len(DIVISION_NAMES)]} Division"
+            if i >= len(DIVISION_NAMES):
+                name += f" {i // len(DIVISION_NAMES) + 1}"
+            divisions.append(Division.objects.get_or_create(name=name)[0])
+        # Hospital names are unique across divisions, so their room names are too
+        total = options['divisions'] * options['hospitals']
+        names = rng.sample(HOSPITAL_NAMES, min(total, len(HOSPITAL_NAMES)))
+        names += [f"Hospital {i + 1}" for i in range(len(names), total)]
+        hospitals = [
+            Hospital.objects.get_or_create(name=name, division=divisions[i // options['hospitals']])[0]
+            for i, name in enumerate(names)
+        ]
+
+        if options['user']:
+            try:
+                user = CustomUser.objects.get(email=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"No user with email {options['user']}.")
+            user.assigned_divisions.add(*divisions)
+        return hospitals
+
+    def staff(self, seed, hospital, count):
+        rng = shard_rng(seed, 'staff', hospital.id)
+        roles = rng.choices(STAFF_MIX, weights=[share for _, _, share in STAFF_MIX], k=count)
+        return [
+            {
+                'staff_id': f"{hospital.id}-{i + 1}",
+                'name': f"{role} {person(rng)}",
+                'role': role,
+                'sub_role': sub_role,
+                'location_id': str(hospital.id),
+            }
+            for i, (role, sub_role, _) in enumerate(roles)
+        ]
+
+    def room_targets(self):
+        """(table, item shape) pairs the current WHITEBOARD_STORAGE mode keeps rooms in."""
+        mode = settings.WHITEBOARD_STORAGE
+        targets = []
+        if mode in (LEGACY_STORAGE, DUAL_STORAGE):
+            targets.append((settings.WHITEBOARD_TABLE, to_legacy))
+        if mode in (DUAL_STORAGE, ROOMS_STORAGE):
+            targets.append((settings.ROOMS_TABLE, lambda item: item))
+        return targets
+
+    def rooms(self, seed, hospital, count, staff):
+        rng = shard_rng(seed, 'rooms', hospital.id)
+        providers = [member['staff_id'] for member in staff if member['role'] in ('CRNA', 'AA')] or [None]
+        for i in range(count):
+            yield stamped(room_item(
+                hospital.id,
+                # Hospital-specific names, so legacy Whiteboard keys don't collide across hospitals
+                f"{hospital.name} OR {i + 1}",
+                f"Dr. {person(rng)}",
+                f"Dr. {person(rng)}",
+                rng.choice(providers),
+                sequence=i + 1,
+            ))
+
+    def write_history(self, seed, hospital, staff, rooms, start, end):
+        """Write one hospital's RoomAssignments for [start, end). Returns (count, rollup summaries)."""
+        rng = shard_rng(seed, 'history', hospital.id, start.isoformat())
+        srna = {member['staff_id'] for member in staff if member['sub_role'] == 'SRNA'}
+        crna = {member['staff_id'] for member in staff if member['role'] == 'CRNA'}
+        staff_ids = [member['staff_id'] for member in staff]
+        anesthesiologists = [f"Dr. {person(rng)}" for _ in range(max(3, rooms // 3))]
+        surgeons = [f"Dr. {person(rng)}" for _ in range(max(5, rooms))]
+
+        def assignments():
+            day = start
+            while day < end:
+                # Most rooms run on weekdays, a few on weekends
+                running = 0.9 if day.weekday() < 5 else 0.15
+                for room in range(1, rooms + 1):
+                    if rng.random() >= running:
+                        continue
+                    # Some rooms change hands during the day
+                    for _ in range(2 if rng.random() < 0.2 else 1):
+                        staff_id = rng.choice(staff_ids)
+                        yield {
+                            'assignment_id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                            'room': f"{hospital.name} OR {room}",
+                            'hospital_id': str(hospital.id),
+                            'surgeon_id': rng.choice(surgeons),
+                            'anesthesiologist_id': rng.choice(anesthesiologists),
+                            'app_id': staff_id,
+                            'student_id': staff_id if staff_id in srna else '',
+                            'date': day.isoformat(),
+                            'cases': [],
+                            'provider_mode': 'Directed CRNA' if staff_id in crna else 'Directed AA',
+                        }
+                day += timedelta(days=1)
+
+        summaries = {}
+
+        def summarized():
+            for item in assignments():
+                summarize([item], summaries)
+                yield item
+
+        count = write_items(settings.ROOM_ASSIGNMENTS_TABLE, summarized()) if staff_ids else 0
+        return count, summaries
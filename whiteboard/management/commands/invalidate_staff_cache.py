@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.staff import invalidate_staff_cache, staff_cache_is_shared
+
+
+class Command(BaseCommand):
+    help = "Drop the cached staff directory after editing the Staff table outside the app."
+
+    def handle(self, *args, **options):
+        if not staff_cache_is_shared():
+            raise CommandError(
+                "STAFF_CACHE_URL is a per-process cache, so this command can't reach the running workers. "
+                f"They pick up Staff changes within STAFF_CACHE_TTL ({settings.STAFF_CACHE_TTL}s). "
+                "Point STAFF_CACHE_URL at memcached or redis to invalidate on demand."
+            )
+        version = invalidate_staff_cache()
+        self.stdout.write(self.style.SUCCESS(f"Staff directory cache is now at version {version}."))
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from whiteboard.aws import get_client
+from whiteboard.dynamo import rooms_table, run_concurrently, whiteboard_table
+from whiteboard.rooms import from_legacy
+from whiteboard.schema import create_tables
+
+
+class RateLimiter:
+    """Token bucket shared by every segment worker, so the copy stays under a write budget."""
+
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self._tokens = per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count):
+        if not self.per_second:
+            return
+        # The bucket never holds more than a second's worth, so a bigger batch is paid for in installments
+        while count > 0:
+            chunk = min(count, self.per_second)
+            self._take(chunk)
+            count -= chunk
+
+    def _take(self, count):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.per_second, self._tokens + (now - self._updated) * self.per_second)
+                self._updated = now
+                if self._tokens >= count:
+                    self._tokens -= count
+                    return
+                wait = (count - self._tokens) / self.per_second
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """Per-segment scan progress, rewritten atomically after every page."""
+
+    def __init__(self, path, total_segments, persist=True):
+        self.path = Path(path)
+        self.total_segments = total_segments
+        self.persist = persist
+        self.segments = {segment: {'last_key': None, 'done': False, 'copied': 0, 'skipped': 0, 'kept': 0}
+                         for segment in range(total_segments)}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as checkpoint_file:
+            data = json.load(checkpoint_file)
+        if data['total_segments'] != self.total_segments:
+            raise CommandError(
+                f"{self.path} was written with --segments {data['total_segments']}; resume with the same value."
+            )
+        self.segments = {int(segment): state for segment, state in data['segments'].items()}
+
+    def update(self, segment, **state):
+        with self._lock:
+            self.segments[segment].update(state)
+            if not self.persist:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            partial = self.path.with_name(self.path.name + '.tmp')
+            with open(partial, 'w', encoding='utf-8') as checkpoint_file:
+                json.dump({'total_segments': self.total_segments, 'segments': self.segments}, checkpoint_file, default=str)
+            os.replace(partial, self.path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the Whiteboard table into the Rooms table, keyed by (hospital_id, room) with "
+        "normalized attribute names, using a parallel segmented scan. Safe to stop and resume. "
+        "Run it with WHITEBOARD_STORAGE=dual so rooms saved during the copy land in both tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segments', type=int, default=8, help="Scan segments (TotalSegments), one worker each.")
+        parser.add_argument('--page-size', type=int, default=500, help="Items read per Scan call.")
+        parser.add_argument('--max-writes-per-second', type=int, default=500,
+                            help="Items written per second across all workers; 0 for no limit.")
+        parser.add_argument('--checkpoint', default=str(Path(settings.BASE_DIR) / 'var' / 'whiteboard-migration.json'),
+                            help="Where progress is kept between runs.")
+        parser.add_argument('--resume', action='store_true', help="Carry on from the checkpoint instead of starting over.")
+        parser.add_argument('--dry-run', action='store_true', help="Scan and normalize, but write nothing.")
+
+    def handle(self, *args, **options):
+        if settings.WHITEBOARD_STORAGE == 'legacy' and not options['dry_run']:
+            self.stderr.write(self.style.WARNING(
+                "WHITEBOARD_STORAGE is 'legacy': rooms saved while this runs won't reach the Rooms table. "
+                "Switch the app to 'dual' first, or run again afterwards."
+            ))
+        created = create_tables(get_client('dynamodb'))
+        for name in created:
+            self.stdout.write(f"Created table {name}.")
+
+        # A dry run must not leave a checkpoint a later --resume would trust
+        checkpoint = Checkpoint(options['checkpoint'], options['segments'], persist=not options['dry_run'])
+        if options['resume']:
+            try:
+                checkpoint.load()
+            except FileNotFoundError:
+                raise CommandError(f"No checkpoint at {options['checkpoint']} to resume from.")
+        limiter = RateLimiter(options['max_writes_per_second'])
+
+        pending = [segment for segment, state in checkpoint.segments.items() if not state['done']]
+        with ThreadPoolExecutor(max_workers=len(pending) or 1, thread_name_prefix='migrate') as pool:
+            futures = [pool.submit(self.copy_segment, segment, checkpoint, limiter, options) for segment in pending]
+            errors = []
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+
+        copied = sum(state['copied'] for state in checkpoint.segments.values())
+        skipped = sum(state['skipped'] for state in checkpoint.segments.values())
+        kept = sum(state.get('kept', 0) for state in checkpoint.segments.values())
+        if errors:
+            raise CommandError(
+                f"{len(errors)} segment(s) stopped early ({errors[0]}). Copied {copied} rooms so far; "
+                "run again with --resume to pick up where they left off."
+            )
+        if options['dry_run']:
+            self.stdout.write(f"Would copy {copied} rooms; {skipped} have no Room or hospital_id and would be skipped.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {copied} rooms into {settings.ROOMS_TABLE}, kept {kept} that were saved there since they "
+            f"were scanned, skipped {skipped} without a Room or hospital_id. "
+            "Once the app has run with WHITEBOARD_STORAGE=dual through the copy, switch it to 'rooms'."
+        ))
+
+    def copy_room(self, item):
+        """Put one room into Rooms unless the app saved it there after the scan read it. True if written.
+
+        In dual mode a room saved between the scan and this write is already in
+        Rooms with a newer version; a blind put would replace it with the copy.
+        Runs on the request pool, so it takes that thread's own table resource.
+        """
+        rooms = rooms_table()
+        condition = 'attribute_not_exists(#room)'
+        values = {}
+        if item['version'] is not None:
+            condition += ' OR #version < :version'
+            values[':version'] = item['version']
+        try:
+            rooms.put_item(
+                Item=item,
+                ConditionExpression=condition,
+                ExpressionAttributeNames={'#room': 'room', **({'#version': 'version'} if values else {})},
+                **({'ExpressionAttributeValues': values} if values else {}),
+            )
+        except rooms.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def copy_segment(self, segment, checkpoint, limiter, options):
+        table = whiteboard_table()
+        state = checkpoint.segments[segment]
+        scan_kwargs = {'Segment': segment, 'TotalSegments': checkpoint.total_segments, 'Limit': options['page_size']}
+        if state['last_key']:
+            scan_kwargs['ExclusiveStartKey'] = state['last_key']
+
+        while True:
+            response = table.scan(**scan_kwargs)
+            items = [
+                from_legacy(item) for item in response.get('Items', [])
+                if item.get('Room') and item.get('hospital_id')
+            ]
+            skipped = len(response.get('Items', [])) - len(items)
+            kept = 0
+            if items and not options['dry_run']:
+                limiter.acquire(len(items))
+                # An error leaves the checkpoint before this page, so a resume writes all of it again
+                written = run_concurrently(*[lambda item=item: self.copy_room(item) for item in items])
+                kept = written.count(False)
+
+            last_key = response.get('LastEvaluatedKey')
+            checkpoint.update(
+                segment,
+                last_key=last_key,
+                done=last_key is None,
+                copied=state['copied'] + len(items) - kept,
+                skipped=state['skipped'] + skipped,
+                kept=state.get('kept', 0) + kept,
+            )
+            if last_key is None:
+                return
+            scan_kwargs['ExclusiveStartKey'] = last_key
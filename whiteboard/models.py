@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 
@@ -11,10 +14,17 @@ class Division(models.Model):
         verbose_name = "Division"
         verbose_name_plural = "Divisions"
 
+class HospitalManager(models.Manager):
+    def get_queryset(self):
+        # __str__ shows the division, so fetch it in the same query
+        return super().get_queryset().select_related('division')
+
 class Hospital(models.Model):
     name = models.CharField(max_length=100)
     division = models.ForeignKey(Division, on_delete=models.CASCADE, related_name='hospitals')
 
+    objects = HospitalManager()
+
     def __str__(self):
         return f"{self.name} ({self.division.name})"
 
@@ -62,4 +72,38 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = []
 
     def __str__(self):
-        return self.email
\ No newline at end of file
+        return self.email
+
+    @property
+    def can_view_reports(self):
+        """Managers and admins can see assignment history and utilization."""
+        return self.role in ('manager', 'admin')
+
+class ApiToken(models.Model):
+    """Bearer token a machine client uses for the read-only JSON API.
+
+    The token sees the hospitals its user is assigned to. Only a SHA-256 of
+    the token is stored; the token itself is shown once, when it is created.
+    """
+    name = models.CharField(max_length=100)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='api_tokens')
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def issue(cls, user, name):
+        """Create a token for `user`. Returns (token, key); the key can't be recovered later."""
+        key = secrets.token_urlsafe(32)
+        return cls.objects.create(user=user, name=name, key_hash=cls.hash_key(key)), key
+
+    def __str__(self):
+        return f"{self.name} ({self.user.email})"
+
+    class Meta:
+        verbose_name = "API Token"
+        verbose_name_plural = "API Tokens"
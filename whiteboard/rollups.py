@@ -0,0 +1,126 @@
+"""Per-hospital, per-day utilization rollups of RoomAssignments.
+
+Each rollup item is keyed by (hospital_id, date) and holds counters plus the
+set of rooms assigned that day. The assignment writer folds every batch it
+writes into the rollups with ADD updates, and `backfill_rollups` rebuilds
+them from RoomAssignments, so reports read days x hospitals items instead of
+every assignment.
+"""
+import logging
+
+from boto3.dynamodb.conditions import Key
+from django.conf import settings
+
+from .dynamo import batch_write, paginate, rollups_table, run_concurrently
+
+logger = logging.getLogger(__name__)
+
+# Counters kept per rollup, in the order reports show them
+ROLLUP_COUNTERS = ['assignments', 'directed_crna', 'directed_aa', 'srna']
+
+# provider_mode values on RoomAssignments and the counter each one bumps
+PROVIDER_MODE_COUNTERS = {
+    'Directed CRNA': 'directed_crna',
+    'Directed AA': 'directed_aa',
+}
+
+# RoomAssignments attributes a rollup is computed from
+ROLLUP_SOURCE_ATTRIBUTES = ['hospital_id', 'date', 'room', 'provider_mode', 'student_id']
+
+
+def summarize(items, summaries=None):
+    """Fold assignment items into {(hospital_id, date): {counter: n, 'rooms': set()}}."""
+    summaries = {} if summaries is None else summaries
+    for item in items:
+        key = (str(item['hospital_id']), item['date'])
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = {counter: 0 for counter in ROLLUP_COUNTERS}
+            summary['rooms'] = set()
+        summary['assignments'] += 1
+        counter = PROVIDER_MODE_COUNTERS.get(item.get('provider_mode'))
+        if counter:
+            summary[counter] += 1
+        if item.get('student_id'):
+            summary['srna'] += 1
+        if item.get('room'):
+            summary['rooms'].add(item['room'])
+    return summaries
+
+
+def _add_to_rollup(table, hospital_id, date, summary):
+    names = {f"#c{i}": counter for i, counter in enumerate(ROLLUP_COUNTERS)}
+    values = {f":c{i}": summary[counter] for i, counter in enumerate(ROLLUP_COUNTERS)}
+    actions = [f"#c{i} :c{i}" for i in range(len(ROLLUP_COUNTERS))]
+    # DynamoDB rejects empty sets, and adding nothing to `rooms` is a no-op anyway
+    if summary['rooms']:
+        names['#rooms'] = 'rooms'
+        values[':rooms'] = summary['rooms']
+        actions.append('#rooms :rooms')
+    table.update_item(
+        Key={'hospital_id': hospital_id, 'date': date},
+        UpdateExpression='ADD ' + ', '.join(actions),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+def apply_assignments(items):
+    """Add freshly written assignment items to their rollups.
+
+    Each (hospital, day) in the batch costs one UpdateItem. Failures are logged
+    rather than raised: the assignments themselves are already stored, and
+    `manage.py backfill_rollups` rebuilds any day that missed an update.
+    """
+    table = rollups_table()
+    for (hospital_id, date), summary in summarize(items).items():
+        try:
+            _add_to_rollup(table, hospital_id, date, summary)
+        except Exception as e:
+            logger.error(
+                "Error updating utilization rollup: %s", e,
+                extra={'hospital_id': hospital_id, 'date': date, 'assignments': summary['assignments']},
+            )
+
+
+def rebuild_rollups(summaries):
+    """Overwrite rollups with recomputed summaries. Returns the requests DynamoDB didn't accept.
+
+    The overwrite discards whatever apply_assignments added since the summaries
+    were computed, so nothing may be writing assignments for those days.
+    """
+    def rollup_item(hospital_id, date, summary):
+        item = {'hospital_id': hospital_id, 'date': date}
+        item.update({counter: summary[counter] for counter in ROLLUP_COUNTERS})
+        if summary['rooms']:
+            item['rooms'] = summary['rooms']
+        return item
+
+    return batch_write(
+        (settings.ASSIGNMENT_ROLLUPS_TABLE, {'PutRequest': {'Item': rollup_item(hospital_id, date, summary)}})
+        for (hospital_id, date), summary in summaries.items()
+    )
+
+
+def read_rollups(hospital_ids, start_date, end_date):
+    """Rollup rows for each hospital between two YYYY-MM-DD dates, ordered by date then hospital.
+
+    Rows carry the counters plus `rooms` (how many distinct rooms ran that day).
+    Hospitals are queried at the same time.
+    """
+    def hospital_rollups(hospital_id):
+        return list(paginate(
+            rollups_table().query,
+            KeyConditionExpression=Key('hospital_id').eq(str(hospital_id)) & Key('date').between(start_date, end_date),
+        ))
+
+    if not hospital_ids:
+        return []
+    rows = []
+    for items in run_concurrently(*[lambda h=hospital_id: hospital_rollups(h) for hospital_id in hospital_ids]):
+        for item in items:
+            row = {'hospital_id': item['hospital_id'], 'date': item['date'], 'rooms': len(item.get('rooms', ()))}
+            row.update({counter: int(item.get(counter, 0)) for counter in ROLLUP_COUNTERS})
+            rows.append(row)
+    rows.sort(key=lambda row: (row['date'], row['hospital_id']))
+    return rows
@@ -0,0 +1,439 @@
+"""Reads and writes of board rooms across the Whiteboard -> Rooms cutover.
+
+The legacy Whiteboard table is keyed by Room alone, so two hospitals can't
+both have a "Room 1", and older items spell provider and surgeon several
+ways. The Rooms table is keyed by (hospital_id, room) and every item uses
+the same attribute names (ROOM_ATTRIBUTES). Views only ever see items in
+that normalized shape; WHITEBOARD_STORAGE decides where they live:
+
+- 'legacy': read and write Whiteboard only.
+- 'dual': write both tables and read Rooms, falling back to Whiteboard for
+  rooms `manage.py migrate_whiteboard` hasn't copied yet. Whiteboard only gets
+  rooms it can hold without clobbering another hospital's room.
+- 'rooms': read and write Rooms only.
+
+Every write stamps the item with a new `version`, which rendered board rows
+are cached under, and the hospital's next change `sequence`. The sequence is
+advanced in the same transaction as the room write (see _sequenced), so a
+board read after the sequence (see sequenced_hospital_rooms) has every change
+up to it, and `changed_since` can hand clients just the rooms written after
+one they saw.
+"""
+import logging
+import random
+import time
+
+from boto3.dynamodb.conditions import Key
+from django.conf import settings
+
+from .dynamo import (
+    ConditionFailed, TransactionConflict, batch_get_items, paginate, projection, query_hospital_rooms, rooms_table,
+    run_concurrently, scan_all_rooms, sequences_table, transact_write, whiteboard_table,
+)
+
+logger = logging.getLogger(__name__)
+
+LEGACY_STORAGE = 'legacy'
+DUAL_STORAGE = 'dual'
+ROOMS_STORAGE = 'rooms'
+
+# Every attribute a Rooms item has
+ROOM_ATTRIBUTES = ['hospital_id', 'room', 'provider', 'surgeon', 'staff_id', 'version', 'sequence']
+# Whiteboard attributes each of them may be read from
+LEGACY_ATTRIBUTES = {
+    'hospital_id': ['hospital_id'],
+    'room': ['Room'],
+    'provider': ['Provider', 'provider', 'provider_name'],
+    'surgeon': ['Surgeon', 'surgeon', 'surgeon_name'],
+    'staff_id': ['Staff'],
+    'version': ['version'],
+    'sequence': ['sequence'],
+}
+
+# Attempts at a room write when other writes to the same board keep taking the next sequence
+SEQUENCE_ATTEMPTS = 5
+# TransactWriteItems takes at most 100 actions; one of them advances the sequence
+TRANSACTION_ROOM_ACTIONS = 99
+
+
+class SequenceConflict(Exception):
+    """Other writes to a hospital's board kept taking the next change sequence first.
+
+    `written` are the rooms a put_rooms call had already written when it gave up.
+    """
+
+    written = ()
+
+
+class RoomsTaken(Exception):
+    """Rooms a hospital tried to write are held by another hospital in the legacy table.
+
+    `written` are the rooms a put_rooms call had already written when it stopped.
+    """
+
+    def __init__(self, rooms, written=()):
+        super().__init__(f"Already used by another hospital: {', '.join(rooms)}")
+        self.rooms = rooms
+        self.written = list(written)
+
+
+def storage_mode():
+    return settings.WHITEBOARD_STORAGE
+
+
+def new_version():
+    """Microseconds since the epoch: each write gets a higher version without reading the old one."""
+    return time.time_ns() // 1000
+
+
+def room_item(hospital_id, room, provider, surgeon, staff_id, version=None, sequence=None):
+    return {
+        'hospital_id': str(hospital_id),
+        'room': room,
+        'provider': provider or '',
+        'surgeon': surgeon or '',
+        'staff_id': staff_id or '',
+        'version': version,
+        'sequence': sequence,
+    }
+
+
+def stamped(item):
+    """A copy of `item` carrying a fresh version, ready to write."""
+    return dict(item, version=new_version())
+
+
+def from_legacy(item):
+    """Normalize a Whiteboard item, whichever provider/surgeon spelling it uses."""
+    return room_item(
+        item.get('hospital_id', ''),
+        item['Room'],
+        item.get('Provider') or item.get('provider') or item.get('provider_name', ''),
+        item.get('Surgeon') or item.get('surgeon') or item.get('surgeon_name', ''),
+        item.get('Staff', ''),
+        # Items written before versions and sequences existed have none
+        item.get('version'),
+        item.get('sequence'),
+    )
+
+
+def to_legacy(item):
+    return {
+        'Room': item['room'],
+        'Provider': item['provider'],
+        'Surgeon': item['surgeon'],
+        'Staff': item['staff_id'],
+        'hospital_id': item['hospital_id'],
+        'version': item['version'],
+        'sequence': item['sequence'],
+    }
+
+
+def _legacy_hospital_rooms(hospital_id, attributes):
+    legacy_attributes = [legacy for attribute in attributes for legacy in LEGACY_ATTRIBUTES[attribute]]
+    return [from_legacy(item) for item in query_hospital_rooms(hospital_id, legacy_attributes) if 'Room' in item]
+
+
+def _rooms_table_hospital_rooms(hospital_id, attributes, consistent=False):
+    return list(paginate(
+        rooms_table().query,
+        KeyConditionExpression=Key('hospital_id').eq(str(hospital_id)),
+        ConsistentRead=consistent,
+        **projection(attributes),
+    ))
+
+
+def _merge(rooms_items, legacy_items):
+    """Rooms items win; legacy items fill in rooms that haven't been migrated."""
+    merged = {(item['hospital_id'], item['room']): item for item in legacy_items}
+    merged.update({(item['hospital_id'], item['room']): item for item in rooms_items})
+    return list(merged.values())
+
+
+def hospital_rooms(hospital_id, attributes=ROOM_ATTRIBUTES, consistent=False):
+    """Every room on one hospital's board, normalized.
+
+    Only `attributes` (and the hospital_id and room keys) are read from DynamoDB;
+    legacy items still come back with every attribute, blank where not read.
+    `consistent` makes the Rooms query strongly consistent; Whiteboard is read
+    through its hospital_id index, which can't be.
+    """
+    attributes = ['hospital_id', 'room'] + [
+        attribute for attribute in attributes if attribute not in ('hospital_id', 'room')
+    ]
+    mode = storage_mode()
+    if mode == ROOMS_STORAGE:
+        return _rooms_table_hospital_rooms(hospital_id, attributes, consistent)
+    if mode == LEGACY_STORAGE:
+        return _legacy_hospital_rooms(hospital_id, attributes)
+    return _merge(*run_concurrently(
+        lambda: _rooms_table_hospital_rooms(hospital_id, attributes, consistent),
+        lambda: _legacy_hospital_rooms(hospital_id, attributes),
+    ))
+
+
+def all_rooms():
+    """Every room of every hospital. Only for callers that are not scoped to a hospital."""
+    mode = storage_mode()
+    rooms_items, legacy_items = [], []
+    if mode != LEGACY_STORAGE:
+        rooms_items = list(paginate(rooms_table().scan, **projection(ROOM_ATTRIBUTES)))
+    if mode != ROOMS_STORAGE:
+        legacy_items = [from_legacy(item) for item in scan_all_rooms() if 'Room' in item]
+    return _merge(rooms_items, legacy_items)
+
+
+def get_room(hospital_id, room):
+    """One hospital's room, normalized, or None."""
+    if storage_mode() != LEGACY_STORAGE:
+        item = rooms_table().get_item(Key={'hospital_id': str(hospital_id), 'room': room}).get('Item')
+        if item is not None or storage_mode() == ROOMS_STORAGE:
+            return item
+    item = whiteboard_table().get_item(Key={'Room': room}).get('Item')
+    if item is None or item.get('hospital_id') != str(hospital_id):
+        return None
+    return from_legacy(item)
+
+
+def _mirror_to_legacy(item):
+    """Best-effort copy of a dual-written room into Whiteboard, unless another hospital holds it there."""
+    try:
+        whiteboard_table().put_item(
+            Item=to_legacy(item),
+            ConditionExpression='attribute_not_exists(#room) OR #hospital = :hospital',
+            ExpressionAttributeNames={'#room': 'Room', '#hospital': 'hospital_id'},
+            ExpressionAttributeValues={':hospital': item['hospital_id']},
+        )
+    except whiteboard_table().meta.client.exceptions.ConditionalCheckFailedException:
+        logger.info("Room held by another hospital in Whiteboard, not mirrored",
+                    extra={'hospital_id': item['hospital_id'], 'room': item['room']})
+
+
+def current_sequence(hospital_id):
+    """The sequence of the hospital's latest board change, 0 before the first."""
+    item = sequences_table().get_item(Key={'hospital_id': str(hospital_id)}, ConsistentRead=True).get('Item')
+    return int(item['sequence']) if item else 0
+
+
+def _sequenced(hospital_id, count, actions):
+    """Write `count` changes to a hospital's board in one transaction that also advances its sequence.
+
+    `actions(first)` returns the transaction's room actions, numbering the
+    changes first, first + 1, .... The sequence only moves if it is still
+    where it was read, so when another write gets there first (or is still
+    writing it, which DynamoDB reports as a TransactionConflict) this reads it
+    again and retries. Raises ConditionFailed (with indexes into the room
+    actions) when a room action's own condition fails.
+    """
+    for attempt in range(SEQUENCE_ATTEMPTS):
+        current = current_sequence(hospital_id)
+        advance = {'Update': {
+            'TableName': settings.BOARD_SEQUENCES_TABLE,
+            'Key': {'hospital_id': str(hospital_id)},
+            'UpdateExpression': 'SET #sequence = :next',
+            'ConditionExpression': 'attribute_not_exists(#sequence) OR #sequence = :current',
+            'ExpressionAttributeNames': {'#sequence': 'sequence'},
+            'ExpressionAttributeValues': {':current': current, ':next': current + count},
+        }}
+        try:
+            transact_write(advance, *actions(current + 1))
+            return
+        except ConditionFailed as e:
+            failed = [index - 1 for index in e.indexes if index > 0]
+            if failed:
+                raise ConditionFailed(failed) from e
+        except TransactionConflict:
+            pass
+        # Back off a little, so writers racing for the same board don't collide again
+        time.sleep(random.uniform(0, 0.02 * (attempt + 1)))
+    raise SequenceConflict(f"Could not get a change sequence for hospital {hospital_id}; try again.")
+
+
+def _legacy_update(item):
+    """SET rather than put, so attributes other code keeps on the Whiteboard item survive.
+
+    Room is Whiteboard's whole key, so the update only applies if the room is
+    new or already this hospital's; it can't move another hospital's room.
+    """
+    return {'Update': {
+        'TableName': settings.WHITEBOARD_TABLE,
+        'Key': {'Room': item['room']},
+        'UpdateExpression': 'SET Provider = :p, Surgeon = :s, Staff = :st, hospital_id = :h, version = :v, #sequence = :q',
+        'ConditionExpression': 'attribute_not_exists(#room) OR hospital_id = :h',
+        'ExpressionAttributeNames': {'#sequence': 'sequence', '#room': 'Room'},
+        'ExpressionAttributeValues': {
+            ':p': item['provider'],
+            ':s': item['surgeon'],
+            ':st': item['staff_id'],
+            ':h': item['hospital_id'],
+            ':v': item['version'],
+            ':q': item['sequence'],
+        },
+    }}
+
+
+def save_room(item):
+    """Create or replace a room. Returns the item as written, with its new version and sequence.
+
+    In legacy mode, raises ConditionFailed if another hospital holds the room.
+    """
+    item = stamped(item)
+    mode = storage_mode()
+
+    def actions(sequence):
+        item['sequence'] = sequence
+        if mode == LEGACY_STORAGE:
+            return [_legacy_update(item)]
+        return [{'Put': {'TableName': settings.ROOMS_TABLE, 'Item': item}}]
+
+    _sequenced(item['hospital_id'], 1, actions)
+    if mode == DUAL_STORAGE:
+        _mirror_to_legacy(item)
+    return item
+
+
+def add_room(item):
+    """Create a room, raising ConditionFailed if the hospital already has one by that name.
+
+    Returns the item as written, with its version and sequence.
+    """
+    item = stamped(item)
+    mode = storage_mode()
+
+    def actions(sequence):
+        item['sequence'] = sequence
+        if mode == LEGACY_STORAGE:
+            return [{'Put': {
+                'TableName': settings.WHITEBOARD_TABLE,
+                'Item': to_legacy(item),
+                'ConditionExpression': 'attribute_not_exists(#room)',
+                'ExpressionAttributeNames': {'#room': 'Room'},
+            }}]
+        put = {'Put': {
+            'TableName': settings.ROOMS_TABLE,
+            'Item': item,
+            'ConditionExpression': 'attribute_not_exists(#room)',
+            'ExpressionAttributeNames': {'#room': 'room'},
+        }}
+        if mode == ROOMS_STORAGE:
+            return [put]
+        # Mid-cutover the room may only exist in Whiteboard, so check both in one transaction
+        return [put, {'ConditionCheck': {
+            'TableName': settings.WHITEBOARD_TABLE,
+            'Key': {'Room': item['room']},
+            'ConditionExpression': 'attribute_not_exists(#room) OR #hospital <> :hospital',
+            'ExpressionAttributeNames': {'#room': 'Room', '#hospital': 'hospital_id'},
+            'ExpressionAttributeValues': {':hospital': item['hospital_id']},
+        }}]
+
+    _sequenced(item['hospital_id'], 1, actions)
+    if mode == DUAL_STORAGE:
+        _mirror_to_legacy(item)
+    return item
+
+
+def put_rooms(hospital_id, items):
+    """Create or replace a batch of one hospital's rooms.
+
+    Rooms are written in as few transactions as TransactWriteItems allows, each
+    advancing the hospital's sequence. Returns the items as written (with their
+    versions and sequences) and the items that couldn't be written. In legacy
+    mode, raises RoomsTaken rather than overwrite another hospital's rooms,
+    including rooms another hospital claims after they were checked; in dual
+    mode those rooms are just left out of Whiteboard. A chunk DynamoDB turns
+    away (throttled, or its transaction cancelled) is counted as not written;
+    any other error, SequenceConflict included, is raised.
+    """
+    items = [stamped(item) for item in items]
+    mode = storage_mode()
+    errors = rooms_table().meta.client.exceptions
+    rejected = (
+        errors.TransactionCanceledException, errors.TransactionInProgressException,
+        errors.ProvisionedThroughputExceededException, errors.RequestLimitExceeded, errors.InternalServerError,
+    )
+    taken = []
+    if mode != ROOMS_STORAGE:
+        # Room is Whiteboard's key, so find rooms another hospital already holds there
+        existing = batch_get_items(
+            whiteboard_table(), [{'Room': item['room']} for item in items], attributes=['Room', 'hospital_id']
+        )
+        taken = sorted(item['Room'] for item in existing if item.get('hospital_id') != str(hospital_id))
+        if taken and mode == LEGACY_STORAGE:
+            raise RoomsTaken(taken)
+
+    def room_actions(item):
+        actions = []
+        if mode != ROOMS_STORAGE and item['room'] not in taken:
+            actions.append({'Put': {
+                'TableName': settings.WHITEBOARD_TABLE,
+                'Item': to_legacy(item),
+                'ConditionExpression': 'attribute_not_exists(#room) OR hospital_id = :h',
+                'ExpressionAttributeNames': {'#room': 'Room'},
+                'ExpressionAttributeValues': {':h': item['hospital_id']},
+            }})
+        if mode != LEGACY_STORAGE:
+            actions.append({'Put': {'TableName': settings.ROOMS_TABLE, 'Item': item}})
+        return actions
+
+    per_room = 1 if mode != DUAL_STORAGE else 2
+    chunk_size = TRANSACTION_ROOM_ACTIONS // per_room
+    written, unwritten = [], []
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+
+        def actions(first, chunk=chunk):
+            for offset, item in enumerate(chunk):
+                item['sequence'] = first + offset
+            return [action for item in chunk for action in room_actions(item)]
+
+        while True:
+            try:
+                _sequenced(hospital_id, len(chunk), actions)
+            except ConditionFailed as e:
+                # Only the Whiteboard puts have conditions: another hospital claimed the room since the read
+                owners = [item for item in chunk for _ in room_actions(item)]
+                claimed = sorted({owners[index]['room'] for index in e.indexes})
+                if mode == LEGACY_STORAGE:
+                    raise RoomsTaken(claimed, written) from e
+                taken.extend(claimed)
+                continue
+            except SequenceConflict as e:
+                e.written = written
+                raise
+            except rejected as e:
+                logger.error("Error writing rooms: %s", e, extra={'hospital_id': hospital_id, 'rooms': len(chunk)})
+                unwritten.extend(chunk)
+            else:
+                written.extend(chunk)
+            break
+    return items, unwritten
+
+
+def sequenced_hospital_rooms(hospital_id, attributes=ROOM_ATTRIBUTES):
+    """(sequence, rooms): the hospital's change sequence, then its board as of at least that change.
+
+    The sequence comes from a consistent read of BoardSequences before the
+    board is read, never from the rooms themselves: a board read can miss
+    a recent write while showing a later one, and a cursor taken from the
+    rooms would then skip the missed write for good.
+    """
+    sequence = current_sequence(hospital_id)
+    return sequence, hospital_rooms(hospital_id, attributes, consistent=True)
+
+
+def changed_since(items, sequence, since, max_gap):
+    """The rooms a client that has seen changes up to `since` needs to catch up to `sequence`.
+
+    `items` and `sequence` come from sequenced_hospital_rooms. Returns None
+    when the client should take the whole board instead: it is more than
+    `max_gap` changes behind, ahead of the board (the tables were reset), or
+    the board has rooms written before sequences existed, which a delta can't
+    account for. Whiteboard's hospital_id index can lag behind the sequence,
+    so in legacy mode the last DELTA_SYNC_INDEX_OVERLAP changes are sent
+    again in case one of them wasn't visible last time.
+    """
+    if since > sequence or sequence - since > max_gap or any(item.get('sequence') is None for item in items):
+        return None
+    if storage_mode() == LEGACY_STORAGE:
+        since -= settings.DELTA_SYNC_INDEX_OVERLAP
+    return [item for item in items if int(item['sequence']) > since]
@@ -0,0 +1,141 @@
+"""DynamoDB table layouts the app expects, for local stand-ins and setup commands."""
+from django.conf import settings
+
+from .dynamo import WHITEBOARD_BOARD_ATTRIBUTES
+
+
+def hospital_index(table_key_attributes=('Room',)):
+    """The hospital_id GSI on Whiteboard, projecting only what the board renders."""
+    return {
+        'IndexName': settings.WHITEBOARD_HOSPITAL_INDEX,
+        'KeySchema': [{'AttributeName': 'hospital_id', 'KeyType': 'HASH'}],
+        'Projection': {
+            'ProjectionType': 'INCLUDE',
+            # Key attributes are always projected and may not be listed
+            'NonKeyAttributes': [
+                attribute for attribute in WHITEBOARD_BOARD_ATTRIBUTES
+                if attribute not in table_key_attributes and attribute != 'hospital_id'
+            ],
+        },
+    }
+
+
+def assignment_history_index():
+    """The (hospital_id, date) GSI on RoomAssignments used for history queries and exports."""
+    return {
+        'IndexName': settings.ROOM_ASSIGNMENTS_HISTORY_INDEX,
+        'KeySchema': [
+            {'AttributeName': 'hospital_id', 'KeyType': 'HASH'},
+            {'AttributeName': 'date', 'KeyType': 'RANGE'},
+        ],
+        'Projection': {'ProjectionType': 'ALL'},
+    }
+
+
+def table_definitions():
+    """create_table kwargs for every table, using on-demand billing."""
+    return [
+        {
+            'TableName': settings.WHITEBOARD_TABLE,
+            'KeySchema': [{'AttributeName': 'Room', 'KeyType': 'HASH'}],
+            'AttributeDefinitions': [
+                {'AttributeName': 'Room', 'AttributeType': 'S'},
+                {'AttributeName': 'hospital_id', 'AttributeType': 'S'},
+            ],
+            'GlobalSecondaryIndexes': [hospital_index()],
+            'BillingMode': 'PAY_PER_REQUEST',
+        },
+        {
+            'TableName': settings.ROOMS_TABLE,
+            'KeySchema': [
+                {'AttributeName': 'hospital_id', 'KeyType': 'HASH'},
+                {'AttributeName': 'room', 'KeyType': 'RANGE'},
+            ],
+            'AttributeDefinitions': [
+                {'AttributeName': 'hospital_id', 'AttributeType': 'S'},
+                {'AttributeName': 'room', 'AttributeType': 'S'},
+            ],
+            'BillingMode': 'PAY_PER_REQUEST',
+        },
+        {
+            'TableName': settings.STAFF_TABLE,
+            'KeySchema': [{'AttributeName': 'staff_id', 'KeyType': 'HASH'}],
+            'AttributeDefinitions': [{'AttributeName': 'staff_id', 'AttributeType': 'S'}],
+            'BillingMode': 'PAY_PER_REQUEST',
+        },
+        {
+            'TableName': settings.ROOM_ASSIGNMENTS_TABLE,
+            'KeySchema': [{'AttributeName': 'assignment_id', 'KeyType': 'HASH'}],
+            'AttributeDefinitions': [
+                {'AttributeName': 'assignment_id', 'AttributeType': 'S'},
+                {'AttributeName': 'hospital_id', 'AttributeType': 'S'},
+                {'AttributeName': 'date', 'AttributeType': 'S'},
+            ],
+            'GlobalSecondaryIndexes': [assignment_history_index()],
+            'BillingMode': 'PAY_PER_REQUEST',
+        },
+        {
+            'TableName': settings.ASSIGNMENT_ROLLUPS_TABLE,
+            'KeySchema': [
+                {'AttributeName': 'hospital_id', 'KeyType': 'HASH'},
+                {'AttributeName': 'date', 'KeyType': 'RANGE'},
+            ],
+            'AttributeDefinitions': [
+                {'AttributeName': 'hospital_id', 'AttributeType': 'S'},
+                {'AttributeName': 'date', 'AttributeType': 'S'},
+            ],
+            'BillingMode': 'PAY_PER_REQUEST',
+        },
+        {
+            'TableName': settings.BOARD_SEQUENCES_TABLE,
+            'KeySchema': [{'AttributeName': 'hospital_id', 'KeyType': 'HASH'}],
+            'AttributeDefinitions': [{'AttributeName': 'hospital_id', 'AttributeType': 'S'}],
+            'BillingMode': 'PAY_PER_REQUEST',
+        },
+    ]
+
+
+def add_index(table, index, attribute_definitions, read_capacity=5, write_capacity=5):
+    """Add a GSI to an existing table unless it is already there. Returns True if creation started.
+
+    Capacities only apply to provisioned tables; on-demand indexes don't take them.
+    """
+    client = table.meta.client
+    description = client.describe_table(TableName=table.name)['Table']
+    existing = {existing['IndexName'] for existing in description.get('GlobalSecondaryIndexes', [])}
+    if index['IndexName'] in existing:
+        return False
+    index = dict(index)
+    if description.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+        index['ProvisionedThroughput'] = {
+            'ReadCapacityUnits': read_capacity,
+            'WriteCapacityUnits': write_capacity,
+        }
+    client.update_table(
+        TableName=table.name,
+        AttributeDefinitions=attribute_definitions,
+        GlobalSecondaryIndexUpdates=[{'Create': index}],
+    )
+    return True
+
+
+def create_tables(client, existing_ok=True):
+    """Create any missing tables and wait until they are ACTIVE. Returns the names created."""
+    existing = set(client.list_tables().get('TableNames', [])) if existing_ok else set()
+    created = []
+    for definition in table_definitions():
+        if definition['TableName'] in existing:
+            continue
+        client.create_table(**definition)
+        created.append(definition['TableName'])
+    for name in created:
+        client.get_waiter('table_exists').wait(TableName=name)
+    return created
+
+
+def delete_tables(client):
+    """Drop every app table that exists. Only meant for local stand-ins."""
+    existing = set(client.list_tables().get('TableNames', []))
+    for definition in table_definitions():
+        if definition['TableName'] in existing:
+            client.delete_table(TableName=definition['TableName'])
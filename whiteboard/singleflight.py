@@ -0,0 +1,64 @@
+"""Coalesce concurrent loads of the same key and keep the result for a moment.
+
+A dozen OR displays polling one hospital's board would otherwise each run
+their own DynamoDB reads. With a SingleFlight, requests that arrive while a
+load for the same key is running wait for it and share its result, and
+requests in the next `ttl` seconds get that result without a load at all.
+
+Everything here is per process. `invalidate()` after a write makes the next
+request load afresh; other workers can serve the old result for up to `ttl`.
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> generation, bumped by invalidate() so older loads can't be cached or joined
+        self._generations = {}
+        # (key, generation) -> Future of the load in progress
+        self._flights = {}
+        # key -> (generation, expires_at, value)
+        self._results = {}
+
+    def get(self, key, load):
+        """`load()`'s result for `key`, shared with concurrent and very recent callers.
+
+        Exceptions from `load` reach every caller waiting on it and aren't cached.
+        Callers share one object, so they must not modify it.
+        """
+        with self._lock:
+            generation = self._generations.get(key, 0)
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == generation and cached[1] > time.monotonic():
+                return cached[2]
+            flight = self._flights.get((key, generation))
+            leader = flight is None
+            if leader:
+                flight = self._flights[(key, generation)] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                del self._flights[(key, generation)]
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            del self._flights[(key, generation)]
+            # A write that landed during the load may not be in `value`
+            if self._generations.get(key, 0) == generation:
+                self._results[key] = (generation, time.monotonic() + self.ttl, value)
+        flight.set_result(value)
+        return value
+
+    def invalidate(self, key):
+        """Forget `key`'s result; the next get() loads again instead of joining a load already running."""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._results.pop(key, None)
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .dynamo import batch_get_items, paginate, staff_table
+
+logger = logging.getLogger(__name__)
+
+STAFF_CACHE_KEY = 'staff-directory'
+STAFF_VERSION_KEY = 'staff-directory-version'
+
+# Staff attributes the board needs to label a room
+STAFF_BOARD_ATTRIBUTES = ['staff_id', 'name', 'role']
+
+# Stops several threads in one worker from scanning Staff at the same time on a miss
+_reload_lock = threading.Lock()
+
+# This worker's indexed copy of the current snapshot: (cache key, built at, StaffDirectory)
+_directory = None
+
+
+class StaffDirectory:
+    """Immutable, indexed view of one Staff snapshot.
+
+    Lookups by id are O(1), and the staff at each location and the ids holding
+    each role and sub_role are grouped once when the directory is built.
+    """
+
+    def __init__(self, staff, version=None):
+        self.version = version
+        by_id = {}
+        by_location = {}
+        ids_by_role = {}
+        ids_by_sub_role = {}
+        for member in sorted(staff, key=lambda member: (member.get('name', ''), member['staff_id'])):
+            member = MappingProxyType(dict(member))
+            by_id[member['staff_id']] = member
+            by_location.setdefault(str(member.get('location_id', '')), []).append(member)
+            ids_by_role.setdefault(member.get('role', ''), set()).add(member['staff_id'])
+            ids_by_sub_role.setdefault(member.get('sub_role', ''), set()).add(member['staff_id'])
+        self._by_id = MappingProxyType(by_id)
+        self._by_location = MappingProxyType({key: tuple(members) for key, members in by_location.items()})
+        self._ids_by_role = MappingProxyType({key: frozenset(ids) for key, ids in ids_by_role.items()})
+        self._ids_by_sub_role = MappingProxyType({key: frozenset(ids) for key, ids in ids_by_sub_role.items()})
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __contains__(self, staff_id):
+        return staff_id in self._by_id
+
+    def get(self, staff_id, default=None):
+        return self._by_id.get(staff_id, default)
+
+    def at_location(self, location_id):
+        """Staff whose location_id is `location_id` (a hospital id), sorted by name."""
+        return self._by_location.get(str(location_id), ())
+
+    def ids_with_role(self, role):
+        return self._ids_by_role.get(role, frozenset())
+
+    def ids_with_sub_role(self, sub_role):
+        return self._ids_by_sub_role.get(sub_role, frozenset())
+
+
+def staff_cache():
+    return caches[settings.STAFF_CACHE_ALIAS]
+
+
+def staff_cache_is_shared():
+    """False for a per-process cache, which invalidate_staff_cache can only clear in its own process."""
+    return not settings.CACHES[settings.STAFF_CACHE_ALIAS]['BACKEND'].endswith('LocMemCache')
+
+
+def staff_cache_version():
+    """Current directory version. Cached snapshots are keyed by it."""
+    cache = staff_cache()
+    version = cache.get(STAFF_VERSION_KEY)
+    if version is None:
+        # add() so two workers starting together agree on the first version
+        cache.add(STAFF_VERSION_KEY, 1, timeout=None)
+        version = cache.get(STAFF_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_staff_cache():
+    """Bump the directory version so every worker reloads Staff on its next read.
+
+    Call this after anything writes to the Staff table. Other processes only
+    see the new version through a shared cache (see staff_cache_is_shared).
+    """
+    cache = staff_cache()
+    try:
+        version = cache.incr(STAFF_VERSION_KEY)
+    except ValueError:
+        # The version key was never set or has been evicted
+        version = staff_cache_version() + 1
+        cache.set(STAFF_VERSION_KEY, version, timeout=None)
+    logger.info("Staff directory cache invalidated, now at version %s", version)
+    return version
+
+
+def load_staff_directory():
+    """Return every Staff item, reading the table at most once per STAFF_CACHE_TTL."""
+    cache = staff_cache()
+    key = f"{STAFF_CACHE_KEY}:{staff_cache_version()}"
+    staff = cache.get(key)
+    if staff is not None:
+        return staff
+    with _reload_lock:
+        # Another thread may have reloaded while we waited for the lock
+        staff = cache.get(key)
+        if staff is None:
+            staff = list(paginate(staff_table().scan))
+            cache.set(key, staff, timeout=settings.STAFF_CACHE_TTL)
+            logger.info("Loaded %d staff members into the directory cache (%s)", len(staff), key)
+    return staff
+
+
+def get_staff_directory():
+    """This worker's StaffDirectory for the current snapshot, rebuilt only when it changes."""
+    global _directory
+    key = f"{STAFF_CACHE_KEY}:{staff_cache_version()}"
+    current = _directory
+    if current is not None and current[0] == key and time.monotonic() - current[1] < settings.STAFF_CACHE_TTL:
+        return current[2]
+    directory = StaffDirectory(load_staff_directory(), version=key)
+    _directory = (key, time.monotonic(), directory)
+    return directory
+
+
+def resolve_staff(staff_ids):
+    """Return {staff_id: staff} for just the ids referenced on a board."""
+    staff_ids = {staff_id for staff_id in staff_ids if staff_id}
+    items = batch_get_items(
+        staff_table(),
+        [{'staff_id': staff_id} for staff_id in staff_ids],
+        attributes=STAFF_BOARD_ATTRIBUTES,
+    )
+    return {staff['staff_id']: staff for staff in items}
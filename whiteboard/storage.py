@@ -0,0 +1,56 @@
+"""Static files storage that fingerprints files and writes pre-compressed copies.
+
+`collectstatic` saves every file under a content-hashed name (so it can be
+cached forever) and next to it `<name>.gz` and `<name>.br`, which the proxy
+serves as they are instead of compressing on every request.
+"""
+import gzip
+import logging
+
+import brotli
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Already-compressed formats (images, fonts) gain nothing from another pass
+    compress_extensions = ('.css', '.js', '.map', '.svg', '.txt', '.json', '.html')
+    # Below this, the compressed copy isn't worth the extra request negotiation
+    compress_min_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = {}
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                # Later passes over files that reference each other replace earlier names
+                hashed_names[name] = hashed_name
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        written = sum(self.compress(hashed_name) for hashed_name in hashed_names.values())
+        logger.info("Wrote %d compressed static files", written)
+
+    def compress(self, name):
+        """Write gzip and brotli copies of `name` when they are smaller. Returns how many were written."""
+        if not name.endswith(self.compress_extensions):
+            return 0
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < self.compress_min_size:
+            return 0
+        written = 0
+        # mtime=0 keeps the .gz identical between runs over the same file
+        for suffix, compressed in (
+            ('.gz', gzip.compress(content, compresslevel=9, mtime=0)),
+            ('.br', brotli.compress(content, mode=brotli.MODE_TEXT)),
+        ):
+            if len(compressed) >= len(content):
+                continue
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(compressed))
+            written += 1
+        return written
@@ -1,3 +1,1367 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from moto import mock_aws
+
+from . import audit, aws, cognito, dynamo, rooms, staff, views
+from .audit import AssignmentWriter
+from .compression import SyncGZipMiddleware
+from .events import CacheBroker, InProcessBroker
+from .hierarchy import HospitalNode, get_hierarchy
+from .instrumentation import SamplingFilter, current_timings, phase
+from .management.commands import migrate_whiteboard
+from .models import ApiToken, CustomUser, Division, Hospital
+from .rollups import apply_assignments, read_rollups, rebuild_rollups, summarize
+from .rooms import add_room, changed_since, current_sequence, get_room, room_item, save_room, sequenced_hospital_rooms
+from .schema import create_tables
+from .singleflight import SingleFlight
+from .staff import StaffDirectory, staff_cache
+from .views import fetch_division_boards
+
+
+# Pages render without running collectstatic first
+PLAIN_STATIC_FILES = override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+class DynamoTestCase(TestCase):
+    """Runs each test against a fresh in-memory DynamoDB with every app table."""
+
+    def setUp(self):
+        super().setUp()
+        aws_mock = mock_aws()
+        aws_mock.start()
+        self.addCleanup(aws_mock.stop)
+        aws.reset()
+        self.addCleanup(aws.reset)
+        create_tables(aws.get_client('dynamodb'))
+        # Views record assignments; keep them in this DynamoDB and out of the real spill file
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        writer = AssignmentWriter(Path(directory.name) / 'spill.jsonl', flush_interval=0.01)
+        writer_patch = mock.patch.object(audit, '_writer', writer)
+        writer_patch.start()
+        self.addCleanup(writer_patch.stop)
+        self.addCleanup(writer.shutdown)
+        # Ids restart in every test, so nothing cached under them may carry over
+        cache.clear()
+        staff_cache().clear()
+        board_loads = mock.patch.object(views, 'board_loads', SingleFlight(settings.BOARD_CACHE_TTL))
+        board_loads.start()
+        self.addCleanup(board_loads.stop)
+
+
+def request_pool(workers):
+    """Swap in a request pool of `workers` threads for the rest of the test."""
+    def swap(test):
+        previous = dynamo._request_executor
+        dynamo._request_executor = None
+        settings_override = override_settings(DYNAMODB_REQUEST_WORKERS=workers)
+        settings_override.enable()
+
+        def restore():
+            if dynamo._request_executor is not None:
+                # Cancelling queued work frees threads a deadlocked test left waiting
+                dynamo._request_executor.shutdown(wait=False, cancel_futures=True)
+            dynamo._request_executor = previous
+            settings_override.disable()
+        test.addCleanup(restore)
+    return swap
+
+
+def sign_in(client, hospital, role='end_user'):
+    """Log `client` in as a user of the hospital's division, with the hospital selected."""
+    user = CustomUser.objects.create_user(f'{role}-{hospital.id}@example.com', 'password', role=role)
+    user.assigned_divisions.add(hospital.division)
+    client.force_login(user)
+    session = client.session
+    session['selected_division_id'] = hospital.division_id
+    session['selected_hospital_id'] = hospital.id
+    session.save()
+    return user
+
+
+def finishes(call, timeout=10):
+    """Run `call` on a daemon thread; True if it returned within `timeout` seconds."""
+    thread = threading.Thread(target=call, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+class UsingEndpointTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(aws.reset)
+
+    def endpoint(self):
+        return aws.get_client('dynamodb').meta.endpoint_url
+
+    @override_settings(AWS_ENDPOINT_URLS={'dynamodb': 'http://localhost:8000'})
+    def test_the_endpoint_applies_only_inside_the_block(self):
+        aws.reset()
+        with aws.using_endpoint('dynamodb', 'http://localhost:9000'):
+            self.assertEqual(self.endpoint(), 'http://localhost:9000')
+            with aws.using_endpoint('dynamodb', ''):
+                self.assertEqual(self.endpoint(), f'https://dynamodb.{settings.AWS_REGION}.amazonaws.com')
+            self.assertEqual(self.endpoint(), 'http://localhost:9000')
+        self.assertEqual(self.endpoint(), 'http://localhost:8000')
+
+
+class RunConcurrentlyTests(SimpleTestCase):
+    def setUp(self):
+        request_pool(2)(self)
+
+    def test_results_come_back_in_order(self):
+        self.assertEqual(dynamo.run_concurrently(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3])
+
+    def test_nested_calls_do_not_exhaust_the_pool(self):
+        results = []
+
+        def outer(n):
+            return dynamo.run_concurrently(lambda: n, lambda: n * 10)
+
+        self.assertTrue(finishes(lambda: results.extend(
+            dynamo.run_concurrently(*[lambda n=n: outer(n) for n in range(4)])
+        )))
+        self.assertEqual(results, [[0, 0], [1, 10], [2, 20], [3, 30]])
+
+
+class BatchGetTests(SimpleTestCase):
+    def setUp(self):
+        self.dynamodb = mock.Mock()
+        self.table = mock.Mock(meta=mock.Mock(client=self.dynamodb))
+        self.table.name = 'Staff'
+        sleep = mock.patch.object(dynamo.time, 'sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def keys(self, *ids):
+        return [{'staff_id': staff_id} for staff_id in ids]
+
+    def answer(self, found, unprocessed=()):
+        response = {'Responses': {'Staff': found}}
+        if unprocessed:
+            response['UnprocessedKeys'] = {'Staff': {'Keys': list(unprocessed)}}
+        return response
+
+    def test_unprocessed_keys_are_retried(self):
+        self.dynamodb.batch_get_item.side_effect = [
+            self.answer(self.keys('a'), unprocessed=self.keys('b')),
+            self.answer(self.keys('b')),
+        ]
+        self.assertEqual(dynamo.batch_get_items(self.table, self.keys('a', 'b')), self.keys('a', 'b'))
+        retry = self.dynamodb.batch_get_item.call_args_list[1].kwargs['RequestItems']
+        self.assertEqual(retry, {'Staff': {'Keys': self.keys('b')}})
+        self.assertEqual(self.sleep.call_count, 1)
+
+    @override_settings(DYNAMODB_BATCH_MAX_RETRIES=2)
+    def test_keys_still_unprocessed_after_the_last_retry_are_given_up(self):
+        self.dynamodb.batch_get_item.return_value = self.answer([], unprocessed=self.keys('b'))
+        with self.assertLogs('whiteboard.dynamo', 'WARNING') as logs:
+            self.assertEqual(dynamo.batch_get_items(self.table, self.keys('b')), [])
+        self.assertEqual(self.dynamodb.batch_get_item.call_count, 3)
+        self.assertIn('Gave up on 1 unprocessed keys from Staff', logs.output[0])
+
+    def test_more_than_100_keys_are_split_into_chunks(self):
+        self.dynamodb.batch_get_item.side_effect = lambda RequestItems: self.answer(RequestItems['Staff']['Keys'])
+        keys = self.keys(*(f'{i:03}' for i in range(250)))
+        found = dynamo.batch_get_items(self.table, keys, attributes=['staff_id'])
+        self.assertEqual(sorted(item['staff_id'] for item in found), [key['staff_id'] for key in keys])
+        chunks = sorted(len(call.kwargs['RequestItems']['Staff']['Keys'])
+                        for call in self.dynamodb.batch_get_item.call_args_list)
+        self.assertEqual(chunks, [50, 100, 100])
+        self.assertIn('ProjectionExpression', self.dynamodb.batch_get_item.call_args.kwargs['RequestItems']['Staff'])
+
+
+@override_settings(WHITEBOARD_STORAGE='dual')
+class DivisionBoardTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        request_pool(2)(self)
+
+    def test_dual_mode_division_with_more_hospitals_than_workers(self):
+        for hospital_id in range(1, 5):
+            save_room(room_item(hospital_id, f'OR {hospital_id}', 'Dr. P', 'Dr. S', ''))
+        boards = {}
+        self.assertTrue(finishes(lambda: boards.update(fetch_division_boards([1, 2, 3, 4]))))
+        self.assertEqual({hospital_id: list(board) for hospital_id, board in boards.items()},
+                         {hospital_id: [f'OR {hospital_id}'] for hospital_id in range(1, 5)})
+
+
+@override_settings(WHITEBOARD_STORAGE='rooms')
+class ChangeSequenceTests(DynamoTestCase):
+    def save(self, room, provider='Dr. P'):
+        return save_room(room_item(1, room, provider, 'Dr. S', ''))
+
+    def test_each_write_takes_the_next_sequence(self):
+        self.assertEqual([self.save(room)['sequence'] for room in ('OR 1', 'OR 2', 'OR 1')], [1, 2, 3])
+        self.assertEqual(current_sequence(1), 3)
+        self.assertEqual(current_sequence(2), 0)
+
+    def test_transaction_conflicts_are_retried(self):
+        transact_write = rooms.transact_write
+        calls = []
+
+        def conflict_once(*actions):
+            calls.append(actions)
+            if len(calls) == 1:
+                raise dynamo.TransactionConflict("another write to the sequence was in progress")
+            return transact_write(*actions)
+
+        with mock.patch.object(rooms, 'transact_write', conflict_once), mock.patch.object(rooms.time, 'sleep'):
+            self.assertEqual(self.save('OR 1')['sequence'], 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_writers_that_keep_losing_the_sequence_give_up(self):
+        conflict = mock.Mock(side_effect=dynamo.ConditionFailed([0]))
+        with mock.patch.object(rooms, 'transact_write', conflict), mock.patch.object(rooms.time, 'sleep'):
+            with self.assertRaises(rooms.SequenceConflict):
+                self.save('OR 1')
+        self.assertEqual(conflict.call_count, rooms.SEQUENCE_ATTEMPTS)
+
+    def test_a_failed_room_condition_is_not_retried(self):
+        add_room(room_item(1, 'OR 1', 'Dr. A', 'Dr. S', ''))
+        with self.assertRaises(dynamo.ConditionFailed) as raised:
+            add_room(room_item(1, 'OR 1', 'Dr. B', 'Dr. S', ''))
+        # Indexes count room actions only, not the sequence update
+        self.assertEqual(raised.exception.indexes, [0])
+        self.assertEqual(current_sequence(1), 1)
+
+    def test_cursor_is_the_sequence_not_the_newest_room_read(self):
+        self.save('OR 1')
+        self.save('OR 2')
+        # A write the board read doesn't show yet
+        rooms.sequences_table().put_item(Item={'hospital_id': '1', 'sequence': 3})
+        sequence, items = sequenced_hospital_rooms(1)
+        self.assertEqual(sequence, 3)
+        self.assertEqual([item['room'] for item in changed_since(items, sequence, 1, 200)], ['OR 2'])
+
+    def test_snapshot_when_a_delta_cannot_be_worked_out(self):
+        for room in ('OR 1', 'OR 2', 'OR 3'):
+            self.save(room)
+        sequence, items = sequenced_hospital_rooms(1)
+        self.assertIsNone(changed_since(items, sequence, 0, 2))
+        self.assertIsNone(changed_since(items, sequence, 4, 200))
+        self.assertIsNone(changed_since(items + [room_item(1, 'OR 9', '', '', '')], sequence, 2, 200))
+        self.assertEqual(changed_since(items, sequence, 3, 200), [])
+
+    @override_settings(WHITEBOARD_STORAGE='legacy', DELTA_SYNC_INDEX_OVERLAP=1)
+    def test_legacy_deltas_repeat_recent_changes(self):
+        for room in ('OR 1', 'OR 2', 'OR 3'):
+            self.save(room)
+        sequence, items = sequenced_hospital_rooms(1)
+        self.assertEqual(sorted(item['room'] for item in changed_since(items, sequence, 2, 200)), ['OR 2', 'OR 3'])
+
+
+class MigrateWhiteboardTests(DynamoTestCase):
+    def legacy_room(self, room, provider, version=None):
+        item = {'Room': room, 'hospital_id': '1', 'Provider': provider, 'Surgeon': 'Dr. S', 'Staff': ''}
+        if version is not None:
+            item['version'] = version
+        dynamo.whiteboard_table().put_item(Item=item)
+
+    def rooms_item(self, room):
+        return dynamo.rooms_table().get_item(Key={'hospital_id': '1', 'room': room}).get('Item')
+
+    def test_rooms_saved_during_the_copy_are_not_overwritten(self):
+        self.legacy_room('OR 1', 'Dr. Stale', version=1)
+        self.legacy_room('OR 2', 'Dr. Unversioned')
+        self.legacy_room('OR 3', 'Dr. Old', version=1)
+        self.legacy_room('OR 4', 'Dr. Only Legacy')
+        # Saved in dual mode between the scan and the copy's write
+        for room, version in (('OR 1', 2), ('OR 2', 2), ('OR 3', 0)):
+            dynamo.rooms_table().put_item(Item=dict(room_item(1, room, 'Dr. Rooms', 'Dr. S', '', version=version)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('migrate_whiteboard', segments=2, checkpoint=f'{directory}/checkpoint.json',
+                         max_writes_per_second=0, stdout=io.StringIO(), stderr=io.StringIO())
+
+        self.assertEqual(self.rooms_item('OR 1')['provider'], 'Dr. Rooms')
+        self.assertEqual(self.rooms_item('OR 2')['provider'], 'Dr. Rooms')
+        self.assertEqual(self.rooms_item('OR 3')['provider'], 'Dr. Old')
+        self.assertEqual(self.rooms_item('OR 4')['provider'], 'Dr. Only Legacy')
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        # sleep() moves the clock on instead of waiting
+        self.now = 1000.0
+        clock = mock.patch.multiple(migrate_whiteboard.time, monotonic=lambda: self.now, sleep=self.sleep)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def test_a_page_larger_than_the_rate_takes_more_than_a_second(self):
+        limiter = migrate_whiteboard.RateLimiter(100)
+        limiter.acquire(500)
+        # The first second's worth is already in the bucket
+        self.assertAlmostEqual(self.now - 1000.0, 4.0)
+
+    def test_pages_are_paid_for_in_full(self):
+        limiter = migrate_whiteboard.RateLimiter(100)
+        for _ in range(3):
+            limiter.acquire(150)
+        self.assertAlmostEqual(self.now - 1000.0, 3.5)
+
+
+@override_settings(WHITEBOARD_STORAGE='legacy')
+class LegacySaveTests(DynamoTestCase):
+    def test_a_room_held_by_another_hospital_is_left_alone(self):
+        save_room(room_item(1, 'OR 1', 'Dr. A', 'Dr. S', ''))
+        with self.assertRaises(dynamo.ConditionFailed):
+            save_room(room_item(2, 'OR 1', 'Dr. B', 'Dr. S', ''))
+        self.assertEqual(get_room(1, 'OR 1')['provider'], 'Dr. A')
+        self.assertIsNone(get_room(2, 'OR 1'))
+        self.assertEqual(current_sequence(2), 0)
+
+    @PLAIN_STATIC_FILES
+    def test_editing_another_hospitals_room_is_refused(self):
+        division = Division.objects.create(name='Division')
+        hospital_a = Hospital.objects.create(name='A', division=division)
+        hospital_b = Hospital.objects.create(name='B', division=division)
+        save_room(room_item(hospital_a.id, 'OR 1', 'Dr. A', 'Dr. S', ''))
+
+        sign_in(self.client, hospital_b)
+        response = self.client.post('/edit/OR 1/', {'provider': 'Dr. B', 'surgeon': 'Dr. S', 'staff': ''}, follow=True)
+
+        self.assertContains(response, 'Room OR 1 not found in this hospital.')
+        self.assertEqual(get_room(hospital_a.id, 'OR 1')['provider'], 'Dr. A')
+
+
+class PutRoomsTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        with override_settings(WHITEBOARD_STORAGE='legacy'):
+            save_room(room_item(2, 'OR 2', 'Dr. Other', 'Dr. S', ''))
+        # ...but only after put_rooms checked which rooms other hospitals hold
+        missed = mock.patch.object(rooms, 'batch_get_items', return_value=[])
+        missed.start()
+        self.addCleanup(missed.stop)
+
+    def put(self):
+        return rooms.put_rooms(1, [room_item(1, room, 'Dr. P', 'Dr. S', '') for room in ('OR 1', 'OR 2')])
+
+    def legacy_provider(self, room):
+        return dynamo.whiteboard_table().get_item(Key={'Room': room})['Item']['Provider']
+
+    @override_settings(WHITEBOARD_STORAGE='legacy')
+    def test_legacy_rooms_claimed_after_the_check_are_not_overwritten(self):
+        with self.assertRaises(rooms.RoomsTaken) as raised:
+            self.put()
+        self.assertEqual(raised.exception.rooms, ['OR 2'])
+        self.assertEqual(self.legacy_provider('OR 2'), 'Dr. Other')
+        self.assertIsNone(get_room(1, 'OR 1'))
+
+    @override_settings(WHITEBOARD_STORAGE='dual')
+    def test_dual_mode_leaves_rooms_claimed_after_the_check_out_of_whiteboard(self):
+        items, unwritten = self.put()
+        self.assertEqual(unwritten, [])
+        self.assertEqual(get_room(1, 'OR 2')['provider'], 'Dr. P')
+        self.assertEqual(self.legacy_provider('OR 2'), 'Dr. Other')
+        self.assertEqual(self.legacy_provider('OR 1'), 'Dr. P')
+
+
+@override_settings(WHITEBOARD_STORAGE='rooms')
+class PutRoomsErrorTests(DynamoTestCase):
+    def put(self, error):
+        with mock.patch.object(rooms, 'transact_write', mock.Mock(side_effect=error)):
+            return rooms.put_rooms(1, [room_item(1, 'OR 1', 'Dr. P', 'Dr. S', '')])
+
+    def test_chunks_dynamodb_turns_away_are_reported_unwritten(self):
+        errors = dynamo.rooms_table().meta.client.exceptions
+        throttled = errors.ProvisionedThroughputExceededException(
+            {'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'Slow down'}}, 'TransactWriteItems'
+        )
+        items, unwritten = self.put(throttled)
+        self.assertEqual([item['room'] for item in unwritten], ['OR 1'])
+
+    def test_other_errors_are_raised(self):
+        for error in (rooms.SequenceConflict("busy board"), KeyError('sequence')):
+            with self.subTest(error=type(error).__name__), mock.patch.object(rooms.time, 'sleep'):
+                with self.assertRaises(type(error)):
+                    self.put(error)
+
+
+class BulkRowsTests(SimpleTestCase):
+    directory = StaffDirectory([{'staff_id': 'S1', 'name': 'CRNA One', 'role': 'CRNA', 'location_id': '1'}])
+
+    def row(self, room, staff_id='S1'):
+        return {'room': room, 'provider': 'Dr. P', 'surgeon': 'Dr. S', 'staff': staff_id}
+
+    def test_csv_upload(self):
+        upload = SimpleUploadedFile('rooms.csv', (
+            '\ufeffroom,provider,surgeon,staff_id\n'
+            ' OR 1 ,Dr. P,Dr. S,S1\n'
+            ',,,\n'
+            'OR 2,Dr. P,,S1\n'
+        ).encode('utf-8'))
+        request = RequestFactory().post('/setup/', {'csv_file': upload})
+        self.assertEqual(views.parse_bulk_rows(request), [
+            self.row('OR 1'), {'room': 'OR 2', 'provider': 'Dr. P', 'surgeon': '', 'staff': 'S1'},
+        ])
+
+    def test_form_grid_skips_blank_lines(self):
+        request = RequestFactory().post('/setup/', {
+            'room_0': 'OR 1', 'provider_0': 'Dr. P', 'surgeon_0': 'Dr. S', 'staff_0': 'S1',
+            'room_2': ' OR 3 ', 'provider_2': 'Dr. P', 'surgeon_2': 'Dr. S', 'staff_2': 'S1',
+        })
+        self.assertEqual(views.parse_bulk_rows(request), [self.row('OR 1'), self.row('OR 3')])
+
+    def test_validation_errors(self):
+        rows = [self.row('OR 1'), self.row('OR 1'), self.row('OR 2', staff_id='S9'), dict(self.row('OR 3'), surgeon='')]
+        self.assertEqual(views.validate_bulk_rows(rows, self.directory), [
+            "Row 2: OR 1 is listed more than once.",
+            "Row 3: unknown staff id S9.",
+            "Row 4: missing surgeon.",
+        ])
+        self.assertEqual(views.validate_bulk_rows(rows[:1], self.directory), [])
+
+    def test_row_limit(self):
+        rows = [self.row(f'OR {i}') for i in range(views.BULK_SETUP_MAX_ROWS)]
+        self.assertEqual(views.validate_bulk_rows(rows, self.directory), [])
+        self.assertEqual(views.validate_bulk_rows(rows + [self.row('OR X')], self.directory), [
+            f"Set up at most {views.BULK_SETUP_MAX_ROWS} rooms at a time ({views.BULK_SETUP_MAX_ROWS + 1} were submitted).",
+        ])
+
+
+@PLAIN_STATIC_FILES
+class BulkSetupTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(name='A', division=Division.objects.create(name='Division'))
+        sign_in(self.client, self.hospital)
+        directory = StaffDirectory([{'staff_id': 'S1', 'name': 'CRNA One', 'role': 'CRNA', 'location_id': str(self.hospital.id)}])
+        self.recorded = []
+        self.published = []
+        for name, value in [
+            ('fetch_staff_directory', mock.Mock(return_value=directory)),
+            ('record_assignment', lambda item: self.recorded.append(item['room'])),
+            ('publish_room_update', lambda hospital_id, item, directory: self.published.append(item['room'])),
+        ]:
+            patcher = mock.patch.object(views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, **put_rooms):
+        grid = {}
+        for i, room in enumerate(('OR 1', 'OR 2', 'OR 3')):
+            grid.update({f'room_{i}': room, f'provider_{i}': 'Dr. P', f'surgeon_{i}': 'Dr. S', f'staff_{i}': 'S1'})
+        with mock.patch.object(views, 'put_rooms', mock.Mock(**put_rooms)):
+            return self.client.post('/setup/', grid, follow=True)
+
+    def items(self, *rooms_):
+        return [room_item(self.hospital.id, room, 'Dr. P', 'Dr. S', 'S1') for room in rooms_]
+
+    def test_rooms_written_before_a_rejected_chunk_are_recorded_and_published(self):
+        response = self.post(return_value=(self.items('OR 1', 'OR 2', 'OR 3'), self.items('OR 3')))
+        self.assertContains(response, 'DynamoDB did not accept 1 of 3 rooms.')
+        self.assertEqual(self.recorded, ['OR 1', 'OR 2'])
+        self.assertEqual(self.published, ['OR 1', 'OR 2'])
+
+    def test_rooms_written_before_a_failed_chunk_are_recorded_and_published(self):
+        busy = rooms.SequenceConflict("Could not get a change sequence")
+        busy.written = self.items('OR 1')
+        for error in (rooms.RoomsTaken(['OR 3'], written=self.items('OR 1')), busy):
+            self.recorded.clear()
+            with self.subTest(error=type(error).__name__):
+                response = self.post(side_effect=error)
+                self.assertContains(response, str(error))
+                self.assertEqual(self.recorded, ['OR 1'])
+
+
+@PLAIN_STATIC_FILES
+class ReportAccessTests(DynamoTestCase):
+    def test_managers_and_admins_see_and_open_the_reports(self):
+        hospital = Hospital.objects.create(name='A', division=Division.objects.create(name='Division'))
+        for role, allowed in (('end_user', False), ('manager', True), ('admin', True)):
+            with self.subTest(role=role):
+                user = sign_in(self.client, hospital, role)
+                # Admins are sent on to /admin/ from home, so render the board for them directly
+                request = RequestFactory().get('/')
+                request.user = user
+                board = render_to_string('index.html', {'board_rows': []}, request=request)
+                self.assertEqual('Assignment History' in board, allowed)
+                self.assertEqual('Utilization' in board, allowed)
+                for path in ('/history/', '/utilization/'):
+                    self.assertEqual(self.client.get(path).status_code == 200, allowed, path)
+
+
+@override_settings(WHITEBOARD_STORAGE='rooms')
+class BoardApiTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        division = Division.objects.create(name='Division')
+        self.hospital = Hospital.objects.create(name='A', division=division)
+        self.other_hospital = Hospital.objects.create(name='B', division=Division.objects.create(name='Other'))
+        self.user = CustomUser.objects.create_user('display@example.com', 'password')
+        self.user.assigned_divisions.add(division)
+        self.token, self.key = ApiToken.issue(self.user, 'OR display')
+        dynamo.staff_table().put_item(Item={'staff_id': 'S1', 'name': 'CRNA One', 'role': 'CRNA'})
+        for room in ('OR 1', 'OR 2', 'OR 3'):
+            save_room(room_item(self.hospital.id, room, 'Dr. P', 'Dr. S', 'S1'))
+
+    def get(self, path='board/', key=None, **headers):
+        if key is None:
+            key = self.key
+        if key:
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {key}'
+        return self.client.get(f'/api/v1/hospitals/{self.hospital.id}/{path}', **headers)
+
+    def test_requests_without_a_valid_token_are_refused(self):
+        for reason, key in (('no token', ''), ('unknown token', 'not-a-token')):
+            with self.subTest(reason):
+                response = self.get(key=key)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    def test_inactive_tokens_and_users_are_refused(self):
+        self.assertEqual(self.get().status_code, 200)
+        ApiToken.objects.filter(pk=self.token.pk).update(is_active=False)
+        self.assertEqual(self.get().status_code, 401)
+        ApiToken.objects.filter(pk=self.token.pk).update(is_active=True)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_hospitals_outside_the_users_divisions_are_not_found(self):
+        response = self.client.get(f'/api/v1/hospitals/{self.other_hospital.id}/board/',
+                                   HTTP_AUTHORIZATION=f'Bearer {self.key}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.get('board/?fields=room,pager')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pager', response.json()['error'])
+
+    def test_fields_project_each_room(self):
+        response = self.get('board/?fields=staff_name')
+        self.assertEqual(response.json(), {
+            'hospital': {'id': self.hospital.id, 'name': 'A'},
+            'rooms': [{'room': room, 'staff_name': 'CRNA One'} for room in ('OR 1', 'OR 2', 'OR 3')],
+        })
+
+    def test_a_matching_etag_gets_a_304(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        save_room(room_item(self.hospital.id, 'OR 1', 'Dr. Q', 'Dr. S', 'S1'))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_an_unchanged_board_since_last_modified_gets_a_304(self):
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_changes_are_the_rooms_written_after_since(self):
+        save_room(room_item(self.hospital.id, 'OR 1', 'Dr. Q', 'Dr. S', 'S1'))
+        response = self.get('board/changes/?since=2&fields=provider,sequence')
+        self.assertEqual(response.json(), {
+            'hospital': {'id': self.hospital.id, 'name': 'A'},
+            'sequence': 4,
+            'snapshot': False,
+            'rooms': [
+                {'room': 'OR 1', 'provider': 'Dr. Q', 'sequence': 4},
+                {'room': 'OR 3', 'provider': 'Dr. P', 'sequence': 3},
+            ],
+        })
+        self.assertEqual(self.get('board/changes/?since=-1').status_code, 400)
+
+
+@override_settings(WHITEBOARD_STORAGE='rooms')
+class BoardRowsTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='A', division=Division.objects.create(name='Division'))
+        sign_in(self.client, self.hospital)
+        for room in ('OR 1', 'OR 2', 'OR 3'):
+            self.save(room, 'Dr. P')
+
+    def save(self, room, provider):
+        save_room(room_item(self.hospital.id, room, provider, 'Dr. S', ''))
+        views.board_changed(self.hospital.id)
+
+    def rows(self, response):
+        """(room, hx-swap-oob) for each row in a /rows/ response."""
+        return re.findall(r'<tr id="[^"]+" data-room="([^"]+)" data-version="[^"]+"(?: hx-swap-oob="([^"]+)")?>',
+                          response.content.decode())
+
+    def test_an_unchanged_board_gets_a_304(self):
+        response = self.client.get('/rows/')
+        self.assertEqual(self.rows(response), [('OR 1', ''), ('OR 2', ''), ('OR 3', '')])
+        self.assertEqual(response['X-Board-Sequence'], '3')
+        self.assertEqual(self.client.get('/rows/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.save('OR 2', 'Dr. Q')
+        self.assertEqual(self.client.get('/rows/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_since_gets_the_rooms_written_after_it(self):
+        self.save('OR 2', 'Dr. Q')
+        response = self.client.get('/rows/?since=3')
+        self.assertEqual(self.rows(response), [('OR 2', 'true')])
+        self.assertEqual(response['X-Board-Sequence'], '4')
+        self.assertEqual(self.rows(self.client.get('/rows/?since=4')), [])
+        # Ahead of the board: the whole board comes back
+        self.assertEqual(len(self.rows(self.client.get('/rows/?since=9'))), 3)
+
+    def test_have_gets_changed_rows_in_place_and_new_rooms_appended(self):
+        versions = dict(re.findall(r'<tr id="([^"]+)" data-room="[^"]+" data-version="([^"]+)"',
+                                   self.client.get('/rows/').content.decode()))
+        self.save('OR 2', 'Dr. Q')
+        self.save('OR 4', 'Dr. P')
+        row_ids = {views.board_row(room_item(self.hospital.id, room, '', '', ''), {})['row_id']: room
+                   for room in ('OR 1', 'OR 2', 'OR 3')}
+        # The client never got OR 3
+        have = ','.join(f'{row_id}.{versions[row_id]}' for row_id, room in row_ids.items() if room != 'OR 3')
+        response = self.client.get(f'/rows/?have={have}')
+        self.assertEqual(self.rows(response), [
+            ('OR 2', 'true'), ('OR 3', 'beforeend:#board-rows'), ('OR 4', 'beforeend:#board-rows'),
+        ])
+
+
+class RowCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = {'S1': {'name': 'CRNA One', 'role': 'CRNA'}}
+        renders = mock.patch.object(views, 'render_to_string', wraps=views.render_to_string)
+        self.render_to_string = renders.start()
+        self.addCleanup(renders.stop)
+
+    def render(self, item, staff_dict=None):
+        return views.render_board_rows([(item['room'], views.board_row(item, staff_dict or self.staff), '')])[0]
+
+    def item(self, provider, version):
+        return room_item(1, 'OR 1', provider, 'Dr. S', 'S1', version=version, sequence=1)
+
+    def test_an_unchanged_row_comes_from_the_cache(self):
+        first = self.render(self.item('Dr. P', 100))
+        self.assertEqual(self.render(self.item('Dr. P', 100)), first)
+        self.assertEqual(self.render_to_string.call_count, 1)
+
+    def test_a_new_version_is_rendered_again(self):
+        self.render(self.item('Dr. P', 100))
+        self.render(self.item('Dr. P', 101))
+        self.assertEqual(self.render_to_string.call_count, 2)
+        self.assertIn('Dr. Q', self.render(self.item('Dr. Q', 102)))
+
+    def test_a_staff_rename_is_rendered_again(self):
+        self.render(self.item('Dr. P', 100))
+        renamed = self.render(self.item('Dr. P', 100), {'S1': {'name': 'CRNA Renamed', 'role': 'CRNA'}})
+        self.assertIn('CRNA Renamed', renamed)
+        self.assertEqual(self.render_to_string.call_count, 2)
+
+    def test_read_only_rows_are_cached_apart(self):
+        item = self.item('Dr. P', 100)
+        row = [(item['room'], views.board_row(item, self.staff), '')]
+        self.assertIn('Edit', views.render_board_rows(row)[0])
+        self.assertNotIn('Edit', views.render_board_rows(row, readonly=True)[0])
+
+
+@PLAIN_STATIC_FILES
+@override_settings(WHITEBOARD_STORAGE='rooms')
+class KioskTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        division = Division.objects.create(name='Division')
+        self.hospital = Hospital.objects.create(name='A', division=division)
+        self.other_hospital = Hospital.objects.create(name='B', division=Division.objects.create(name='Other'))
+        user = CustomUser.objects.create_user('display@example.com', 'password')
+        user.assigned_divisions.add(division)
+        self.token, self.key = ApiToken.issue(user, 'OR display')
+        save_room(room_item(self.hospital.id, 'OR 1', 'Dr. P', 'Dr. S', ''))
+
+    def test_the_token_moves_from_the_url_into_a_cookie(self):
+        response = self.client.get(f'/kiosk/{self.hospital.id}/?token={self.key}')
+        self.assertRedirects(response, f'/kiosk/{self.hospital.id}/', fetch_redirect_response=False)
+        cookie = response.cookies[views.KIOSK_COOKIE]
+        self.assertEqual(cookie.value, self.key)
+        self.assertEqual(cookie['path'], f'/kiosk/{self.hospital.id}/')
+        self.assertTrue(cookie['httponly'])
+        # The test client keeps the cookie for the next request
+        board = self.client.get(f'/kiosk/{self.hospital.id}/')
+        self.assertContains(board, 'Dr. P')
+
+    def test_rows_are_read_only(self):
+        self.client.cookies[views.KIOSK_COOKIE] = self.key
+        for path in (f'/kiosk/{self.hospital.id}/', f'/kiosk/{self.hospital.id}/rows/'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertContains(response, 'OR 1')
+                self.assertNotContains(response, '/edit/')
+
+    def test_a_token_for_another_division_is_refused(self):
+        for path in (f'/kiosk/{self.other_hospital.id}/?token={self.key}', f'/kiosk/{self.other_hospital.id}/rows/'):
+            with self.subTest(path=path):
+                self.client.cookies[views.KIOSK_COOKIE] = self.key
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 403)
+                self.assertNotIn(views.KIOSK_COOKIE, response.cookies)
+
+    def test_an_inactive_token_is_refused(self):
+        ApiToken.objects.filter(pk=self.token.pk).update(is_active=False)
+        self.assertEqual(self.client.get(f'/kiosk/{self.hospital.id}/?token={self.key}').status_code, 403)
+
+
+class StaffCacheTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = mock.patch.object(staff, '_directory', None)
+        directory.start()
+        self.addCleanup(directory.stop)
+        scans = mock.patch.object(staff, 'paginate', wraps=staff.paginate)
+        self.scans = scans.start()
+        self.addCleanup(scans.stop)
+        self.add_staff('S1')
+
+    def add_staff(self, staff_id):
+        dynamo.staff_table().put_item(Item={'staff_id': staff_id, 'name': staff_id, 'role': 'CRNA', 'location_id': '1'})
+
+    def test_the_directory_is_read_once_until_invalidated(self):
+        self.assertEqual(len(staff.get_staff_directory()), 1)
+        self.add_staff('S2')
+        self.assertEqual(len(staff.get_staff_directory()), 1)
+        self.assertEqual(self.scans.call_count, 1)
+
+        version = staff.staff_cache_version()
+        self.assertEqual(staff.invalidate_staff_cache(), version + 1)
+        self.assertEqual(len(staff.get_staff_directory()), 2)
+        self.assertEqual(self.scans.call_count, 2)
+
+    def test_the_command_refuses_a_per_process_cache(self):
+        version = staff.staff_cache_version()
+        with self.assertRaisesMessage(CommandError, 'per-process cache'):
+            call_command('invalidate_staff_cache', stdout=io.StringIO())
+        self.assertEqual(staff.staff_cache_version(), version)
+
+    def test_the_command_bumps_a_shared_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with override_settings(CACHES={**settings.CACHES, settings.STAFF_CACHE_ALIAS: shared}):
+                version = staff.staff_cache_version()
+                call_command('invalidate_staff_cache', stdout=io.StringIO())
+                self.assertEqual(staff.staff_cache_version(), version + 1)
+
+
+class BoardEventTests(SimpleTestCase):
+    async def next_events(self, subscription, count):
+        return [await asyncio.wait_for(anext(subscription), timeout=5) for _ in range(count)]
+
+    async def test_in_process_subscribers_get_their_hospitals_updates(self):
+        broker = InProcessBroker(keepalive=60)
+        subscription = broker.subscribe(1)
+        # The subscriber registers when the stream is first read
+        first = asyncio.ensure_future(anext(subscription))
+        await asyncio.sleep(0)
+        # Views publish from worker threads
+        await asyncio.to_thread(broker.publish, 2, {'room': 'OR 9'})
+        await asyncio.to_thread(broker.publish, 1, {'room': 'OR 1'})
+        await asyncio.to_thread(broker.publish, '1', {'room': 'OR 2'})
+        self.assertEqual([await first] + await self.next_events(subscription, 1), [{'room': 'OR 1'}, {'room': 'OR 2'}])
+        await subscription.aclose()
+        self.assertEqual(dict(broker._subscribers), {})
+
+    async def test_idle_subscribers_get_keepalives(self):
+        for broker in (InProcessBroker(keepalive=0.01), CacheBroker(poll_interval=0.01, keepalive=0.01)):
+            with self.subTest(broker=type(broker).__name__):
+                subscription = broker.subscribe(1)
+                self.assertEqual(await self.next_events(subscription, 1), [None])
+                await subscription.aclose()
+
+    async def test_cache_subscribers_get_every_update_published_since_they_subscribed(self):
+        await asyncio.to_thread(cache.clear)
+        broker = CacheBroker(poll_interval=0.01, keepalive=60)
+        await asyncio.to_thread(broker.publish, 1, {'room': 'before'})
+        started = asyncio.Event()
+        aget = broker.cache.aget
+
+        async def first_read(*args, **kwargs):
+            value = await aget(*args, **kwargs)
+            started.set()
+            return value
+
+        subscription = broker.subscribe(1)
+        with mock.patch.object(broker.cache, 'aget', first_read):
+            waiting = asyncio.ensure_future(self.next_events(subscription, 3))
+            # Publish once the subscriber has read the sequence it starts from
+            await started.wait()
+        for room in ('OR 1', 'OR 2', 'OR 3'):
+            # Another worker, publishing through the shared cache
+            await asyncio.to_thread(CacheBroker().publish, 1, {'room': room})
+        await asyncio.to_thread(broker.publish, 2, {'room': 'OR 9'})
+        self.assertEqual(await waiting, [{'room': 'OR 1'}, {'room': 'OR 2'}, {'room': 'OR 3'}])
+        await subscription.aclose()
+
+    async def test_the_stream_sends_updates_for_the_selected_hospital(self):
+        broker = InProcessBroker(keepalive=60)
+        request = AsyncRequestFactory().get('/events/')
+        request.session = SessionStore()
+        await request.session.aset('selected_hospital_id', 1)
+        user = CustomUser(email='user@example.com')
+
+        async def auser():
+            return user
+
+        request.auser = auser
+        with mock.patch.object(views, 'get_broker', return_value=broker):
+            response = await views.board_events(request)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = aiter(response.streaming_content)
+            self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+            update = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0)
+            broker.publish(1, {'room': 'OR 1', 'html': '<tr></tr>'})
+            self.assertEqual(await asyncio.wait_for(update, timeout=5),
+                             b'event: room\ndata: {"room": "OR 1", "html": "<tr></tr>"}\n\n')
+            await stream.aclose()
+
+
+class HistoryExportTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hospital = Hospital.objects.create(name='A', division=Division.objects.create(name='Division'))
+        sign_in(self.client, self.hospital, 'manager')
+        self.async_client.cookies = self.client.cookies
+        for day, room in ((5, 'OR 1'), (5, 'OR 2'), (6, 'OR 1'), (7, 'OR 3'), (8, 'OR 1'), (20, 'OR 1')):
+            dynamo.assignments_table().put_item(Item={
+                'assignment_id': f'{day}-{room}', 'hospital_id': str(self.hospital.id), 'date': f'2026-01-{day:02}',
+                'room': room, 'anesthesiologist_id': 'Dr. A', 'surgeon_id': 'Dr. S', 'app_id': 'S1',
+                'student_id': '', 'provider_mode': 'Directed CRNA',
+            })
+        # Two assignments per page, so the export spans several pages
+        paginate_pages = dynamo.paginate_pages
+        pages = mock.patch.object(dynamo, 'paginate_pages', lambda *args, **kwargs: paginate_pages(*args, Limit=2, **kwargs))
+        pages.start()
+        self.addCleanup(pages.stop)
+
+    async def export(self, query):
+        response = await self.async_client.get(f'/history/export/?{query}')
+        return response, [chunk async for chunk in response.streaming_content]
+
+    async def test_csv_export_covers_the_range_across_pages(self):
+        response, chunks = await self.export('start=2026-01-05&end=2026-01-08&format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="assignments-2026-01-05-to-2026-01-08.csv"')
+        rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual([(row['date'], row['room']) for row in rows], [
+            ('2026-01-05', 'OR 1'), ('2026-01-05', 'OR 2'), ('2026-01-06', 'OR 1'),
+            ('2026-01-07', 'OR 3'), ('2026-01-08', 'OR 1'),
+        ])
+        self.assertEqual(rows[0]['provider_mode'], 'Directed CRNA')
+        # The header, then a chunk per page of two
+        self.assertGreaterEqual(len(chunks), 4)
+
+    async def test_jsonl_export_has_one_assignment_per_line(self):
+        response, chunks = await self.export('start=2026-01-06&end=2026-01-20&format=jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([line['assignment_id'] for line in lines], ['6-OR 1', '7-OR 3', '8-OR 1', '20-OR 1'])
+
+    def test_bad_ranges_and_formats_are_refused(self):
+        for query, error in [
+            ('start=2026-01-08&end=2026-01-05', 'The start date must be on or before the end date.'),
+            ('start=2026-13-01&end=2026-01-05', 'Invalid date range'),
+            ('start=2026-01-05&end=2026-01-08&format=xlsx', 'Choose CSV or JSONL for the export.'),
+        ]:
+            with self.subTest(query=query):
+                with PLAIN_STATIC_FILES:
+                    response = self.client.get(f'/history/export/?{query}', follow=True)
+                self.assertRedirects(response, '/history/')
+                self.assertContains(response, error)
+
+
+class RollupTests(DynamoTestCase):
+    def assignment(self, hospital_id, date, room, provider_mode='Directed CRNA', student_id=''):
+        return {'hospital_id': hospital_id, 'date': date, 'room': room,
+                'provider_mode': provider_mode, 'student_id': student_id}
+
+    def test_summarize_counts_modes_students_and_rooms(self):
+        summaries = summarize([
+            self.assignment(1, '2026-01-05', 'OR 1'),
+            self.assignment(1, '2026-01-05', 'OR 1', 'Directed AA', student_id='s-1'),
+            self.assignment(1, '2026-01-05', 'OR 2', 'Medical Direction'),
+            self.assignment(2, '2026-01-05', 'OR 9'),
+        ])
+        self.assertEqual(summaries[('1', '2026-01-05')], {
+            'assignments': 3, 'directed_crna': 1, 'directed_aa': 1, 'srna': 1, 'rooms': {'OR 1', 'OR 2'},
+        })
+        self.assertEqual(summaries[('2', '2026-01-05')]['assignments'], 1)
+
+    def test_batches_for_the_same_day_add_up(self):
+        apply_assignments([self.assignment('1', '2026-01-05', 'OR 1'), self.assignment('1', '2026-01-06', 'OR 1')])
+        apply_assignments([self.assignment('1', '2026-01-05', 'OR 2', 'Directed AA', student_id='s-1')])
+
+        self.assertEqual(read_rollups(['1'], '2026-01-05', '2026-01-06'), [
+            {'hospital_id': '1', 'date': '2026-01-05', 'rooms': 2,
+             'assignments': 2, 'directed_crna': 1, 'directed_aa': 1, 'srna': 1},
+            {'hospital_id': '1', 'date': '2026-01-06', 'rooms': 1,
+             'assignments': 1, 'directed_crna': 1, 'directed_aa': 0, 'srna': 0},
+        ])
+
+    def test_rebuild_overwrites_what_was_added(self):
+        apply_assignments([self.assignment('1', '2026-01-05', 'OR 1')] * 3)
+
+        unprocessed = rebuild_rollups(summarize([self.assignment('1', '2026-01-05', 'OR 2', 'Directed AA')]))
+
+        self.assertEqual(unprocessed, [])
+        self.assertEqual(read_rollups(['1'], '2026-01-05', '2026-01-05'), [
+            {'hospital_id': '1', 'date': '2026-01-05', 'rooms': 1,
+             'assignments': 1, 'directed_crna': 0, 'directed_aa': 1, 'srna': 0},
+        ])
+
+    def test_read_rollups_orders_hospitals_within_each_day(self):
+        apply_assignments([
+            self.assignment('2', '2026-01-06', 'OR 1'),
+            self.assignment('1', '2026-01-06', 'OR 1'),
+            self.assignment('2', '2026-01-05', 'OR 1'),
+            self.assignment('1', '2026-01-09', 'OR 1'),
+            self.assignment('3', '2026-01-05', 'OR 1'),
+        ])
+
+        rows = read_rollups(['1', '2'], '2026-01-05', '2026-01-08')
+
+        self.assertEqual([(row['date'], row['hospital_id']) for row in rows],
+                         [('2026-01-05', '2'), ('2026-01-06', '1'), ('2026-01-06', '2')])
+        self.assertEqual(read_rollups([], '2026-01-05', '2026-01-08'), [])
+
+
+class HierarchyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.division = Division.objects.create(name='Central')
+        self.hospital = Hospital.objects.create(name='A', division=self.division)
+        self.empty = Division.objects.create(name='Empty')
+        self.user = CustomUser.objects.create_user(email='manager@example.com', password='pw', role='manager')
+        self.user.assigned_divisions.add(self.division, self.empty)
+
+    def test_tree_is_read_in_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            hierarchy = get_hierarchy(self.user)
+        self.assertEqual([division.name for division in hierarchy.divisions], ['Central', 'Empty'])
+        self.assertEqual(hierarchy.hospitals(self.division.id), (HospitalNode(self.hospital.id, 'A', self.division.id),))
+        self.assertEqual(hierarchy.hospitals(str(self.empty.id)), ())
+        self.assertIsNone(hierarchy.hospital(self.hospital.id, division_id=self.empty.id))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_hierarchy(self.user).divisions, hierarchy.divisions)
+
+    def assertRebuilt(self):
+        with self.assertNumQueries(1):
+            return get_hierarchy(self.user)
+
+    def test_saving_or_deleting_organizations_invalidates_trees(self):
+        get_hierarchy(self.user)
+        hospital = Hospital.objects.create(name='B', division=self.division)
+        self.assertEqual([h.name for h in self.assertRebuilt().hospitals(self.division.id)], ['A', 'B'])
+
+        self.division.name = 'Capital'
+        self.division.save()
+        self.assertEqual(self.assertRebuilt().division(self.division.id).name, 'Capital')
+
+        hospital.delete()
+        self.assertEqual([h.name for h in self.assertRebuilt().hospitals(self.division.id)], ['A'])
+
+        self.empty.delete()
+        self.assertEqual([d.name for d in self.assertRebuilt().divisions], ['Capital'])
+
+    def test_assignment_changes_invalidate_trees(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='pw', role='manager')
+        get_hierarchy(self.user)
+        get_hierarchy(other)
+
+        # Only the user whose assignments changed is rebuilt
+        self.user.assigned_divisions.remove(self.empty)
+        self.assertEqual([d.name for d in self.assertRebuilt().divisions], ['Central'])
+        with self.assertNumQueries(0):
+            get_hierarchy(other)
+
+        self.empty.users.add(self.user)
+        self.assertEqual([d.name for d in self.assertRebuilt().divisions], ['Central', 'Empty'])
+
+        self.division.users.clear()
+        self.assertEqual([d.name for d in self.assertRebuilt().divisions], ['Empty'])
+
+
+class ServerTimingTests(DynamoTestCase):
+    def test_dynamodb_calls_are_reported(self):
+        hospital = Hospital.objects.create(name='A', division=Division.objects.create(name='Division'))
+        save_room(room_item(hospital.id, 'OR 1', 'Dr. P', 'Dr. S', ''))
+        sign_in(self.client, hospital)
+
+        response = self.client.get('/rows/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'(^|, )dynamodb;dur=\d+\.\d(, |$)')
+        self.assertRegex(response['Server-Timing'], r', total;dur=\d+\.\d$')
+
+    def test_phases_outside_a_request_are_not_timed(self):
+        with phase('render'):
+            self.assertIsNone(current_timings())
+
+
+class SamplingFilterTests(SimpleTestCase):
+    def record(self, name, level):
+        return logging.makeLogRecord({'name': name, 'levelno': level})
+
+    def test_info_is_sampled_and_warnings_are_kept(self):
+        sample = SamplingFilter({'whiteboard.requests': 0.0, 'botocore': 0.0})
+        self.assertFalse(sample.filter(self.record('whiteboard.requests', logging.INFO)))
+        self.assertFalse(sample.filter(self.record('botocore.credentials', logging.DEBUG)))
+        self.assertTrue(sample.filter(self.record('whiteboard.requests', logging.WARNING)))
+        self.assertTrue(sample.filter(self.record('botocore', logging.ERROR)))
+        # Only whole logger name segments match, and everything else uses the default
+        self.assertTrue(sample.filter(self.record('whiteboard.requests_extra', logging.INFO)))
+        self.assertTrue(sample.filter(self.record('whiteboard.views', logging.INFO)))
+
+    def test_longest_prefix_wins(self):
+        sample = SamplingFilter({'whiteboard': 0.0, 'whiteboard.views': 1.0}, default=0.0)
+        self.assertEqual(sample.rate_for('whiteboard.views.board'), 1.0)
+        self.assertEqual(sample.rate_for('whiteboard.api'), 0.0)
+        self.assertEqual(sample.rate_for('django'), 0.0)
+
+    def test_partial_rates_keep_records_below_the_rate(self):
+        sample = SamplingFilter(default=0.25)
+        with mock.patch('whiteboard.instrumentation.random.random', side_effect=[0.1, 0.3, 0.24, 0.9]):
+            kept = [sample.filter(self.record('whiteboard.views', logging.INFO)) for _ in range(4)]
+        self.assertEqual(kept, [True, False, True, False])
+
+
+class CompressionTests(SimpleTestCase):
+    def respond(self, response):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        return SyncGZipMiddleware(lambda request: response)(request)
+
+    def test_pages_are_compressed(self):
+        response = self.respond(HttpResponse('<tr></tr>' * 100))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_async_streams_are_not(self):
+        async def events():
+            yield b'data: {}\n\n'
+
+        response = self.respond(StreamingHttpResponse(events(), content_type='text/event-stream'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class AssignmentReplayTests(DynamoTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.writer = AssignmentWriter(self.directory / 'spill.jsonl')
+
+    def record(self, assignment_id):
+        return {'assignment_id': assignment_id, 'room': 'OR 1', 'hospital_id': '1', 'date': '2026-01-05',
+                'provider_mode': 'Directed CRNA', 'student_id': ''}
+
+    def spill_file(self, name, assignment_ids):
+        with open(self.directory / name, 'w', encoding='utf-8') as spill_file:
+            spill_file.writelines(json.dumps(self.record(assignment_id)) + '\n' for assignment_id in assignment_ids)
+
+    def stored_ids(self):
+        return sorted(item['assignment_id'] for item in dynamo.assignments_table().scan()['Items'])
+
+    def test_spilled_records_are_written(self):
+        self.writer.spill([self.record('a'), self.record('b')])
+        self.writer.replay()
+        self.assertEqual(self.stored_ids(), ['a', 'b'])
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_replays_abandoned_by_a_dead_process_are_picked_up(self):
+        # No process has a pid this high
+        self.spill_file('spill.jsonl.4194305.replay', ['a'])
+        self.spill_file('spill.jsonl.4194306-0badf00d.replay', ['b'])
+        self.spill_file(f'spill.jsonl.{os.getppid()}-0badf00d.replay', ['c'])
+        self.writer.replay()
+        self.assertEqual(self.stored_ids(), ['a', 'b'])
+        # A live process is still replaying that one
+        self.assertEqual([path.name for path in self.directory.iterdir()], [f'spill.jsonl.{os.getppid()}-0badf00d.replay'])
+
+    def test_records_that_fail_again_go_back_to_the_spill_file(self):
+        self.writer.spill([self.record('a')])
+        with mock.patch('whiteboard.audit.batch_write', side_effect=RuntimeError("DynamoDB is down")):
+            self.writer.replay()
+        self.assertEqual(self.stored_ids(), [])
+        self.assertEqual([path.name for path in self.directory.iterdir()], ['spill.jsonl'])
+        self.writer.replay()
+        self.assertEqual(self.stored_ids(), ['a'])
+
+    def test_the_writer_keeps_going_after_a_batch_fails(self):
+        writer = AssignmentWriter(self.directory / 'spill.jsonl', flush_interval=0.01)
+        write = writer._write
+        errors = [RuntimeError("malformed record")]
+
+        def fail_once(items):
+            if errors:
+                raise errors.pop()
+            write(items)
+
+        with mock.patch.object(writer, '_write', fail_once):
+            writer.start()
+            self.addCleanup(writer.shutdown)
+            writer.submit(self.record('a'))
+            for _ in range(500):
+                if (self.directory / 'spill.jsonl').exists():
+                    break
+                time.sleep(0.01)
+            writer.submit(self.record('b'))
+            for _ in range(500):
+                if self.stored_ids():
+                    break
+                time.sleep(0.01)
+        self.assertTrue(writer._thread.is_alive())
+        self.assertEqual(self.stored_ids(), ['b'])
+        with open(self.directory / 'spill.jsonl', encoding='utf-8') as spill_file:
+            self.assertEqual([json.loads(line)['assignment_id'] for line in spill_file], ['a'])
+
+
+class DuplicateAddTests(DynamoTestCase):
+    def test_adding_a_room_twice_fails_in_every_storage_mode(self):
+        for hospital_id, mode in enumerate(('legacy', 'dual', 'rooms'), start=1):
+            with self.subTest(mode=mode), override_settings(WHITEBOARD_STORAGE=mode):
+                add_room(room_item(hospital_id, f'{mode} OR 1', 'Dr. A', 'Dr. S', ''))
+                with self.assertRaises(dynamo.ConditionFailed):
+                    add_room(room_item(hospital_id, f'{mode} OR 1', 'Dr. B', 'Dr. S', ''))
+                self.assertEqual(get_room(hospital_id, f'{mode} OR 1')['provider'], 'Dr. A')
+
+    @override_settings(WHITEBOARD_STORAGE='dual')
+    def test_dual_mode_sees_rooms_not_yet_copied_to_rooms(self):
+        dynamo.whiteboard_table().put_item(Item={'Room': 'OR 1', 'hospital_id': '1', 'Provider': 'Dr. A'})
+        with self.assertRaises(dynamo.ConditionFailed):
+            add_room(room_item(1, 'OR 1', 'Dr. B', 'Dr. S', ''))
+        self.assertIsNone(dynamo.rooms_table().get_item(Key={'hospital_id': '1', 'room': 'OR 1'}).get('Item'))
+
+    @PLAIN_STATIC_FILES
+    def test_the_second_add_is_reported(self):
+        hospital = Hospital.objects.create(name='A', division=Division.objects.create(name='Division'))
+        sign_in(self.client, hospital)
+        form = {'room': 'OR 1', 'provider': 'Dr. A', 'surgeon': 'Dr. S', 'staff': ''}
+        self.assertContains(self.client.post('/add/', form, follow=True), 'Added OR 1 successfully!')
+        response = self.client.post('/add/', {**form, 'provider': 'Dr. B'}, follow=True)
+        self.assertContains(response, 'Room OR 1 already exists!')
+        self.assertEqual(get_room(hospital.id, 'OR 1')['provider'], 'Dr. A')
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_load(self):
+        flight = SingleFlight(ttl=60)
+        release = threading.Event()
+        loads = []
+
+        def load():
+            loads.append(1)
+            release.wait(5)
+            return 'board'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.get('1', load))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        # Let every caller join the load before it finishes
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ['board'] * 8)
+        self.assertEqual(len(loads), 1)
+
+    def test_results_are_reused_until_the_ttl_or_an_invalidate(self):
+        flight = SingleFlight(ttl=60)
+        counter = iter(range(10))
+        self.assertEqual(flight.get('1', lambda: next(counter)), 0)
+        self.assertEqual(flight.get('1', lambda: next(counter)), 0)
+        self.assertEqual(flight.get('2', lambda: next(counter)), 1)
+        flight.invalidate('1')
+        self.assertEqual(flight.get('1', lambda: next(counter)), 2)
+        with mock.patch('whiteboard.singleflight.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(flight.get('1', lambda: next(counter)), 3)
+
+    def test_a_load_overtaken_by_a_write_is_not_kept(self):
+        flight = SingleFlight(ttl=60)
+
+        def load_during_write():
+            flight.invalidate('1')
+            return 'before the write'
+
+        self.assertEqual(flight.get('1', load_during_write), 'before the write')
+        self.assertEqual(flight.get('1', lambda: 'after the write'), 'after the write')
+
+    def test_errors_reach_the_caller_and_are_not_kept(self):
+        flight = SingleFlight(ttl=60)
+        with self.assertRaises(RuntimeError):
+            flight.get('1', mock.Mock(side_effect=RuntimeError("DynamoDB is down")))
+        self.assertEqual(flight.get('1', lambda: 'board'), 'board')
+
+
+ISSUER = 'https://cognito-idp.us-east-1.amazonaws.com/us-east-1_test'
+CLIENT_ID = 'client-id'
+
+
+class LocalKeys:
+    """A JWKS of locally generated RSA keys that can sign ID tokens."""
+
+    def __init__(self, *kids):
+        self.fetches = 0
+        self.private_keys = {}
+        self.published = []
+        for kid in kids:
+            self.add(kid)
+
+    def add(self, kid, publish=True):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_keys[kid] = private_key
+        if publish:
+            self.publish(kid)
+
+    def publish(self, kid):
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(self.private_keys[kid].public_key(), as_dict=True)
+        self.published.append({**jwk, 'kid': kid, 'alg': 'RS256', 'use': 'sig'})
+
+    def fetch(self):
+        self.fetches += 1
+        return {'keys': list(self.published)}
+
+    def token(self, kid, **claims):
+        now = int(time.time())
+        claims = {'sub': 'user-1', 'aud': CLIENT_ID, 'iss': ISSUER, 'token_use': 'id', 'iat': now,
+                  'exp': now + 3600, 'email': 'user@example.com', **claims}
+        return jwt.encode(claims, self.private_keys[kid], algorithm='RS256', headers={'kid': kid})
+
+
+class IdTokenVerifierTests(SimpleTestCase):
+    def setUp(self):
+        self.keys = LocalKeys('key-1')
+        self.jwks = cognito.JWKSCache(self.keys.fetch, ttl=3600, min_refresh_interval=60)
+        self.verifier = cognito.IdTokenVerifier(self.jwks, ISSUER, CLIENT_ID, leeway=30)
+
+    def test_a_valid_token_gives_its_claims(self):
+        self.assertEqual(self.verifier.verify(self.keys.token('key-1'))['email'], 'user@example.com')
+        self.verifier.verify(self.keys.token('key-1'))
+        self.assertEqual(self.keys.fetches, 1)
+
+    def test_rejected_tokens(self):
+        now = int(time.time())
+        for reason, claims in [
+            ('expired', {'exp': now - 60}),
+            ('access token', {'token_use': 'access'}),
+            ('other app client', {'aud': 'other-client'}),
+            ('other user pool', {'iss': ISSUER + 'x'}),
+        ]:
+            with self.subTest(reason), self.assertRaises(cognito.TokenError):
+                self.verifier.verify(self.keys.token('key-1', **claims))
+
+    def test_expiry_within_the_leeway_is_accepted(self):
+        self.verifier.verify(self.keys.token('key-1', exp=int(time.time()) - 10))
+
+    def test_a_token_signed_with_another_key_is_rejected(self):
+        self.keys.add('key-1-forged', publish=False)
+        forged = self.keys.token('key-1-forged')
+        # Same kid as the published key, different signature
+        forged = jwt.encode(jwt.decode(forged, options={'verify_signature': False}),
+                            self.keys.private_keys['key-1-forged'], algorithm='RS256', headers={'kid': 'key-1'})
+        with self.assertRaises(cognito.TokenError):
+            self.verifier.verify(forged)
+
+    def test_unknown_kids_refetch_at_most_once_per_interval(self):
+        self.verifier.verify(self.keys.token('key-1'))
+        self.keys.add('key-2', publish=False)
+        for _ in range(3):
+            with self.assertRaises(cognito.TokenError):
+                self.verifier.verify(self.keys.token('key-2'))
+        self.assertEqual(self.keys.fetches, 1)
+
+    def test_rotated_keys_are_picked_up(self):
+        self.verifier.verify(self.keys.token('key-1'))
+        self.keys.add('key-2')
+        later = time.monotonic() + 61
+        with mock.patch('whiteboard.cognito.time.monotonic', return_value=later):
+            self.assertEqual(self.verifier.verify(self.keys.token('key-2'))['sub'], 'user-1')
+        self.assertEqual(self.keys.fetches, 2)
+
+
+class FakeCognito:
+    """Stands in for the cognito-idp client's refresh-token sign-in."""
+
+    class exceptions:
+        NotAuthorizedException = type('NotAuthorizedException', (Exception,), {})
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+
+    def initiate_auth(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.respond()
+
+
+class CognitoSessionMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.keys = LocalKeys('key-1')
+        cognito.set_verifier(cognito.IdTokenVerifier(cognito.JWKSCache(self.keys.fetch), ISSUER, CLIENT_ID))
+        self.addCleanup(cognito.set_verifier, None)
+
+    def request(self, expires_in, respond):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session[cognito.REFRESH_TOKEN_SESSION_KEY] = 'refresh-token'
+        request.session[cognito.USERNAME_SESSION_KEY] = 'user-1'
+        request.session[cognito.EXPIRES_AT_SESSION_KEY] = int(time.time()) + expires_in
+        request.user = CustomUser(email='user@example.com')
+        client = FakeCognito(respond)
+        middleware = cognito.cognito_session_middleware(lambda request: HttpResponse())
+        with mock.patch('whiteboard.cognito.get_client', return_value=client):
+            middleware(request)
+        return request, client
+
+    def test_sessions_far_from_expiry_are_left_alone(self):
+        request, client = self.request(3600, respond=None)
+        self.assertEqual(client.calls, [])
+
+    def test_sessions_about_to_expire_are_refreshed(self):
+        exp = int(time.time()) + 3600
+        token = self.keys.token('key-1', exp=exp)
+        request, client = self.request(60, lambda: {'AuthenticationResult': {'IdToken': token}})
+        self.assertEqual(client.calls[0]['AuthFlow'], 'REFRESH_TOKEN_AUTH')
+        self.assertEqual(request.session[cognito.EXPIRES_AT_SESSION_KEY], exp)
+        self.assertEqual(request.session[cognito.REFRESH_TOKEN_SESSION_KEY], 'refresh-token')
+        self.assertTrue(request.user.is_authenticated)
+
+    def test_a_refused_refresh_token_signs_the_user_out(self):
+        def refuse():
+            raise FakeCognito.exceptions.NotAuthorizedException("Refresh Token has expired")
+
+        request, client = self.request(60, refuse)
+        self.assertIsInstance(request.user, AnonymousUser)
+        self.assertNotIn(cognito.REFRESH_TOKEN_SESSION_KEY, request.session)
+
+    def test_an_unverifiable_refreshed_token_signs_the_user_out(self):
+        token = self.keys.token('key-1', token_use='access')
+        request, client = self.request(60, lambda: {'AuthenticationResult': {'IdToken': token}})
+        self.assertIsInstance(request.user, AnonymousUser)
+
+    def test_cognito_being_unreachable_keeps_the_session(self):
+        request, client = self.request(60, mock.Mock(side_effect=ConnectionError("no route to Cognito")))
+        self.assertTrue(request.user.is_authenticated)
+        self.assertIn(cognito.REFRESH_TOKEN_SESSION_KEY, request.session)
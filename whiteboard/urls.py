@@ -1,12 +1,24 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('edit/<str:room>/', views.edit_entry, name='edit_entry'),
     path('add/', views.add_entry, name='add_entry'),
+    path('setup/', views.bulk_setup, name='bulk_setup'),
+    path('events/', views.board_events, name='board_events'),
+    path('rows/', views.board_rows, name='board_rows'),
+    path('kiosk/<int:hospital_id>/', views.kiosk, name='kiosk'),
+    path('kiosk/<int:hospital_id>/rows/', views.kiosk_rows, name='kiosk_rows'),
+    path('division/', views.division_board, name='division_board'),
+    path('history/', views.assignment_history, name='assignment_history'),
+    path('history/export/', views.export_assignment_history, name='export_assignment_history'),
+    path('utilization/', views.utilization, name='utilization'),
     path('login/', views.login_view, name='login'),
     path('select-division/', views.select_division, name='select_division'),
     path('select-hospital/', views.select_hospital, name='select_hospital'),
     path('logout/', views.logout_view, name='logout'),
+    path('api/v1/hospitals/<int:hospital_id>/board/', api.hospital_board, name='api_hospital_board'),
+    path('api/v1/hospitals/<int:hospital_id>/board/changes/', api.hospital_board_changes,
+         name='api_hospital_board_changes'),
 ]
\ No newline at end of file
@@ -1,99 +1,224 @@
 from django.shortcuts import render, redirect
-import boto3
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
 import logging
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
-from .models import CustomUser, Division, Hospital
+from .models import CustomUser, Division
 import os
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import chain
 import hashlib
-import hmac
-import base64
+import json
+import csv
+import io
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 from django.conf import settings
-
-# Initialize DynamoDB client using settings from .env.staging
-dynamodb = boto3.resource(
-    'dynamodb',
-    region_name=settings.AWS_REGION,
-    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+from .aws import get_client
+from .dynamo import ConditionFailed, assignment_history_pages, run_concurrently
+from .rooms import (
+    RoomsTaken, SequenceConflict, add_room, all_rooms, changed_since, get_room, hospital_rooms, put_rooms,
+    sequenced_hospital_rooms, room_item, save_room,
 )
-whiteboard_table = dynamodb.Table(settings.WHITEBOARD_TABLE)
-staff_table = dynamodb.Table(settings.STAFF_TABLE)
-assignments_table = dynamodb.Table(settings.ROOM_ASSIGNMENTS_TABLE)
-
-def fetch_staff():
+from .staff import StaffDirectory, get_staff_directory, resolve_staff
+from .events import get_broker
+from .audit import record_assignment
+from .rollups import ROLLUP_COUNTERS, read_rollups
+from .hierarchy import get_hierarchy
+from .cognito import TokenError, compute_secret_hash, get_verifier, store_tokens
+from .instrumentation import phase
+from .singleflight import SingleFlight
+from .api import token_for_key
+
+# Blank lines offered by the bulk setup form
+BULK_SETUP_GRID_ROWS = 30
+# Most rooms one bulk submission may set up; larger CSV files are refused before anything is written
+BULK_SETUP_MAX_ROWS = 200
+
+# Kiosk displays keep their API token in this cookie, scoped to their board's URL
+KIOSK_COOKIE = 'kiosk_token'
+
+# Concurrent and back-to-back loads of one hospital's board share a single read, per worker
+board_loads = SingleFlight(settings.BOARD_CACHE_TTL)
+
+# Columns in an assignment history CSV export, in order
+HISTORY_EXPORT_FIELDS = [
+    'date', 'hospital_id', 'room', 'anesthesiologist_id', 'surgeon_id',
+    'app_id', 'student_id', 'provider_mode', 'assignment_id',
+]
+
+def fetch_staff_directory():
     try:
-        response = staff_table.scan()
-        items = response.get('Items', [])
-        logger.info(f"Fetched {len(items)} staff members: {items}")
-        return items
+        directory = get_staff_directory()
+        logger.debug("Fetched %d staff members", len(directory))
+        return directory
     except Exception as e:
-        logger.error(f"Error fetching staff from DynamoDB: {e}")
-        return []
+        logger.error("Error fetching staff from DynamoDB: %s", e)
+        return StaffDirectory([])
+
+def board_row(item, staff_dict):
+    """Turn a normalized room item (see rooms.py) into the dict index.html renders for one room."""
+    staff_id = item['staff_id']
+    # Map staff_id to staff name and role
+    staff_info = staff_dict.get(staff_id, {'name': f"Unknown (staff_id: {staff_id})", 'role': ''})
+    row = {
+        'provider': item['provider'],
+        'surgeon': item['surgeon'],
+        'staff_id': staff_id,
+        'staff_name': staff_info['name'],
+        'staff_role': staff_info['role'],
+        # The hospital's change sequence when the room was last written, for delta refreshes
+        'sequence': int(item['sequence']) if item.get('sequence') is not None else None,
+    }
+    # Stable DOM id and a content version so clients can tell which rows changed
+    row['row_id'] = 'room-' + hashlib.sha1(item['room'].encode('utf-8')).hexdigest()[:12]
+    row['version'] = hashlib.sha1(json.dumps([item['room'], row], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    row['cache_key'] = row_cache_key(item, row)
+    return row
+
+def row_cache_key(item, row):
+    """Where a room's rendered <tr> is cached.
+
+    Rooms written since versions were added are keyed by their version; staff
+    renames don't touch the room item, so the staff name and role are hashed in
+    too. Older items have no version and fall back to the row's content hash.
+    """
+    if item.get('version') is None:
+        return f"board-row:{row['version']}"
+    staff = hashlib.sha1(f"{row['staff_name']}\n{row['staff_role']}".encode('utf-8')).hexdigest()[:8]
+    return f"board-row:{item['hospital_id']}:{row['row_id']}:{item['version']}:{staff}"
+
+def render_board_rows(rows, readonly=False):
+    """Rendered _board_row.html for each (room, details, oob) row, reusing cached rows.
+
+    Only rooms written since their row was last rendered go through the
+    template; the rest come back from the cache in one get_many. Read-only
+    rows (kiosk displays) have no Edit button and are cached separately.
+    """
+    keys = [f"{details['cache_key']}:{oob}{':ro' if readonly else ''}" for _, details, oob in rows]
+    cached = cache.get_many(keys)
+    rendered = {}
+    html = []
+    for key, (room, details, oob) in zip(keys, rows):
+        if key not in cached:
+            cached[key] = rendered[key] = render_to_string(
+                '_board_row.html', {'room': room, 'details': details, 'oob': oob, 'readonly': readonly}
+            )
+        html.append(mark_safe(cached[key]))
+    if rendered:
+        cache.set_many(rendered, settings.BOARD_ROW_CACHE_TTL)
+    logger.debug("Rendered board rows", extra={'rows': len(rows), 'rendered': len(rendered)})
+    return html
+
+def board_etag(whiteboard):
+    """Strong ETag covering every room on the board and its row version."""
+    digest = hashlib.sha1()
+    for room in sorted(whiteboard):
+        digest.update(f"{whiteboard[room]['row_id']}:{whiteboard[room]['version']}\n".encode('utf-8'))
+    return f'"{digest.hexdigest()}"'
+
+def build_whiteboard(items, staff_dict, hospital_id=None):
+    """{room: board_row} for one board's room items."""
+    whiteboard = {}
+    for item in items:
+        room = item['room']
+        whiteboard[room] = board_row(item, staff_dict)
+        if not whiteboard[room]['provider'] or not whiteboard[room]['surgeon']:
+            logger.warning("Missing provider or surgeon", extra={'hospital_id': hospital_id, 'room': room})
+    return whiteboard
+
+def fetch_division_boards(hospital_ids):
+    """{hospital_id: whiteboard} for several hospitals at once.
+
+    Every hospital's rooms are read at the same time, then the staff all of
+    the boards reference are resolved together in one batch lookup.
+    """
+    room_lists = run_concurrently(*[lambda hospital_id=hospital_id: hospital_rooms(hospital_id) for hospital_id in hospital_ids])
+    staff_dict = resolve_staff(item['staff_id'] for items in room_lists for item in items)
+    boards = {
+        hospital_id: build_whiteboard(items, staff_dict, hospital_id)
+        for hospital_id, items in zip(hospital_ids, room_lists)
+    }
+    logger.info("Loaded division boards", extra={
+        'hospitals': len(boards), 'rooms': sum(len(items) for items in room_lists), 'staff': len(staff_dict),
+    })
+    return boards
 
 def fetch_whiteboard_data(hospital_id=None):
+    """(whiteboard, sequence), or (None, 0) when DynamoDB couldn't be read.
+
+    A hospital's board comes with its change sequence, read first so the board
+    has every change up to it (see rooms.sequenced_hospital_rooms); unscoped
+    reads have no sequence and give 0.
+    """
     try:
-        response = whiteboard_table.scan()
-        items = response.get('Items', [])
-        logger.info(f"Raw whiteboard items: {items}")
-        # Fetch staff list to map staff_id to name and role
-        staff_list = fetch_staff()
-        staff_dict = {staff['staff_id']: staff for staff in staff_list}
-        whiteboard = {}
-        for item in items:
-            if 'Room' not in item:
-                logger.warning(f"Item missing Room attribute: {item}")
-                continue
-            # Filter by hospital_id if provided
-            if hospital_id and item.get('hospital_id') != str(hospital_id):
-                continue
-            room = item['Room']
-            provider = item.get('Provider') or item.get('provider') or item.get('provider_name', '')
-            surgeon = item.get('Surgeon') or item.get('surgeon') or item.get('surgeon_name', '')
-            staff_id = item.get('Staff', '')
-            # Map staff_id to staff name and role
-            staff_info = staff_dict.get(staff_id, {'name': f"Unknown (staff_id: {staff_id})", 'role': ''})
-            whiteboard[room] = {
-                'provider': provider,
-                'surgeon': surgeon,
-                'staff_id': staff_id,
-                'staff_name': staff_info['name'],
-                'staff_role': staff_info['role']
-            }
-            if not provider or not surgeon:
-                logger.warning(f"Missing provider or surgeon for room {room}: {item}")
-        logger.info(f"Processed whiteboard data: {whiteboard}")
-        return whiteboard
+        # Only read this hospital's rooms; the full-table scan is kept for unscoped callers
+        if hospital_id:
+            sequence, items = sequenced_hospital_rooms(hospital_id)
+        else:
+            sequence, items = 0, all_rooms()
+        # Look up only the staff this hospital's board references
+        staff_dict = resolve_staff(item['staff_id'] for item in items)
+        whiteboard = build_whiteboard(items, staff_dict, hospital_id)
+        logger.info("Loaded whiteboard", extra={'hospital_id': hospital_id, 'rooms': len(whiteboard), 'staff': len(staff_dict)})
+        return whiteboard, sequence
     except Exception as e:
-        logger.error(f"Error fetching data from DynamoDB: {e}")
-        return None
+        logger.error("Error fetching data from DynamoDB: %s", e, extra={'hospital_id': hospital_id})
+        return None, 0
+
+def load_whiteboard(hospital_id):
+    """fetch_whiteboard_data for one hospital through board_loads. Callers share the result; don't modify it."""
+    return board_loads.get(str(hospital_id), lambda: fetch_whiteboard_data(hospital_id=hospital_id))
 
-# Helper function to compute Cognito SECRET_HASH
-def compute_secret_hash(client_id, client_secret, username):
-    message = username + client_id
-    hmac_obj = hmac.new(client_secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha256)
-    return base64.b64encode(hmac_obj.digest()).decode('utf-8')
+def board_changed(hospital_id):
+    """Make this worker's next board load for the hospital read DynamoDB again."""
+    board_loads.invalidate(str(hospital_id))
+
+def publish_room_update(hospital_id, item, directory):
+    """Push the freshly written row to every board open on this hospital."""
+    try:
+        room = item['room']
+        # Rendering through the row cache also warms it for the next board load
+        html = render_board_rows([(room, board_row(item, directory), '')])[0]
+        get_broker().publish(hospital_id, {'room': room, 'html': html})
+    except Exception as e:
+        # A missed push only means a board has to reload; never fail the save over it
+        logger.error("Error publishing update: %s", e, extra={'hospital_id': hospital_id, 'room': item.get('room')})
+
+def assignment_record(room, hospital_id, provider, surgeon, staff_id, directory):
+    """RoomAssignments item recording who was put in `room` today."""
+    return {
+        'assignment_id': str(uuid.uuid4()),
+        'room': room,
+        'hospital_id': str(hospital_id),
+        'surgeon_id': surgeon,  # For now, using name; we'll update to IDs later
+        'anesthesiologist_id': provider,  # For now, using name
+        'app_id': staff_id,
+        'student_id': staff_id if staff_id in directory.ids_with_sub_role('SRNA') else '',
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'cases': [],  # Placeholder for cases
+        'provider_mode': 'Directed CRNA' if staff_id in directory.ids_with_role('CRNA') else 'Directed AA'
+    }
 
 def login_view(request):
     if request.method == 'POST':
         username = request.POST.get('username')
         password = request.POST.get('password')
 
-        # Initialize Cognito client
-        client = boto3.client(
-            'cognito-idp',
-            region_name=settings.AWS_REGION,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        )
+        # Shared, long-lived Cognito client
+        client = get_client('cognito-idp')
 
         try:
             # Compute SECRET_HASH for Cognito authentication
@@ -114,8 +239,8 @@ def login_view(request):
                 },
             )
 
-            # Log the full response for debugging
-            logger.info(f"Cognito initiate_auth response: {response}")
+            # Never log the response itself: it carries the user's tokens
+            logger.info("Cognito initiate_auth finished", extra={'challenge': response.get('ChallengeName', '')})
 
             # Check if authentication requires a new password (temporary password scenario)
             if 'ChallengeName' in response and response['ChallengeName'] == 'NEW_PASSWORD_REQUIRED':
@@ -126,18 +251,15 @@ def login_view(request):
             if 'AuthenticationResult' not in response:
                 raise KeyError('AuthenticationResult')
 
-            # Get user details from Cognito
-            user_response = client.get_user(
-                AccessToken=response['AuthenticationResult']['AccessToken']
-            )
-            user_attributes = {attr['Name']: attr['Value'] for attr in user_response['UserAttributes']}
+            # The ID token already carries the user's attributes; verify it locally instead of calling get_user
+            authentication_result = response['AuthenticationResult']
+            user_attributes = get_verifier().verify(authentication_result['IdToken'])
             email = user_attributes.get('email', username)
 
             # Sync user with CustomUser in the database
             user, created = CustomUser.objects.get_or_create(
                 email=email,
                 defaults={
-                    'username': username,
                     'role': user_attributes.get('custom:role', 'end_user'),
                 }
             )
@@ -151,6 +273,8 @@ def login_view(request):
 
             # Log the user in using Django's auth system
             login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+            # Lets cognito_session_middleware extend the session without asking for the password again
+            store_tokens(request.session, authentication_result, user_attributes)
 
             if user.role == 'admin':
                 return redirect('/admin/')
@@ -162,8 +286,12 @@ def login_view(request):
         except client.exceptions.UserNotConfirmedException:
             messages.error(request, "User is not confirmed. Please confirm your email.")
             return render(request, 'login.html', {'form': AuthenticationForm()})
+        except TokenError as e:
+            logger.error("Cognito returned an ID token that failed verification: %s", e)
+            messages.error(request, "Sign-in could not be verified. Please try again.")
+            return render(request, 'login.html', {'form': AuthenticationForm()})
         except Exception as e:
-            logger.error(f"Error during Cognito authentication: {e}")
+            logger.error("Error during Cognito authentication: %s", e)
             messages.error(request, f"Error: {str(e)}")
             return render(request, 'login.html', {'form': AuthenticationForm()})
 
@@ -175,7 +303,7 @@ def select_division(request):
     if user.role == 'admin':
         return redirect('/admin/')
 
-    assigned_divisions = user.assigned_divisions.all()
+    assigned_divisions = get_hierarchy(user).divisions
     if not assigned_divisions:
         messages.error(request, "You are not assigned to any divisions. Please contact an admin.")
         return redirect('home')
@@ -186,14 +314,12 @@ def select_division(request):
         return redirect('select_hospital')
 
     if request.method == 'POST':
-        selected_division_id = request.POST.get('division')
-        try:
-            selected_division = assigned_divisions.get(id=selected_division_id)
-            request.session['selected_division_id'] = selected_division.id
-            return redirect('select_hospital')
-        except Division.DoesNotExist:
+        selected_division = get_hierarchy(user).division(request.POST.get('division'))
+        if selected_division is None:
             messages.error(request, "Invalid division selection.")
             return redirect('select_division')
+        request.session['selected_division_id'] = selected_division.id
+        return redirect('select_hospital')
 
     return render(request, 'select_division.html', {'divisions': assigned_divisions})
 
@@ -207,13 +333,13 @@ def select_hospital(request):
     if not selected_division_id:
         return redirect('select_division')
 
-    try:
-        selected_division = Division.objects.get(id=selected_division_id)
-    except Division.DoesNotExist:
+    hierarchy = get_hierarchy(user)
+    selected_division = hierarchy.division(selected_division_id)
+    if selected_division is None:
         messages.error(request, "Invalid division selected.")
         return redirect('select_division')
 
-    hospitals = selected_division.hospitals.all()
+    hospitals = selected_division.hospitals
     if not hospitals:
         messages.error(request, "No hospitals available in this division.")
         return redirect('home')
@@ -224,14 +350,12 @@ def select_hospital(request):
         return redirect('home')
 
     if request.method == 'POST':
-        selected_hospital_id = request.POST.get('hospital')
-        try:
-            selected_hospital = hospitals.get(id=selected_hospital_id)
-            request.session['selected_hospital_id'] = selected_hospital.id
-            return redirect('home')
-        except Hospital.DoesNotExist:
+        selected_hospital = hierarchy.hospital(request.POST.get('hospital'), selected_division.id)
+        if selected_hospital is None:
             messages.error(request, "Invalid hospital selection.")
             return redirect('select_hospital')
+        request.session['selected_hospital_id'] = selected_hospital.id
+        return redirect('home')
 
     return render(request, 'select_hospital.html', {'hospitals': hospitals})
 
@@ -245,19 +369,163 @@ def home(request):
     if not selected_hospital_id:
         return redirect('select_hospital')
 
-    whiteboard = fetch_whiteboard_data(hospital_id=selected_hospital_id)
+    # The board and the staff list don't depend on each other, so read them together
+    (whiteboard, sequence), directory = run_concurrently(
+        lambda: load_whiteboard(selected_hospital_id),
+        fetch_staff_directory,
+    )
     if whiteboard is None:
         messages.error(request, "Failed to load whiteboard data from DynamoDB. Please check your AWS credentials and try again.")
+        sample_staff = {"1": {"name": "CRNA Johnson", "role": "CRNA"}, "2": {"name": "AA Davis", "role": "AA"}}
         whiteboard = {
-            "Room 1": {"provider": "Dr. Smith", "surgeon": "Dr. Jones", "staff_id": "1", "staff_name": "CRNA Johnson", "staff_role": "CRNA"},
-            "Room 2": {"provider": "Dr. Lee", "surgeon": "Dr. Patel", "staff_id": "2", "staff_name": "AA Davis", "staff_role": "AA"}
+            "Room 1": board_row(room_item(selected_hospital_id, "Room 1", "Dr. Smith", "Dr. Jones", "1"), sample_staff),
+            "Room 2": board_row(room_item(selected_hospital_id, "Room 2", "Dr. Lee", "Dr. Patel", "2"), sample_staff)
         }
-    staff_list = fetch_staff()
-    if not staff_list:
+    if not directory:
         messages.warning(request, "No staff members found in the database.")
-    logger.info(f"Whiteboard data: {whiteboard}")
-    logger.info(f"Staff list in home view: {staff_list}")
-    return render(request, 'index.html', {'whiteboard': whiteboard, 'staff_list': staff_list})
+    with phase('render'):
+        rows = render_board_rows([(room, details, '') for room, details in whiteboard.items()])
+        return render(request, 'index.html', {
+            'board_rows': rows,
+            'board_etag': board_etag(whiteboard),
+            'board_sequence': sequence,
+        })
+
+@login_required
+def division_board(request):
+    """Every hospital board in the selected division on one page."""
+    user = request.user
+    if user.role == 'admin':
+        return redirect('/admin/')
+
+    selected_division_id = request.session.get('selected_division_id')
+    division = get_hierarchy(user).division(selected_division_id)
+    if division is None:
+        return redirect('select_division')
+    if not division.hospitals:
+        messages.error(request, "No hospitals available in this division.")
+        return redirect('select_division')
+
+    try:
+        boards = fetch_division_boards([hospital.id for hospital in division.hospitals])
+    except Exception as e:
+        logger.error("Error fetching division boards: %s", e, extra={'division_id': division.id})
+        messages.error(request, f"Error loading the division overview: {str(e)}")
+        return redirect('home')
+
+    hospitals = [(hospital, boards[hospital.id]) for hospital in division.hospitals]
+    with phase('render'):
+        return render(request, 'division_board.html', {
+            'division': division,
+            'hospitals': hospitals,
+            'selected_hospital_id': request.session.get('selected_hospital_id'),
+        })
+
+def board_rows_response(request, hospital_id, readonly=False):
+    """Just the <tr> rows of a hospital's board, for HTMX refreshes.
+
+    Answers 304 when If-None-Match still matches the board. Otherwise rows
+    come back as out-of-band swaps: with `since=<sequence>` (from the
+    X-Board-Sequence header of the last refresh), the rooms written after it,
+    or every room when a delta isn't possible (see rooms.changed_since); with
+    the row versions the client already has (`have=<row_id>.<version>`), the
+    rows that differ.
+    """
+    whiteboard, sequence = load_whiteboard(hospital_id)
+    if whiteboard is None:
+        return HttpResponse(status=503)
+
+    etag = board_etag(whiteboard)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        patch_cache_control(not_modified, private=True, no_cache=True)
+        return not_modified
+
+    since = request.GET.get('since', '')
+    if since.isdigit():
+        changed = changed_since(list(whiteboard.values()), sequence, int(since), settings.DELTA_SYNC_MAX_GAP)
+        changed_ids = None if changed is None else {details['row_id'] for details in changed}
+        # Rooms the client doesn't have yet are appended by its htmx:oobErrorNoTarget handler
+        rows = [
+            (room, details, 'true')
+            for room, details in whiteboard.items()
+            if changed_ids is None or details['row_id'] in changed_ids
+        ]
+    elif 'have' in request.GET:
+        have = dict(entry.split('.', 1) for entry in request.GET['have'].split(',') if '.' in entry)
+        # Replace rows the client has in place, append rooms it has never seen
+        rows = [
+            (room, details, 'true' if details['row_id'] in have else 'beforeend:#board-rows')
+            for room, details in whiteboard.items()
+            if have.get(details['row_id']) != details['version']
+        ]
+    else:
+        rows = [(room, details, '') for room, details in whiteboard.items()]
+
+    with phase('render'):
+        response = render(request, '_board_rows.html', {'rows': render_board_rows(rows, readonly)})
+    response['ETag'] = etag
+    response['X-Board-Sequence'] = sequence
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+def board_rows(request):
+    """Row refreshes for the selected hospital's board (see board_rows_response)."""
+    selected_hospital_id = request.session.get('selected_hospital_id')
+    if not selected_hospital_id:
+        return HttpResponse(status=204)
+    return board_rows_response(request, selected_hospital_id)
+
+def kiosk_hospital(request, hospital_id):
+    """The hospital a kiosk request may show: its API token (from `?token=` or the kiosk cookie) must see it."""
+    token = token_for_key(request.GET.get('token') or request.COOKIES.get(KIOSK_COOKIE))
+    if token is None:
+        return None
+    return get_hierarchy(token.user).hospital(hospital_id)
+
+@require_GET
+def kiosk(request, hospital_id):
+    """Read-only board for wall displays, with no sign-in or hospital selection.
+
+    Open `/kiosk/<hospital_id>/?token=<API token>` once on the display. The
+    token moves into a cookie and the address bar drops it; after that the
+    page and its refreshes authenticate with the cookie.
+    """
+    hospital = kiosk_hospital(request, hospital_id)
+    if hospital is None:
+        return HttpResponseForbidden("This display isn't allowed to show that board. Open its kiosk link again.")
+    if 'token' in request.GET:
+        response = redirect('kiosk', hospital_id=hospital.id)
+        response.set_cookie(
+            KIOSK_COOKIE, request.GET['token'], max_age=settings.KIOSK_COOKIE_MAX_AGE,
+            # Sent with this board's page and row refreshes only
+            path=reverse('kiosk', args=[hospital.id]),
+            secure=request.is_secure(), httponly=True, samesite='Lax',
+        )
+        return response
+
+    whiteboard, sequence = load_whiteboard(hospital.id)
+    with phase('render'):
+        rows = render_board_rows([(room, details, '') for room, details in (whiteboard or {}).items()], readonly=True)
+        response = render(request, 'kiosk.html', {
+            'hospital': hospital,
+            'board_rows': rows,
+            'board_etag': board_etag(whiteboard or {}),
+            'board_sequence': sequence,
+            'load_failed': whiteboard is None,
+            'refresh_seconds': settings.KIOSK_REFRESH_SECONDS,
+        })
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@require_GET
+def kiosk_rows(request, hospital_id):
+    """Row refreshes for a kiosk board (see board_rows_response)."""
+    hospital = kiosk_hospital(request, hospital_id)
+    if hospital is None:
+        return HttpResponseForbidden()
+    return board_rows_response(request, hospital.id, readonly=True)
 
 @login_required
 def edit_entry(request, room):
@@ -265,58 +533,47 @@ def edit_entry(request, room):
     if not selected_hospital_id:
         return redirect('select_hospital')
 
-    staff_list = fetch_staff()
-
     if request.method == 'POST':
         provider = request.POST.get('provider')
         surgeon = request.POST.get('surgeon')
         staff_id = request.POST.get('staff')
+        item = room_item(selected_hospital_id, room, provider, surgeon, staff_id)
+
         try:
-            # Update the whiteboard entry
-            whiteboard_table.update_item(
-                Key={'Room': room},
-                UpdateExpression="SET Provider = :p, Surgeon = :s, Staff = :st, hospital_id = :h",
-                ExpressionAttributeValues={
-                    ':p': provider,
-                    ':s': surgeon,
-                    ':st': staff_id,
-                    ':h': str(selected_hospital_id)
-                }
-            )
-            # Log the assignment in RoomAssignments
-            assignment_id = str(uuid.uuid4())
-            assignment_date = datetime.now().strftime('%Y-%m-%d')
-            assignments_table.put_item(
-                Item={
-                    'assignment_id': assignment_id,
-                    'room': room,
-                    'hospital_id': str(selected_hospital_id),
-                    'surgeon_id': surgeon,  # For now, using name; we'll update to IDs later
-                    'anesthesiologist_id': provider,  # For now, using name
-                    'app_id': staff_id,
-                    'student_id': staff_id if any(staff['staff_id'] == staff_id and staff['sub_role'] == 'SRNA' for staff in staff_list) else '',
-                    'date': assignment_date,
-                    'cases': [],  # Placeholder for cases
-                    'provider_mode': 'Directed CRNA' if any(staff['staff_id'] == staff_id and staff['role'] == 'CRNA' for staff in staff_list) else 'Directed AA'
-                }
-            )
+            # Update the whiteboard entry while the staff list (only needed for the assignment record) loads
+            saved, directory = run_concurrently(lambda: save_room(item), fetch_staff_directory)
+            board_changed(selected_hospital_id)
+            # The RoomAssignments record is written in the background
+            record_assignment(assignment_record(room, selected_hospital_id, provider, surgeon, staff_id, directory))
+            publish_room_update(selected_hospital_id, saved, directory)
             messages.success(request, f"Updated {room} successfully!")
             return redirect('home')
+        except ConditionFailed:
+            # Whiteboard is keyed by room alone, and another hospital holds this one
+            messages.error(request, f"Room {room} not found in this hospital.")
+            return redirect('home')
         except Exception as e:
             messages.error(request, f"Error updating {room}: {str(e)}")
             return redirect('home')
 
-    # Fetch the entry to edit
+    # Fetch the entry to edit alongside the staff list for the dropdown
     try:
-        response = whiteboard_table.get_item(Key={'Room': room})
-        entry = response.get('Item')
-        if not entry or entry.get('hospital_id') != str(selected_hospital_id):
+        entry, directory = run_concurrently(
+            lambda: get_room(selected_hospital_id, room),
+            fetch_staff_directory,
+        )
+        if not entry:
             messages.error(request, f"Room {room} not found in this hospital.")
             return redirect('home')
     except Exception as e:
         messages.error(request, f"Error fetching {room}: {str(e)}")
         return redirect('home')
 
+    # Only this hospital's staff, plus whoever is in the room now if they're from elsewhere
+    staff_list = list(directory.at_location(selected_hospital_id))
+    current = directory.get(entry['staff_id'])
+    if current is not None and current not in staff_list:
+        staff_list.append(current)
     return render(request, 'edit.html', {'entry': entry, 'staff_list': staff_list})
 
 @login_required
@@ -325,55 +582,278 @@ def add_entry(request):
     if not selected_hospital_id:
         return redirect('select_hospital')
 
-    staff_list = fetch_staff()
-
     if request.method == 'POST':
         room = request.POST.get('room')
         provider = request.POST.get('provider')
         surgeon = request.POST.get('surgeon')
         staff_id = request.POST.get('staff')
+        item = room_item(selected_hospital_id, room, provider, surgeon, staff_id)
 
         try:
-            # Check if the room already exists
-            response = whiteboard_table.get_item(Key={'Room': room})
-            if response.get('Item'):
-                messages.error(request, f"Room {room} already exists!")
-                return redirect('home')
-
-            # Add the new entry with hospital_id and staff
-            whiteboard_table.put_item(
-                Item={
-                    'Room': room,
-                    'Provider': provider,
-                    'Surgeon': surgeon,
-                    'Staff': staff_id,
-                    'hospital_id': str(selected_hospital_id)
-                }
-            )
-            # Log the assignment in RoomAssignments
-            assignment_id = str(uuid.uuid4())
-            assignment_date = datetime.now().strftime('%Y-%m-%d')
-            assignments_table.put_item(
-                Item={
-                    'assignment_id': assignment_id,
-                    'room': room,
-                    'hospital_id': str(selected_hospital_id),
-                    'surgeon_id': surgeon,  # For now, using name; we'll update to IDs later
-                    'anesthesiologist_id': provider,  # For now, using name
-                    'app_id': staff_id,
-                    'student_id': staff_id if any(staff['staff_id'] == staff_id and staff['sub_role'] == 'SRNA' for staff in staff_list) else '',
-                    'date': assignment_date,
-                    'cases': [],  # Placeholder for cases
-                    'provider_mode': 'Directed CRNA' if any(staff['staff_id'] == staff_id and staff['role'] == 'CRNA' for staff in staff_list) else 'Directed AA'
-                }
-            )
+            # Add the new entry while the staff list (only needed for the assignment record) loads.
+            # The write is conditional, so two users adding the same room can't both succeed
+            saved, directory = run_concurrently(lambda: add_room(item), fetch_staff_directory)
+            board_changed(selected_hospital_id)
+            # The RoomAssignments record is written in the background
+            record_assignment(assignment_record(room, selected_hospital_id, provider, surgeon, staff_id, directory))
+            publish_room_update(selected_hospital_id, saved, directory)
             messages.success(request, f"Added {room} successfully!")
             return redirect('home')
+        except ConditionFailed:
+            messages.error(request, f"Room {room} already exists!")
+            return redirect('home')
         except Exception as e:
             messages.error(request, f"Error adding {room}: {str(e)}")
             return redirect('home')
 
-    return render(request, 'add.html', {'staff_list': staff_list})
+    return render(request, 'add.html', {'staff_list': fetch_staff_directory().at_location(selected_hospital_id)})
+
+def parse_bulk_rows(request):
+    """Rows submitted to bulk_setup, from an uploaded CSV or the form grid.
+
+    CSV files need room, provider, surgeon and staff (or staff_id) columns.
+    """
+    upload = request.FILES.get('csv_file')
+    if upload:
+        reader = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig'))
+        rows = [
+            {
+                'room': (line.get('room') or '').strip(),
+                'provider': (line.get('provider') or '').strip(),
+                'surgeon': (line.get('surgeon') or '').strip(),
+                'staff': (line.get('staff') or line.get('staff_id') or '').strip(),
+            }
+            for line in reader
+        ]
+    else:
+        rows = [
+            {field: request.POST.get(f'{field}_{i}', '').strip() for field in ('room', 'provider', 'surgeon', 'staff')}
+            for i in range(BULK_SETUP_GRID_ROWS)
+        ]
+    # Blank grid lines are just unused rows
+    return [row for row in rows if any(row.values())]
+
+def validate_bulk_rows(rows, directory):
+    """Error messages for a bulk submission, checked against one staff snapshot."""
+    if len(rows) > BULK_SETUP_MAX_ROWS:
+        return [f"Set up at most {BULK_SETUP_MAX_ROWS} rooms at a time ({len(rows)} were submitted)."]
+    errors = []
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        missing = [field for field in ('room', 'provider', 'surgeon', 'staff') if not row[field]]
+        if missing:
+            errors.append(f"Row {number}: missing {', '.join(missing)}.")
+            continue
+        if row['room'] in seen:
+            errors.append(f"Row {number}: {row['room']} is listed more than once.")
+        seen.add(row['room'])
+        if row['staff'] not in directory:
+            errors.append(f"Row {number}: unknown staff id {row['staff']}.")
+    return errors
+
+@login_required
+def bulk_setup(request):
+    """Start-of-day setup: write a whole board with a handful of batch calls."""
+    selected_hospital_id = request.session.get('selected_hospital_id')
+    if not selected_hospital_id:
+        return redirect('select_hospital')
+
+    directory = fetch_staff_directory()
+    context = {'staff_list': directory.at_location(selected_hospital_id), 'grid_rows': range(BULK_SETUP_GRID_ROWS)}
+
+    if request.method == 'POST':
+        try:
+            rows = parse_bulk_rows(request)
+        except (UnicodeDecodeError, csv.Error) as e:
+            messages.error(request, f"Could not read the CSV file: {e}")
+            return render(request, 'bulk_setup.html', context)
+        errors = validate_bulk_rows(rows, directory)
+        if not rows:
+            errors.append("Enter at least one room.")
+        if errors:
+            for error in errors:
+                messages.error(request, error)
+            return render(request, 'bulk_setup.html', context)
+
+        items = [
+            room_item(selected_hospital_id, row['room'], row['provider'], row['surgeon'], row['staff'])
+            for row in rows
+        ]
+        error = None
+        try:
+            items, unprocessed = put_rooms(selected_hospital_id, items)
+            if unprocessed:
+                error = f"DynamoDB did not accept {len(unprocessed)} of {len(items)} rooms. Check the board and submit again."
+        except (RoomsTaken, SequenceConflict) as e:
+            # Chunks before the one that failed are on the board already
+            items, unprocessed, error = e.written, [], str(e)
+        except Exception as e:
+            messages.error(request, f"Error setting up the board: {str(e)}")
+            return render(request, 'bulk_setup.html', context)
+
+        unprocessed_rooms = {item['room'] for item in unprocessed}
+        written = [item for item in items if item['room'] not in unprocessed_rooms]
+        if written:
+            board_changed(selected_hospital_id)
+        for item in written:
+            record_assignment(assignment_record(
+                item['room'], selected_hospital_id, item['provider'], item['surgeon'], item['staff_id'], directory
+            ))
+            publish_room_update(selected_hospital_id, item, directory)
+        if error:
+            messages.error(request, error)
+            return render(request, 'bulk_setup.html', context)
+        messages.success(request, f"Set up {len(items)} rooms successfully!")
+        return redirect('home')
+
+    return render(request, 'bulk_setup.html', context)
+
+def parse_history_dates(params):
+    """(start, end) YYYY-MM-DD strings from a history request, defaulting to the last 30 days."""
+    today = datetime.now().date()
+    start = params.get('start') or (today - timedelta(days=30)).isoformat()
+    end = params.get('end') or today.isoformat()
+    start_date = datetime.strptime(start, '%Y-%m-%d').date()
+    end_date = datetime.strptime(end, '%Y-%m-%d').date()
+    if start_date > end_date:
+        raise ValueError("The start date must be on or before the end date.")
+    return start_date.isoformat(), end_date.isoformat()
+
+def history_hospitals(request, scope):
+    """Hospitals an export covers: the selected one, or every hospital in the selected division."""
+    hierarchy = get_hierarchy(request.user)
+    if scope == 'division':
+        return list(hierarchy.hospitals(request.session.get('selected_division_id')))
+    hospital = hierarchy.hospital(request.session.get('selected_hospital_id'))
+    return [hospital] if hospital else []
+
+class Echo:
+    """Pseudo-buffer that hands back what csv.writer writes instead of storing it."""
+
+    def write(self, value):
+        return value
+
+async def stream_history(pages, export_format):
+    """Encode assignment history page by page as CSV or JSONL lines.
+
+    DynamoDB pages are fetched on a worker thread one at a time, so only the
+    current page is ever held in memory however long the range is.
+    """
+    next_page = sync_to_async(lambda: next(pages, None), thread_sensitive=False)
+    writer = csv.writer(Echo())
+    if export_format == 'csv':
+        yield writer.writerow(HISTORY_EXPORT_FIELDS)
+    while (page := await next_page()) is not None:
+        if export_format == 'csv':
+            yield ''.join(writer.writerow([item.get(field, '') for field in HISTORY_EXPORT_FIELDS]) for item in page)
+        else:
+            yield ''.join(json.dumps(item, default=str) + '\n' for item in page)
+
+@login_required
+def assignment_history(request):
+    """Form for picking a date range and format to export assignment history."""
+    if not request.user.can_view_reports:
+        messages.error(request, "Only managers can view assignment history.")
+        return redirect('home')
+    if not request.session.get('selected_hospital_id'):
+        return redirect('select_hospital')
+
+    start, end = parse_history_dates({})
+    return render(request, 'history.html', {'start': start, 'end': end})
+
+@login_required
+def export_assignment_history(request):
+    """Stream RoomAssignments for a date range as CSV or JSONL."""
+    if not request.user.can_view_reports:
+        messages.error(request, "Only managers can export assignment history.")
+        return redirect('home')
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        messages.error(request, "Choose CSV or JSONL for the export.")
+        return redirect('assignment_history')
+    try:
+        start, end = parse_history_dates(request.GET)
+    except ValueError as e:
+        messages.error(request, f"Invalid date range: {str(e)}")
+        return redirect('assignment_history')
+
+    hospitals = history_hospitals(request, request.GET.get('scope', 'hospital'))
+    if not hospitals:
+        messages.error(request, "No hospital selected for the export.")
+        return redirect('assignment_history')
+
+    # Hospitals are read one after another, each through its own paginated index query
+    pages = chain.from_iterable(assignment_history_pages(hospital.id, start, end) for hospital in hospitals)
+    response = StreamingHttpResponse(
+        stream_history(pages, export_format),
+        content_type='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+    )
+    response['Content-Disposition'] = f'attachment; filename="assignments-{start}-to-{end}.{export_format}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def utilization(request):
+    """Daily rooms, provider modes and SRNA assignments per hospital, read from the rollups only."""
+    if not request.user.can_view_reports:
+        messages.error(request, "Only managers can view utilization.")
+        return redirect('home')
+
+    scope = request.GET.get('scope', 'division')
+    try:
+        start, end = parse_history_dates(request.GET)
+    except ValueError as e:
+        messages.error(request, f"Invalid date range: {str(e)}")
+        start, end = parse_history_dates({})
+
+    hospitals = history_hospitals(request, scope)
+    if not hospitals:
+        return redirect('select_hospital')
+    names = {str(hospital.id): hospital.name for hospital in hospitals}
+
+    try:
+        rows = read_rollups(list(names), start, end)
+    except Exception as e:
+        logger.error("Error reading utilization rollups: %s", e)
+        messages.error(request, f"Error loading utilization: {str(e)}")
+        rows = []
+
+    totals = {hospital_id: dict.fromkeys(['rooms'] + ROLLUP_COUNTERS, 0) for hospital_id in names}
+    for row in rows:
+        row['hospital'] = names.get(row['hospital_id'], row['hospital_id'])
+        for counter in totals[row['hospital_id']]:
+            totals[row['hospital_id']][counter] += row[counter]
+    context = {
+        'rows': rows,
+        'totals': [dict(total, hospital=names[hospital_id]) for hospital_id, total in totals.items()],
+        'start': start,
+        'end': end,
+        'scope': scope,
+    }
+    return render(request, 'utilization.html', context)
+
+@login_required
+async def board_events(request):
+    """Server-sent events stream of row updates for the selected hospital's board."""
+    selected_hospital_id = await request.session.aget('selected_hospital_id')
+    if not selected_hospital_id:
+        return HttpResponse(status=204)
+
+    async def stream():
+        # Tell EventSource how long to wait before reconnecting
+        yield "retry: 5000\n\n"
+        async for message in get_broker().subscribe(selected_hospital_id):
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: room\ndata: {json.dumps(message)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 def logout_view(request):
     logout(request)
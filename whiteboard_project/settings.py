@@ -27,6 +27,26 @@ AWS_COGNITO_USER_POOL_ID = env('AWS_COGNITO_USER_POOL_ID')
 AWS_COGNITO_APP_CLIENT_ID = env('AWS_COGNITO_APP_CLIENT_ID')
 AWS_COGNITO_APP_CLIENT_SECRET = env('AWS_COGNITO_APP_CLIENT_SECRET')
 AWS_COGNITO_DOMAIN = env('AWS_COGNITO_DOMAIN')
+# ID tokens are verified locally against the pool's signing keys (see whiteboard/cognito.py)
+AWS_COGNITO_ISSUER = env('AWS_COGNITO_ISSUER', default=f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{AWS_COGNITO_USER_POOL_ID}")
+AWS_COGNITO_JWKS_URL = env('AWS_COGNITO_JWKS_URL', default=f"{AWS_COGNITO_ISSUER}/.well-known/jwks.json")
+COGNITO_JWKS_TTL = env.int('COGNITO_JWKS_TTL', default=3600)
+COGNITO_JWKS_MIN_REFRESH_INTERVAL = env.int('COGNITO_JWKS_MIN_REFRESH_INTERVAL', default=60)
+COGNITO_TOKEN_LEEWAY = env.int('COGNITO_TOKEN_LEEWAY', default=30)
+# Refresh a session's tokens this many seconds before its ID token expires
+COGNITO_REFRESH_MARGIN = env.int('COGNITO_REFRESH_MARGIN', default=300)
+
+# Connection settings for the shared boto3 clients (see whiteboard/aws.py)
+AWS_MAX_POOL_CONNECTIONS = env.int('AWS_MAX_POOL_CONNECTIONS', default=50)
+AWS_TCP_KEEPALIVE = env.bool('AWS_TCP_KEEPALIVE', default=True)
+AWS_CONNECT_TIMEOUT = env.float('AWS_CONNECT_TIMEOUT', default=2.0)
+AWS_READ_TIMEOUT = env.float('AWS_READ_TIMEOUT', default=5.0)
+AWS_RETRY_MODE = env('AWS_RETRY_MODE', default='adaptive')
+AWS_MAX_ATTEMPTS = env.int('AWS_MAX_ATTEMPTS', default=3)
+# Per-service endpoint overrides, e.g. a local DynamoDB
+AWS_ENDPOINT_URLS = {
+    'dynamodb': env('AWS_DYNAMODB_ENDPOINT_URL', default=''),
+}
 
 # Application definition
 INSTALLED_APPS = [
@@ -40,11 +60,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'whiteboard.instrumentation.server_timing_middleware',
+    # Before anything that reads or writes response bodies, so pages leave compressed;
+    # async streams (live events, exports) are passed through (see whiteboard/compression.py)
+    'whiteboard.compression.SyncGZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'whiteboard.cognito.cognito_session_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,8 +80,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compile each template once per process, DEBUG or not; restart to pick up template edits
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -127,6 +158,13 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'staticfiles']
+# `collectstatic` writes fingerprinted, pre-compressed files here for the proxy to serve
+# (see .ebextensions/static.config and .platform/nginx)
+STATIC_ROOT = BASE_DIR / 'static'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whiteboard.storage.CompressedManifestStaticFilesStorage'},
+}
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -134,23 +172,120 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # DynamoDB table names
 DYNAMODB_TABLE_PREFIX = env('DYNAMODB_TABLE_PREFIX', default='Dev')
 WHITEBOARD_TABLE = f"Whiteboard-{DYNAMODB_TABLE_PREFIX}"
+# Whiteboard re-keyed by (hospital_id, room) with normalized attribute names (see whiteboard/rooms.py)
+ROOMS_TABLE = f"Rooms-{DYNAMODB_TABLE_PREFIX}"
 STAFF_TABLE = f"Staff-{DYNAMODB_TABLE_PREFIX}"
 ROOM_ASSIGNMENTS_TABLE = f"RoomAssignments-{DYNAMODB_TABLE_PREFIX}"
+# Per-hospital, per-day utilization rollups of RoomAssignments (see whiteboard/rollups.py)
+ASSIGNMENT_ROLLUPS_TABLE = f"AssignmentRollups-{DYNAMODB_TABLE_PREFIX}"
+# Each hospital's board change sequence, advanced in the same transaction as every room write
+BOARD_SEQUENCES_TABLE = f"BoardSequences-{DYNAMODB_TABLE_PREFIX}"
+
+# Global secondary index on Whiteboard keyed by hospital_id (see `manage.py create_whiteboard_index`)
+WHITEBOARD_HOSPITAL_INDEX = env('WHITEBOARD_HOSPITAL_INDEX', default='hospital_id-index')
+# Where board rooms are read and written: 'legacy' (Whiteboard), 'dual' (both, during
+# `manage.py migrate_whiteboard`) or 'rooms' (Rooms, once the copy is done)
+WHITEBOARD_STORAGE = env('WHITEBOARD_STORAGE', default='legacy')
+if WHITEBOARD_STORAGE not in ('legacy', 'dual', 'rooms'):
+    raise ImproperlyConfigured(f"WHITEBOARD_STORAGE must be legacy, dual or rooms, not {WHITEBOARD_STORAGE!r}")
+# Global secondary index on RoomAssignments keyed by (hospital_id, date) (see `manage.py create_assignment_history_index`)
+ROOM_ASSIGNMENTS_HISTORY_INDEX = env('ROOM_ASSIGNMENTS_HISTORY_INDEX', default='hospital_id-date-index')
+
+# Threads for running one request's independent DynamoDB reads concurrently
+DYNAMODB_REQUEST_WORKERS = env.int('DYNAMODB_REQUEST_WORKERS', default=16)
+
+# BatchGetItem/BatchWriteItem tuning
+DYNAMODB_BATCH_WORKERS = env.int('DYNAMODB_BATCH_WORKERS', default=4)
+DYNAMODB_BATCH_MAX_RETRIES = env.int('DYNAMODB_BATCH_MAX_RETRIES', default=5)
+
+# Write-behind queue for RoomAssignments records (see whiteboard/audit.py)
+ASSIGNMENT_QUEUE_SIZE = env.int('ASSIGNMENT_QUEUE_SIZE', default=1000)
+ASSIGNMENT_FLUSH_INTERVAL = env.float('ASSIGNMENT_FLUSH_INTERVAL', default=1.0)
+ASSIGNMENT_SPILL_PATH = env('ASSIGNMENT_SPILL_PATH', default=str(BASE_DIR / 'var' / 'assignment-spill.jsonl'))
+
+# Caches. Both default to per-process memory; set CACHE_URL / STAFF_CACHE_URL to a
+# memcached or redis URL so every gunicorn worker shares one copy.
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+    'staff': env.cache_url('STAFF_CACHE_URL', default='locmemcache://staff-directory'),
+}
 
-# Logging configuration
+# Staff directory cache (see whiteboard/staff.py). Nothing in the app writes Staff, so
+# `manage.py invalidate_staff_cache` is the only way to drop it early, and that needs a
+# shared STAFF_CACHE_URL; per process, edits show up after STAFF_CACHE_TTL seconds
+STAFF_CACHE_ALIAS = 'staff'
+STAFF_CACHE_TTL = env.int('STAFF_CACHE_TTL', default=300)
+STAFF_CACHE_MAX_ENTRIES = env.int('STAFF_CACHE_MAX_ENTRIES', default=16)
+if CACHES['staff']['BACKEND'].endswith('LocMemCache'):
+    # Shared backends bound themselves; the in-process one keeps a few versions at most
+    CACHES['staff'].setdefault('OPTIONS', {})['MAX_ENTRIES'] = STAFF_CACHE_MAX_ENTRIES
+# Each user's division/hospital tree lives in the default cache; model signals invalidate it.
+# The signals only reach other workers through a shared CACHE_URL, so with the per-process
+# default a tree is kept for at most HIERARCHY_LOCAL_CACHE_MAX_TTL seconds (see whiteboard/checks.py)
+HIERARCHY_LOCAL_CACHE_MAX_TTL = 60
+HIERARCHY_CACHE_TTL = env.int(
+    'HIERARCHY_CACHE_TTL',
+    default=HIERARCHY_LOCAL_CACHE_MAX_TTL if CACHES['default']['BACKEND'].endswith('LocMemCache') else 3600,
+)
+# Board loads are coalesced per hospital and reused for this many seconds in each
+# worker (see whiteboard/singleflight.py); saves clear it in the worker that made them
+BOARD_CACHE_TTL = env.float('BOARD_CACHE_TTL', default=2.0)
+# Clients further behind than this many changes get the whole board instead of a delta
+DELTA_SYNC_MAX_GAP = env.int('DELTA_SYNC_MAX_GAP', default=200)
+# The Whiteboard hospital_id index is eventually consistent, so legacy-mode deltas
+# repeat this many of the latest changes in case the index hadn't caught up
+DELTA_SYNC_INDEX_OVERLAP = env.int('DELTA_SYNC_INDEX_OVERLAP', default=20)
+# Read-only wall displays at /kiosk/<hospital_id>/, signed in with an API token
+KIOSK_REFRESH_SECONDS = env.int('KIOSK_REFRESH_SECONDS', default=15)
+KIOSK_COOKIE_MAX_AGE = env.int('KIOSK_COOKIE_MAX_AGE', default=365 * 24 * 60 * 60)
+# Rendered board rows, keyed by each room's version (see render_board_rows in whiteboard/views.py)
+BOARD_ROW_CACHE_TTL = env.int('BOARD_ROW_CACHE_TTL', default=86400)
+DEFAULT_CACHE_MAX_ENTRIES = env.int('DEFAULT_CACHE_MAX_ENTRIES', default=5000)
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    # Room for every row of a few dozen boards next to the hierarchy trees
+    CACHES['default'].setdefault('OPTIONS', {})['MAX_ENTRIES'] = DEFAULT_CACHE_MAX_ENTRIES
+
+# Live board updates (see whiteboard/events.py). InProcessBroker only reaches boards
+# connected to the same worker; use whiteboard.events.CacheBroker with a shared
+# CACHE_URL when running several workers.
+WHITEBOARD_EVENTS_BACKEND = env('WHITEBOARD_EVENTS_BACKEND', default='whiteboard.events.InProcessBroker')
+WHITEBOARD_EVENTS_OPTIONS = {}
+
+# Logging configuration. Records are written as JSON lines; INFO and below from the
+# busy loggers are sampled (LOG_SAMPLE_RATE) while warnings and errors always go out.
+LOG_LEVEL = env('LOG_LEVEL', default='INFO')
+LOG_SAMPLE_RATE = env.float('LOG_SAMPLE_RATE', default=0.1)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            '()': 'whiteboard.instrumentation.StructuredFormatter',
+        },
+    },
+    'filters': {
+        'sample': {
+            '()': 'whiteboard.instrumentation.SamplingFilter',
+            'rates': {
+                'whiteboard.requests': LOG_SAMPLE_RATE,
+                'whiteboard.views': LOG_SAMPLE_RATE,
+                'whiteboard.api': LOG_SAMPLE_RATE,
+                'botocore': 0.0,
+            },
+        },
+    },
     'handlers': {
         'console': {
-            'level': 'INFO',
+            'level': LOG_LEVEL,
             'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+            'filters': ['sample'],
         },
     },
     'loggers': {
         '': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': LOG_LEVEL,
             'propagate': True,
         },
     },
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'whiteboard_project.settings')
 
 application = get_wsgi_application()
+
+# Replay spilled RoomAssignments records and start the background writer
+from whiteboard.audit import get_assignment_writer  # noqa: E402
+
+get_assignment_writer().start()